@@ -1,14 +1,53 @@
 # coding=utf-8
 """A collection of alerters for SimpleMonitor."""
 
+import bisect
 import datetime
 import logging
 
+try:
+    import zoneinfo
+except ImportError:
+    zoneinfo = None
+
 from socket import gethostname
 
 from util import get_config_option, AlerterConfigurationError
 from util import subclass_dict_handler
 
+from . import transport
+from . import template
+
+
+def _parse_time(value):
+    """Turn an hh:mm string into a datetime.time."""
+    (hours, minutes) = value.strip().split(":")
+    return datetime.time(int(hours), int(minutes))
+
+
+class TimeWindows(object):
+    """A set of daily time windows, merged and sorted for fast lookup.
+
+    Each window is a (lower, upper) pair of datetime.time objects; a time is
+    inside a window if it is strictly between the two."""
+
+    def __init__(self, windows):
+        merged = []
+        for (lower, upper) in sorted(windows):
+            if merged and lower < merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], upper))
+            else:
+                merged.append((lower, upper))
+        self.lowers = [window[0] for window in merged]
+        self.uppers = [window[1] for window in merged]
+
+    def __contains__(self, the_time):
+        index = bisect.bisect_left(self.lowers, the_time) - 1
+        return index >= 0 and the_time < self.uppers[index]
+
+    def __len__(self):
+        return len(self.lowers)
+
 
 class Alerter:
     """Abstract class basis for alerters."""
@@ -23,6 +62,16 @@ class Alerter:
     days = list(range(0, 7))
     times_type = "always"
     time_info = [None, None]
+    time_windows = None
+    timezone = None
+    holidays = frozenset()
+
+    # our out-of-hours state for the current round of alerts, or None outside
+    # of a round (see start_batch())
+    out_of_hours = None
+
+    # sends started with run_send() during the current round of alerts
+    pending_sends = None
 
     debug = False
     verbose = False
@@ -31,11 +80,15 @@ class Alerter:
     groups = ['default']
 
     delay_notification = False
-    ooh_failures = []
     # subclasses should set this to true if they support catchup notifications for delays
     support_catchup = False
     ooh_recovery = False
 
+    # subclasses should set this to true if they want start_batch()/end_batch()
+    # around each round of alerts
+    supports_batch = False
+    doing_batch = False
+
     type = 'unknown'
 
     def __init__(self, config_options=None):
@@ -77,32 +130,60 @@ class Alerter:
             default='always'
         )
         if self.times_type in ['only', 'not']:
-            time_lower = Alerter.get_config_option(
+            windows = Alerter.get_config_option(
                 config_options,
-                'time_lower',
-                required_type='str',
-                required=True
-            )
-            time_upper = Alerter.get_config_option(
-                config_options,
-                'time_upper',
-                required_type='str',
-                required=True
+                'time_windows',
+                required_type='[str]'
             )
+            if windows is None:
+                time_lower = Alerter.get_config_option(
+                    config_options,
+                    'time_lower',
+                    required_type='str',
+                    required=True
+                )
+                time_upper = Alerter.get_config_option(
+                    config_options,
+                    'time_upper',
+                    required_type='str',
+                    required=True
+                )
+                windows = ["%s-%s" % (time_lower, time_upper)]
             try:
-                time_info = [
-                    datetime.time(
-                        int(time_lower.split(":")[0]),
-                        int(time_lower.split(":")[1])
-                    ),
-                    datetime.time(
-                        int(time_upper.split(":")[0]),
-                        int(time_upper.split(":")[1])
-                    )
-                ]
-                self.time_info = time_info
+                time_windows = []
+                for window in windows:
+                    (lower, upper) = window.split("-")
+                    time_windows.append((_parse_time(lower), _parse_time(upper)))
             except Exception:
                 raise RuntimeError("error processing time limit definition")
+            self.time_info = list(time_windows[0])
+            self.time_windows = TimeWindows(time_windows)
+        timezone = Alerter.get_config_option(
+            config_options,
+            'timezone',
+            allow_empty=False
+        )
+        if timezone is not None:
+            if zoneinfo is None:
+                raise AlerterConfigurationError("timezone support requires Python 3.9 or later")
+            try:
+                self.timezone = zoneinfo.ZoneInfo(timezone)
+            except Exception:
+                raise AlerterConfigurationError("unknown timezone {0}".format(timezone))
+        holidays = Alerter.get_config_option(
+            config_options,
+            'holidays',
+            required_type='[str]',
+            default=[]
+        )
+        try:
+            self.holidays = frozenset(
+                datetime.datetime.strptime(holiday, "%Y-%m-%d").date()
+                for holiday in holidays
+                if holiday != ''
+            )
+        except ValueError:
+            raise AlerterConfigurationError("holidays must be a list of YYYY-MM-DD dates")
         self.days = Alerter.get_config_option(
             config_options,
             'days',
@@ -139,13 +220,46 @@ class Alerter:
                 (datetime.datetime.utcnow() - datetime.timedelta(minutes=1)).time(),
                 (datetime.datetime.utcnow() + datetime.timedelta(minutes=1)).time()
             ]
+            self.time_windows = TimeWindows([tuple(self.time_info)])
             self.alerter_logger.debug("set times for alerter to %s", self.time_info)
 
+        self.ooh_failures = set()
+
     @staticmethod
     def get_config_option(config_options, key, **kwargs):
         kwargs['exception'] = AlerterConfigurationError
         return get_config_option(config_options, key, **kwargs)
 
+    @staticmethod
+    def get_template_option(config_options, key, default=None):
+        """Get a message template option, compiled ready for use."""
+        text = Alerter.get_config_option(
+            config_options,
+            key,
+            default=default,
+            allow_empty=False
+        )
+        if text is None:
+            return None
+        return template.Template(text)
+
+    @staticmethod
+    def get_message_templates(config_options):
+        """Get the (subject, body) templates for each type of alert.
+
+        These are set with the <type>_subject and <type>_body options."""
+        templates = {}
+        for (type_, default_subject, default_body) in [
+            ('failure', template.DEFAULT_FAILURE_SUBJECT, template.DEFAULT_FAILURE_BODY),
+            ('success', template.DEFAULT_SUCCESS_SUBJECT, template.DEFAULT_SUCCESS_BODY),
+            ('catchup', template.DEFAULT_CATCHUP_SUBJECT, template.DEFAULT_CATCHUP_BODY),
+        ]:
+            templates[type_] = (
+                Alerter.get_template_option(config_options, type_ + '_subject', default_subject),
+                Alerter.get_template_option(config_options, type_ + '_body', default_body)
+            )
+        return templates
+
     def set_dependencies(self, dependency_list):
         """Record which monitors we depend on.
         If a monitor we depend on fails, it means we can't reach the database, so we shouldn't bother trying to write to it."""
@@ -167,16 +281,12 @@ class Alerter:
 
     def should_alert(self, monitor):
         """Check if we should bother alerting, and what type."""
-        out_of_hours = False
-
         if not self.available:
             return ""
 
-        if not self.allowed_today():
-            out_of_hours = True
-
-        if not self.allowed_time():
-            out_of_hours = True
+        out_of_hours = self.out_of_hours
+        if out_of_hours is None:
+            out_of_hours = self.is_out_of_hours()
 
         if monitor.virtual_fail_count() > 0:
             self.alerter_logger.debug("monitor %s has failed", monitor.name)
@@ -184,10 +294,7 @@ class Alerter:
             if self.delay_notification:
                 if not out_of_hours:
                     if monitor.name in self.ooh_failures:
-                        try:
-                            self.ooh_failures.remove(monitor.name)
-                        except Exception:
-                            self.alerter_logger.warning("couldn't remove %s from OOH list; will maybe generate too many alerts.", monitor.name)
+                        self.ooh_failures.discard(monitor.name)
                         if self.support_catchup:
                             return "catchup"
                         return "failure"
@@ -195,15 +302,12 @@ class Alerter:
                 # This is the first time or nth time we've failed
                 if out_of_hours:
                     if monitor.name not in self.ooh_failures:
-                        self.ooh_failures.append(monitor.name)
+                        self.ooh_failures.add(monitor.name)
                         return ""
                 return "failure"
             return ""
         elif monitor.all_better_now() and monitor.last_virtual_fail_count() >= self.limit:
-            try:
-                self.ooh_failures.remove(monitor.name)
-            except Exception:
-                pass
+            self.ooh_failures.discard(monitor.name)
             if out_of_hours:
                 if self.ooh_recovery:
                     return "success"
@@ -217,31 +321,99 @@ class Alerter:
         """Abstract function to do the alerting."""
         raise NotImplementedError
 
-    def allowed_today(self):
+    def start_batch(self):
+        """We're about to start a round of alerts.
+
+        Our out-of-hours state is worked out once here and used for every
+        monitor in the round."""
+        self.out_of_hours = self.is_out_of_hours()
+        self.pending_sends = []
+        if not self.supports_batch:
+            return
+        self.batch_data = []
+        self.doing_batch = True
+
+    def end_batch(self):
+        """We've finished a round of alerts."""
+        self.out_of_hours = None
+        if self.pending_sends:
+            transport.wait(self.pending_sends)
+        self.pending_sends = None
+        if not self.supports_batch:
+            return
+        self.doing_batch = False
+        try:
+            self.process_batch()
+        finally:
+            self.batch_data = []
+
+    def process_batch(self):
+        """This is blank for the base class."""
+        return
+
+    def run_send(self, function, *args):
+        """Call a function which sends an alert.
+
+        During a round of alerts the function runs in the shared worker pool,
+        so all the alerts in the round go out concurrently; end_batch() waits
+        for them. Otherwise it is called directly."""
+        if self.pending_sends is None:
+            function(*args)
+        else:
+            self.pending_sends.append(transport.submit(function, *args))
+
+    def _now(self):
+        """Get the current time, in our timezone if we have one."""
+        if self.timezone is not None:
+            return datetime.datetime.now(self.timezone)
+        return datetime.datetime.now()
+
+    def is_out_of_hours(self, now=None):
+        """Check if now is outside the days/times we are allowed to alert."""
+        if now is None:
+            now = self._now()
+        return not (self.allowed_today(now) and self.allowed_time(now))
+
+    def allowed_today(self, now=None):
         """Check if today is an allowed day for an alert."""
-        if datetime.datetime.now().weekday() not in self.days:
+        if now is None:
+            now = self._now()
+        if now.weekday() not in self.days:
+            return False
+        if now.date() in self.holidays:
             return False
         return True
 
-    def allowed_time(self):
+    def allowed_time(self, now=None):
         """Check if now is an allowed time for an alert."""
         if self.times_type == "always":
             return True
-        now = datetime.datetime.now().time()
+        if now is None:
+            now = self._now()
+        now = now.time()
         if self.times_type == "only":
-            if (now > self.time_info[0]) and (now < self.time_info[1]):
-                return True
-            else:
-                return False
+            return now in self.time_windows
         elif self.times_type == "not":
-            if (now > self.time_info[0]) and (now < self.time_info[1]):
-                return False
-            else:
-                return True
+            return now not in self.time_windows
         else:
             self.alerter_logger.error("this should never happen! Unknown times_type in alerter")
             return True
 
 
+# the modules defining each type, imported when the type is first used
+MODULES = {
+    'bulksms': 'Alerters.bulksms',
+    'execute': 'Alerters.execute',
+    '46elks': 'Alerters.fortysixelks',
+    'email': 'Alerters.mail',
+    'nc': 'Alerters.nc',
+    'pushbullet': 'Alerters.pushbullet',
+    'pushover': 'Alerters.pushover',
+    'ses': 'Alerters.ses',
+    'slack': 'Alerters.slack',
+    'syslog': 'Alerters.syslogger',
+    'telegram': 'Alerters.telegram',
+}
+
 (register, get_class, all_types) = subclass_dict_handler(
-    'simplemonitor.Alerters.alerter', Alerter)
+    'simplemonitor.Alerters.alerter', Alerter, MODULES, 'simplemonitor.alerters')
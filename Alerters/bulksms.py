@@ -1,9 +1,8 @@
 # coding=utf-8
 
-import requests
-
 from util import format_datetime
 from .alerter import Alerter, register
+from . import transport
 
 
 @register
@@ -111,15 +110,18 @@ class BulkSMSAlerter(Alerter):
             return
 
         if not self.dry_run:
-            try:
-                r = requests.get(url, params=params)
-                s = r.text
-                if not s.startswith("0"):
-                    self.alerter_logger.error("Unable to send SMS: %s (%s)", s.split("|")[0], s.split("|")[1])
-                    self.available = False
-            except Exception:
-                self.alerter_logger.exception("SMS sending failed")
-                self.available = False
+            self.run_send(self._send_sms, url, params)
         else:
             self.alerter_logger.info("dry_run: would send SMS: %s", url)
         return
+
+    def _send_sms(self, url, params):
+        try:
+            r = transport.get(url, params=params)
+            s = r.text
+            if not s.startswith("0"):
+                self.alerter_logger.error("Unable to send SMS: %s (%s)", s.split("|")[0], s.split("|")[1])
+                self.available = False
+        except Exception:
+            self.alerter_logger.exception("SMS sending failed")
+            self.available = False
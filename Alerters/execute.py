@@ -2,8 +2,9 @@
 import subprocess
 import shlex
 
-from util import AlerterConfigurationError, format_datetime
+from util import AlerterConfigurationError
 from .alerter import Alerter, register
+from . import template
 
 
 @register
@@ -15,32 +16,24 @@ class ExecuteAlerter(Alerter):
     def __init__(self, config_options):
         Alerter.__init__(self, config_options)
 
-        self.fail_command = Alerter.get_config_option(
-            config_options,
-            'fail_command',
-            allow_empty=False
-        )
-        self.success_command = Alerter.get_config_option(
-            config_options,
-            'success_command',
-            allow_empty=False
-        )
-        self.catchup_command = Alerter.get_config_option(
+        self.fail_command = Alerter.get_template_option(config_options, 'fail_command')
+        self.success_command = Alerter.get_template_option(config_options, 'success_command')
+        catchup_command = Alerter.get_config_option(
             config_options,
             'catchup_command',
             allow_empty=False
         )
-        if self.fail_command is None and self.success_command is None and self.catchup_command is None:
+        if catchup_command == 'fail_command':
+            self.catchup_command = self.fail_command
+        else:
+            # catchup commands are only run if set to 'fail_command'
+            self.catchup_command = None
+        if self.fail_command is None and self.success_command is None and catchup_command is None:
             raise AlerterConfigurationError('execute alerter has no commands defined')
 
     def send_alert(self, name, monitor):
         type_ = self.should_alert(monitor)
         command = None
-        (days, hours, minutes, seconds) = monitor.get_downtime()
-        if monitor.is_remote():
-            host = monitor.running_on
-        else:
-            host = self.hostname
 
         if type_ == "":
             return
@@ -49,8 +42,7 @@ class ExecuteAlerter(Alerter):
         elif type_ == "success":
             command = self.success_command
         elif type_ == "catchup":
-            if self.catchup_command == 'fail_command':
-                command = self.fail_command
+            command = self.catchup_command
         else:
             self.alerter_logger.error("Unknown alert type %s", type_)
             return
@@ -58,19 +50,7 @@ class ExecuteAlerter(Alerter):
         if command is None:
             return
 
-        command = command.format(
-            hostname=host,
-            name=name,
-            days=days,
-            hours=hours,
-            minutes=minutes,
-            seconds=seconds,
-            failed_at=format_datetime(monitor.first_failure_time()),
-            virtual_fail_count=monitor.virtual_fail_count(),
-            info=monitor.get_result(),
-            description=monitor.describe(),
-            last_virtual_fail_count=monitor.last_virtual_fail_count()
-        )
+        command = command.render(template.get_context(name, monitor))
 
         if not self.dry_run:
             self.alerter_logger.debug("About to execute command: %s", command)
@@ -1,11 +1,6 @@
-try:
-    import requests
-    requests_available = True
-except ImportError:
-    requests_available = False
-
 from util import AlerterConfigurationError, format_datetime
 from .alerter import Alerter, register
+from . import transport
 
 
 @register
@@ -18,7 +13,7 @@ class FortySixElksAlerter(Alerter):
 
     def __init__(self, config_options):
         Alerter.__init__(self, config_options)
-        if not requests_available:
+        if not transport.requests_available:
             self.alerter_logger.critical("Requests package is not available, cannot use FortySixElksAlerter.")
             self.alerter_logger.critical("Try: pip install -r requirements.txt")
             return
@@ -119,15 +114,18 @@ class FortySixElksAlerter(Alerter):
             return
 
         if not self.dry_run:
-            try:
-                response = requests.post(url, data=params, auth=auth)
-                s = response.json()
-                if s['status'] not in ('created', 'delivered'):
-                    self.alerter_logger.error("Unable to send SMS: %s", s)
-                    self.available = False
-            except Exception:
-                self.alerter_logger.exception("SMS sending failed")
-                self.available = False
+            self.run_send(self._send_sms, url, params, auth)
         else:
             self.alerter_logger.info("dry_run: would send SMS: %s", url)
         return
+
+    def _send_sms(self, url, params, auth):
+        try:
+            response = transport.post(url, data=params, auth=auth)
+            s = response.json()
+            if s['status'] not in ('created', 'delivered'):
+                self.alerter_logger.error("Unable to send SMS: %s", s)
+                self.available = False
+        except Exception:
+            self.alerter_logger.exception("SMS sending failed")
+            self.available = False
@@ -7,8 +7,8 @@ except ImportError:
     from email.mime.multipart import MIMEMultipart
     from email.mime.text import MIMEText
 
-from util import format_datetime
 from .alerter import Alerter, register
+from . import template
 
 
 @register
@@ -61,56 +61,30 @@ class EMailAlerter(Alerter):
 
         self.support_catchup = True
 
+        self.templates = Alerter.get_message_templates(config_options)
+
     def send_alert(self, name, monitor):
         """Send the email."""
 
         type = self.should_alert(monitor)
-        (days, hours, minutes, seconds) = monitor.get_downtime()
-
-        if monitor.is_remote():
-            host = " on %s " % monitor.running_on
-        else:
-            host = " on host %s" % self.hostname
-
-        message = MIMEMultipart()
-        message['From'] = self.from_addr
-        message['To'] = self.to_addr
 
         if type == "":
             return
-        elif type == "failure":
-            message['Subject'] = "[%s] Monitor %s Failed!" % (self.hostname, name)
-            body = """Monitor %s%s has failed.
-            Failed at: %s
-            Downtime: %d+%02d:%02d:%02d
-            Virtual failure count: %d
-            Additional info: %s
-            Description: %s""" % (
-                name,
-                host,
-                format_datetime(monitor.first_failure_time()),
-                days, hours, minutes, seconds,
-                monitor.virtual_fail_count(),
-                monitor.get_result(),
-                monitor.describe())
-            try:
-                if monitor.recover_info != "":
-                    body += "\nRecovery info: %s" % monitor.recover_info
-            except AttributeError:
-                body += "\nNo recovery info available"
-
-        elif type == "success":
-            message['Subject'] = "[%s] Monitor %s succeeded" % (self.hostname, name)
-            body = "Monitor %s%s is back up.\nOriginally failed at: %s\nDowntime: %d+%02d:%02d:%02d\nDescription: %s" % (name, host, format_datetime(monitor.first_failure_time()), days, hours, minutes, seconds, monitor.describe())
-
-        elif type == "catchup":
-            message['Subject'] = "[%s] Monitor %s failed earlier!" % (self.hostname, name)
-            body = "Monitor %s%s failed earlier while this alerter was out of hours.\nFailed at: %s\nVirtual failure count: %d\nAdditional info: %s\nDescription: %s" % (name, host, format_datetime(monitor.first_failure_time()), monitor.virtual_fail_count(), monitor.get_result(), monitor.describe())
-
-        else:
+        elif type not in self.templates:
             self.alerter_logger.critical("unknown alert type %s", type)
             return
 
+        context = template.get_context(name, monitor)
+        (subject_template, body_template) = self.templates[type]
+
+        message = MIMEMultipart()
+        message['From'] = self.from_addr
+        message['To'] = self.to_addr
+        message['Subject'] = subject_template.render(context)
+        body = body_template.render(context)
+        if type == "failure" and context.recover_info != "":
+            body += "\nRecovery info: %s" % context.recover_info
+
         message.attach(MIMEText(body, 'plain'))
 
         if not self.dry_run:
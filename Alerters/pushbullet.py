@@ -1,7 +1,6 @@
-import requests
-
 from util import format_datetime
 from .alerter import Alerter, register
+from . import transport
 
 
 @register
@@ -26,10 +25,10 @@ class PushbulletAlerter(Alerter):
         """Send a push notification."""
 
         _payload = {'type': 'note', 'title': subject, 'body': body}
-        _auth = requests.auth.HTTPBasicAuth(self.pushbullet_token, '')
+        _auth = (self.pushbullet_token, '')
 
-        r = requests.post('https://api.pushbullet.com/v2/pushes', data=_payload, auth=_auth)
-        if not r.status_code == requests.codes.ok:
+        r = transport.post('https://api.pushbullet.com/v2/pushes', data=_payload, auth=_auth)
+        if not r.status_code == 200:
             raise RuntimeError("Unable to send Pushbullet notification")
 
     def send_alert(self, name, monitor):
@@ -86,10 +85,13 @@ class PushbulletAlerter(Alerter):
             return
 
         if not self.dry_run:
-            try:
-                self.send_pushbullet_notification(subject, body)
-            except Exception:
-                self.alerter_logger.exception("Couldn't send push notification")
-                self.available = False
+            self.run_send(self._send, subject, body)
         else:
             self.alerter_logger.info("dry_run: would send push notification: %s" % body)
+
+    def _send(self, subject, body):
+        try:
+            self.send_pushbullet_notification(subject, body)
+        except Exception:
+            self.alerter_logger.exception("Couldn't send push notification")
+            self.available = False
@@ -1,8 +1,7 @@
 # coding=utf-8
-import requests
-
 from util import format_datetime
 from .alerter import Alerter, register
+from . import transport
 
 
 @register
@@ -32,13 +31,13 @@ class PushoverAlerter(Alerter):
     def send_pushover_notification(self, subject, body):
         """Send a push notification."""
 
-        requests.post('https://api.pushover.net/1/messages.json',
-                      data={
-                          "token": self.pushover_token,
-                          "user": self.pushover_user,
-                          "title": subject,
-                          "message": body,
-                      })
+        transport.post('https://api.pushover.net/1/messages.json',
+                       data={
+                           "token": self.pushover_token,
+                           "user": self.pushover_user,
+                           "title": subject,
+                           "message": body,
+                       })
 
     def send_alert(self, name, monitor):
         """Build up the content for the push notification."""
@@ -90,10 +89,13 @@ class PushoverAlerter(Alerter):
             return
 
         if not self.dry_run:
-            try:
-                self.send_pushover_notification(subject, body)
-            except Exception:
-                self.alerter_logger.exception("Couldn't send push notification")
-                self.available = False
+            self.run_send(self._send, subject, body)
         else:
             self.alerter_logger.info("dry_run: would send push notification: %s", body)
+
+    def _send(self, subject, body):
+        try:
+            self.send_pushover_notification(subject, body)
+        except Exception:
+            self.alerter_logger.exception("Couldn't send push notification")
+            self.available = False
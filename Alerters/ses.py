@@ -6,9 +6,10 @@ except ImportError:
     boto3_available = False
 
 import os
+import threading
 
-from util import format_datetime
 from .alerter import Alerter, register
+from . import template
 
 
 @register
@@ -37,6 +38,8 @@ class SESAlerter(Alerter):
 
         self.support_catchup = True
 
+        self.templates = Alerter.get_message_templates(config_options)
+
         self.ses_client_params = {}
 
         aws_region = Alerter.get_config_option(config_options, 'aws_region')
@@ -50,66 +53,85 @@ class SESAlerter(Alerter):
             self.ses_client_params['aws_access_key_id'] = aws_access_key
             self.ses_client_params['aws_secret_access_key'] = aws_secret_key
 
+        # if enabled, alerts generated in one loop are collected and sent as
+        # a single email when the loop is complete
+        self.supports_batch = Alerter.get_config_option(
+            config_options,
+            'batch',
+            required_type='bool',
+            default=False
+        )
+
+        # the client is built on first use and then shared; creating one is
+        # expensive (endpoint metadata, credential lookup) but using one is
+        # thread-safe
+        self._ses_client = None
+        self._ses_client_lock = threading.Lock()
+
+    def _get_ses_client(self):
+        """Return our SES client, creating it if needed."""
+        if self._ses_client is None:
+            with self._ses_client_lock:
+                if self._ses_client is None:
+                    self._ses_client = boto3.client('ses', **self.ses_client_params)
+        return self._ses_client
+
+    def _send_email(self, subject, body):
+        mail = {
+            'Source': self.from_addr,
+            'Destination': {'ToAddresses': [self.to_addr]},
+            'Message': {
+                'Subject': {'Data': subject},
+                'Body': {'Text': {'Data': body}}
+            }
+        }
+        if not self.dry_run:
+            try:
+                self._get_ses_client().send_email(**mail)
+            except Exception:
+                self.alerter_logger.exception("couldn't send mail")
+                # throw the client away in case it's the client that's broken
+                self._ses_client = None
+                self.available = False
+        else:
+            self.alerter_logger.info("dry_run: would send email:")
+            self.alerter_logger.info("    Subject: %s", subject)
+            self.alerter_logger.info("    Body: %s", body)
+
     def send_alert(self, name, monitor):
         """Send the email."""
 
         type = self.should_alert(monitor)
-        (days, hours, minutes, seconds) = monitor.get_downtime()
-
-        if monitor.is_remote():
-            host = " on %s " % monitor.running_on
-        else:
-            host = " on host %s" % self.hostname
-
-        mail = {'Source': self.from_addr}
-        mail['Destination'] = {'ToAddresses': [self.to_addr]}
 
         if type == "":
             return
-        elif type == "failure":
-            message = {'Subject': {'Data': "[%s] Monitor %s Failed!" % (self.hostname, name)}}
-            message['Body'] = {'Text': {'Data': """Monitor %s%s has failed.
-            Failed at: %s
-            Downtime: %d+%02d:%02d:%02d
-            Virtual failure count: %d
-            Additional info: %s
-            Description: %s""" % (
-                name,
-                host,
-                format_datetime(monitor.first_failure_time()),
-                days, hours, minutes, seconds,
-                monitor.virtual_fail_count(),
-                monitor.get_result(),
-                monitor.describe())
-            }}
-            try:
-                if monitor.recover_info != "":
-                    message['Body']['Text']['Data'] += "\nRecovery info: %s" % monitor.recover_info
-            except AttributeError:
-                message['Body']['Text']['Data'] += "\nNo recovery info available"
-
-        elif type == "success":
-            message = {'Subject': {'Data': "[%s] Monitor %s succeeded" % (self.hostname, name)}}
-            message['Body'] = {'Text': {'Data': "Monitor %s%s is back up.\nOriginally failed at: %s\nDowntime: %d+%02d:%02d:%02d\nDescription: %s" % (name, host, format_datetime(monitor.first_failure_time()), days, hours, minutes, seconds, monitor.describe())}}
-
-        elif type == "catchup":
-            message = {'Subject': {'Data': "[%s] Monitor %s failed earlier!" % (self.hostname, name)}}
-            message['Body'] = {'Text': {'Data': "Monitor %s%s failed earlier while this alerter was out of hours.\nFailed at: %s\nVirtual failure count: %d\nAdditional info: %s\nDescription: %s" % (name, host, format_datetime(monitor.first_failure_time()), monitor.virtual_fail_count(), monitor.get_result(), monitor.describe())}}
-
-        else:
+        elif type not in self.templates:
             self.alerter_logger.critical("Unknown alert type %s", type)
             return
 
-        mail['Message'] = message
+        context = template.get_context(name, monitor)
+        (subject_template, body_template) = self.templates[type]
+        subject = subject_template.render(context)
+        body = body_template.render(context)
+        if type == "failure" and context.recover_info != "":
+            body += "\nRecovery info: %s" % context.recover_info
 
-        if not self.dry_run:
-            try:
-                client = boto3.client('ses', **self.ses_client_params)
-                client.send_email(**mail)
-            except Exception:
-                self.alerter_logger.exception("couldn't send mail")
-                self.available = False
+        if self.doing_batch:
+            self.batch_data.append((subject, body))
         else:
-            self.alerter_logger.info("dry_run: would send email:")
-            self.alerter_logger.info("    Subject: %s", message['Subject']['Data'])
-            self.alerter_logger.info("    Body: %s", message['Body']['Text']['Data'])
+            self._send_email(subject, body)
+
+    def process_batch(self):
+        """Send everything collected during this loop as one email."""
+        if len(self.batch_data) == 0:
+            return
+        if len(self.batch_data) == 1:
+            (subject, body) = self.batch_data[0]
+            self._send_email(subject, body)
+            return
+        subject = "[%s] %d monitor alerts" % (self.hostname, len(self.batch_data))
+        body = "\n\n".join(
+            "%s\n%s" % (entry_subject, entry_body)
+            for (entry_subject, entry_body) in self.batch_data
+        )
+        self._send_email(subject, body)
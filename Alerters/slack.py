@@ -1,11 +1,6 @@
-try:
-    import requests
-    requests_available = True
-except ImportError:
-    requests_available = False
-
-from util import format_datetime
 from .alerter import Alerter, register
+from . import template
+from . import transport
 
 
 @register
@@ -19,7 +14,7 @@ class SlackAlerter(Alerter):
 
     def __init__(self, config_options):
         Alerter.__init__(self, config_options)
-        if not requests_available:
+        if not transport.requests_available:
             self.alerter_logger.critical("Requests package is not available, cannot use SlackAlerter.")
             self.alerter_logger.critical("Try: pip install -r requirements.txt")
             return
@@ -34,11 +29,16 @@ class SlackAlerter(Alerter):
         self.channel = Alerter.get_config_option(config_options, 'channel')
         self.username = Alerter.get_config_option(config_options, 'username')
 
+        self.failure_text = Alerter.get_template_option(config_options, 'failure_text', "Monitor {name} failed!")
+        self.success_text = Alerter.get_template_option(config_options, 'success_text', "Monitor {name} succeeded.")
+
     def send_alert(self, name, monitor):
         """Send the message."""
 
         type = self.should_alert(monitor)
-        (days, hours, minutes, seconds) = monitor.get_downtime()
+        if type == "":
+            return
+        context = template.get_context(name, monitor)
 
         if self.channel is not None:
             message_json = {'channel': self.channel}
@@ -49,25 +49,23 @@ class SlackAlerter(Alerter):
 
         message_json['attachments'] = [{}]
 
-        if type == "":
-            return
-        elif type == "failure":
-            message_json['text'] = "Monitor {} failed!".format(name)
+        if type == "failure":
+            message_json['text'] = self.failure_text.render(context)
             message_json['attachments'][0]['color'] = 'danger'
             fields = [
                 {
                     'title': 'Failed at',
-                    'value': format_datetime(monitor.first_failure_time()),
+                    'value': context.failed_at,
                     'short': True
                 },
                 {
                     'title': 'Downtime',
-                    'value': "{}+{:02d}:{:02d}:{:02d}".format(days, hours, minutes, seconds),
+                    'value': context.downtime,
                     'short': True
                 },
                 {
                     'title': 'Virtual failure count',
-                    'value': monitor.virtual_fail_count(),
+                    'value': context.virtual_fail_count,
                     'short': True
                 },
                 {
@@ -77,36 +75,33 @@ class SlackAlerter(Alerter):
                 },
                 {
                     'title': 'Additional info',
-                    'value': monitor.get_result()
+                    'value': context.info
                 },
                 {
                     'title': 'Description',
-                    'value': monitor.describe()
+                    'value': context.description
                 }
             ]
 
-            try:
-                if monitor.recover_info != "":
-                    fields.append({
-                        'title': 'Recovery info',
-                        'value': "Recovery info: %s" % monitor.recover_info
-                    })
-                    message_json['attachments'][0]['color'] = 'warning'
-            except AttributeError:
-                pass
+            if context.recover_info != "":
+                fields.append({
+                    'title': 'Recovery info',
+                    'value': "Recovery info: %s" % context.recover_info
+                })
+                message_json['attachments'][0]['color'] = 'warning'
             message_json['attachments'][0]['fields'] = fields
 
         elif type == "success":
-            message_json['text'] = "Monitor {} succeeded.".format(name)
+            message_json['text'] = self.success_text.render(context)
             fields = [
                 {
                     'title': 'Failed at',
-                    'value': format_datetime(monitor.first_failure_time()),
+                    'value': context.failed_at,
                     'short': True
                 },
                 {
                     'title': 'Downtime',
-                    'value': "{}+{:02d}:{:02d}:{:02d}".format(days, hours, minutes, seconds),
+                    'value': context.downtime,
                     'short': True
                 },
                 {
@@ -116,7 +111,7 @@ class SlackAlerter(Alerter):
                 },
                 {
                     'title': 'Description',
-                    'value': monitor.describe()
+                    'value': context.description
                 }
             ]
             message_json['attachments'][0]['color'] = 'good'
@@ -127,12 +122,15 @@ class SlackAlerter(Alerter):
             return
 
         if not self.dry_run:
-            try:
-                r = requests.post(self.url, json=message_json)
-                if not r.status_code == 200:
-                    self.alerter_logger.error("POST to slack webhook failed: %s", r)
-            except Exception:
-                self.alerter_logger.exception("Failed to post to slack webhook")
-                self.available = False
+            self.run_send(self._send_slack, message_json)
         else:
             self.alerter_logger.info("dry_run: would send slack: %s", message_json.__repr__())
+
+    def _send_slack(self, message_json):
+        try:
+            r = transport.post(self.url, json=message_json)
+            if not r.status_code == 200:
+                self.alerter_logger.error("POST to slack webhook failed: %s", r)
+        except Exception:
+            self.alerter_logger.exception("Failed to post to slack webhook")
+            self.available = False
@@ -1,8 +1,7 @@
 # coding=utf-8
-import requests
-
 from util import format_datetime
 from .alerter import Alerter, register
+from . import transport
 
 
 @register
@@ -33,12 +32,12 @@ class TelegramAlerter(Alerter):
     def send_telegram_notification(self, body):
         """Send a push notification."""
 
-        r = requests.post('https://api.telegram.org/bot{}/sendMessage'.format(self.telegram_token),
-                          data={
-                              "chat_id": self.telegram_chatid,
-                              "text": body,
+        r = transport.post('https://api.telegram.org/bot{}/sendMessage'.format(self.telegram_token),
+                           data={
+                               "chat_id": self.telegram_chatid,
+                               "text": body,
         })
-        if not r.status_code == requests.codes.ok:
+        if not r.status_code == 200:
             raise RuntimeError("Unable to send telegram notification")
 
     def send_alert(self, name, monitor):
@@ -89,10 +88,13 @@ Description: %s""" % (
             return
 
         if not self.dry_run:
-            try:
-                self.send_telegram_notification(body)
-            except Exception:
-                self.alerter_logger.exception("Couldn't send push notification")
-                self.available = False
+            self.run_send(self._send, body)
         else:
             self.alerter_logger.info("dry_run: would send push notification: %s" % body)
+
+    def _send(self, body):
+        try:
+            self.send_telegram_notification(body)
+        except Exception:
+            self.alerter_logger.exception("Couldn't send push notification")
+            self.available = False
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""Message templates for alerters.
+
+Templates use str.format() syntax, e.g. "Monitor {name} failed at {failed_at}",
+with the fields listed in AlertContext.FIELDS. They are parsed and checked
+once, when the alerter is configured.
+
+The values for an alert are gathered into an AlertContext; during a round of
+alerts this is done once per monitor and shared by every alerter which fires
+for it."""
+
+import string
+
+from socket import gethostname
+
+from util import AlerterConfigurationError, format_datetime
+
+
+DEFAULT_FAILURE_SUBJECT = "[{local_hostname}] Monitor {name} Failed!"
+DEFAULT_FAILURE_BODY = """Monitor {name}{on_host} has failed.
+            Failed at: {failed_at}
+            Downtime: {downtime}
+            Virtual failure count: {virtual_fail_count}
+            Additional info: {info}
+            Description: {description}"""
+DEFAULT_SUCCESS_SUBJECT = "[{local_hostname}] Monitor {name} succeeded"
+DEFAULT_SUCCESS_BODY = "Monitor {name}{on_host} is back up.\nOriginally failed at: {failed_at}\nDowntime: {downtime}\nDescription: {description}"
+DEFAULT_CATCHUP_SUBJECT = "[{local_hostname}] Monitor {name} failed earlier!"
+DEFAULT_CATCHUP_BODY = "Monitor {name}{on_host} failed earlier while this alerter was out of hours.\nFailed at: {failed_at}\nVirtual failure count: {virtual_fail_count}\nAdditional info: {info}\nDescription: {description}"
+
+
+class AlertContext(object):
+    """The values about a monitor which can be used in a template."""
+
+    FIELDS = (
+        'name', 'hostname', 'local_hostname', 'on_host',
+        'days', 'hours', 'minutes', 'seconds', 'downtime',
+        'failed_at', 'virtual_fail_count', 'last_virtual_fail_count',
+        'info', 'description', 'recover_info'
+    )
+
+    local_hostname = gethostname()
+
+    def __init__(self, name, monitor):
+        self.name = name
+        if monitor.is_remote():
+            self.hostname = monitor.running_on
+            self.on_host = " on %s " % monitor.running_on
+        else:
+            self.hostname = self.local_hostname
+            self.on_host = " on host %s" % self.local_hostname
+        (self.days, self.hours, self.minutes, self.seconds) = monitor.get_downtime()
+        self.downtime = "%d+%02d:%02d:%02d" % (self.days, self.hours, self.minutes, self.seconds)
+        self.failed_at = format_datetime(monitor.first_failure_time())
+        self.virtual_fail_count = monitor.virtual_fail_count()
+        self.last_virtual_fail_count = monitor.last_virtual_fail_count()
+        self.info = monitor.get_result()
+        self.description = monitor.describe()
+        self.recover_info = getattr(monitor, 'recover_info', "")
+
+
+# monitor name -> (monitor, context), while a round of alerts is in progress
+_contexts = None
+
+
+def start_round():
+    """Start sharing AlertContexts between alerters, until end_round()."""
+    global _contexts
+    _contexts = {}
+
+
+def end_round():
+    global _contexts
+    _contexts = None
+
+
+def get_context(name, monitor):
+    """Get the AlertContext for a monitor.
+
+    During a round of alerts each monitor's context is only built once."""
+    if _contexts is None:
+        return AlertContext(name, monitor)
+    cached = _contexts.get(name)
+    if cached is not None and cached[0] is monitor:
+        return cached[1]
+    context = AlertContext(name, monitor)
+    _contexts[name] = (monitor, context)
+    return context
+
+
+class Template(object):
+    """A compiled message template."""
+
+    _formatter = string.Formatter()
+
+    def __init__(self, text):
+        self.text = text
+        try:
+            self.parts = list(self._formatter.parse(text))
+        except ValueError as e:
+            raise AlerterConfigurationError("invalid template {0!r}: {1}".format(text, e))
+        for (_, field, _, _) in self.parts:
+            if field is not None and field not in AlertContext.FIELDS:
+                raise AlerterConfigurationError(
+                    "unknown field {{{0}}} in template; valid fields are: {1}".format(
+                        field, ', '.join(AlertContext.FIELDS)))
+
+    def render(self, context):
+        output = []
+        for (literal, field, format_spec, conversion) in self.parts:
+            output.append(literal)
+            if field is None:
+                continue
+            value = getattr(context, field)
+            if conversion is not None:
+                value = self._formatter.convert_field(value, conversion)
+            output.append(format(value, format_spec))
+        return "".join(output)
@@ -0,0 +1,117 @@
+# coding=utf-8
+"""Shared HTTP transport for the webhook-style alerters.
+
+All alerters use one requests Session, so connections to the same service are
+pooled and kept alive between alerts, and every request gets the same timeout.
+Sends can also be handed to a small shared worker pool so that a burst of
+alerts goes out concurrently (where concurrent.futures is available;
+otherwise they are sent one at a time)."""
+
+import logging
+import sys
+import threading
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+
+def _module_available(name):
+    try:
+        if sys.version_info[0] > 2:
+            import importlib.util
+            return importlib.util.find_spec(name) is not None
+        import pkgutil
+        return pkgutil.find_loader(name) is not None
+    except (AttributeError, ImportError, ValueError):
+        return False
+
+
+# requests is only imported when the first alert is sent
+requests_available = _module_available('requests')
+
+# in seconds, for both connecting and reading
+TIMEOUT = 10
+# number of concurrent sends, and connections kept per host
+MAX_WORKERS = 8
+
+transport_logger = logging.getLogger('simplemonitor.alerter-transport')
+
+_session = None
+_executor = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """Get the requests Session shared by all alerters, creating it if needed."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                import requests.adapters
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=MAX_WORKERS,
+                    pool_maxsize=MAX_WORKERS
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def request(method, url, **kwargs):
+    """Make an HTTP request using the shared session."""
+    kwargs.setdefault('timeout', TIMEOUT)
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+class _Done(object):
+    """The result of a function which has already run, looking like a Future."""
+
+    def __init__(self, function, *args, **kwargs):
+        self._result = None
+        self._exc_info = None
+        try:
+            self._result = function(*args, **kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def result(self):
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        return self._result
+
+
+def submit(function, *args, **kwargs):
+    """Run a function in the shared worker pool, returning a Future.
+
+    Without a worker pool, the function is run straight away."""
+    global _executor
+    if ThreadPoolExecutor is None:
+        return _Done(function, *args, **kwargs)
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor.submit(function, *args, **kwargs)
+
+
+def wait(futures):
+    """Wait for the given Futures to finish, logging any which raised."""
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            transport_logger.exception("Exception in alert send")
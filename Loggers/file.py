@@ -191,8 +191,11 @@ class HTMLLogger(Logger):
             "update": update,
             "host": monitor.running_on,
             "failures": failures,
-            "last_failure": last_failure
+            "last_failure": last_failure,
+            "history": None
         }
+        if monitor.history is not None and len(monitor.history) > 0:
+            data_line["history"] = monitor.history.summary()
         self.batch_data[monitor.name] = data_line
 
     def process_batch(self):
@@ -218,16 +221,25 @@ class HTMLLogger(Logger):
         keys = list(self.batch_data.keys())
         keys.sort()
         for entry in keys:
+            remote = self.batch_data[entry]["host"] != my_host
+            # our own monitors are counted up front, if we were given counts
+            counted = self.counts is not None and not remote
             if self.batch_data[entry]["age"] > 120:
                 status = "OLD"
                 old_count += 1
+                if counted and self.batch_data[entry]["status"]:
+                    ok_count -= 1
+                elif counted:
+                    fail_count -= 1
             elif self.batch_data[entry]["status"]:
                 status = "OK"
-                ok_count += 1
+                if not counted:
+                    ok_count += 1
             else:
                 status = "FAIL"
-                fail_count += 1
-            if self.batch_data[entry]["host"] != my_host:
+                if not counted:
+                    fail_count += 1
+            if remote:
                 remote_count += 1
             try:
                 monitor_name = entry.split("/")[1]
@@ -238,14 +250,22 @@ class HTMLLogger(Logger):
             else:
                 output = output_ok
             output.write("<tr class=\"%srow\">" % status.lower())
+            history = self.batch_data[entry]["history"]
+            if history is None:
+                history_title = ""
+            else:
+                history_title = " title=\"%0.1f%% available over %d runs; p50 %0.3fs, p95 %0.3fs, p99 %0.3fs\"" % (
+                    history["availability"] * 100, history["runs"],
+                    history["p50"], history["p95"], history["p99"]
+                )
             output.write("""
             <td class="monitor_name">%s</td>
-            <td class="status %s">%s</td>
+            <td class="status %s"%s>%s</td>
             <td>%s</td>
             <td>%s</td>
             """ % (
                 monitor_name,
-                status.lower(), status,
+                status.lower(), history_title, status,
                 self.batch_data[entry]["host"],
                 self.batch_data[entry]["fail_time"],
             )
@@ -273,6 +293,9 @@ class HTMLLogger(Logger):
             else:
                 output.write("<td>%d</td>" % self.batch_data[entry]["age"])
             output.write("</tr>\n")
+        if self.counts is not None:
+            ok_count += self.counts['ok']
+            fail_count += self.counts['failing']
         count_data = "<div id=\"summary\""
         if old_count > 0:
             cls = "old"
@@ -327,6 +350,7 @@ class MonitorResult(object):
         self.last_run_duration = None
         self.status = "Fail"
         self.dependencies = []
+        self.history = None
 
     def json_representation(self):
         return self.__dict__
@@ -335,6 +359,7 @@ class MonitorResult(object):
 class MonitorJsonPayload(object):
     def __init__(self):
         self.generated = None
+        self.counts = None
         self.monitors = {}
 
     def json_representation(self):
@@ -375,12 +400,15 @@ class JsonLogger(Logger):
         elif monitor.virtual_fail_count() <= 0:
             result.status = "OK"
         result.dependencies = monitor._dependencies
+        if monitor.history is not None and len(monitor.history) > 0:
+            result.history = monitor.history.summary()
 
         self.batch_data[name] = result
 
     def process_batch(self):
         payload = MonitorJsonPayload()
         payload.generated = format_datetime(datetime.datetime.now())
+        payload.counts = self.counts
         payload.monitors = self.batch_data
 
         with open(self.filename, 'w') as outfile:
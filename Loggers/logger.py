@@ -18,6 +18,9 @@ class Logger(object):
 
     batch_data = {}
 
+    # our (local) monitors counted by status, as from SimpleMonitor.count_failing()
+    counts = None
+
     def __init__(self, config_options):
         self.name = Logger.get_config_option(
             config_options,
@@ -88,5 +91,16 @@ class Logger(object):
         return self.describe()
 
 
+# the modules defining each type, imported when the type is first used
+MODULES = {
+    'db': 'Loggers.db',
+    'dbstatus': 'Loggers.db',
+    'logfile': 'Loggers.file',
+    'html': 'Loggers.file',
+    'json': 'Loggers.file',
+    'mqtt': 'Loggers.mqtt',
+    'network': 'Loggers.network',
+}
+
 (register, get_class, all_types) = subclass_dict_handler(
-    'simplemonitor.Loggers.logger', Logger)
+    'simplemonitor.Loggers.logger', Logger, MODULES, 'simplemonitor.loggers')
@@ -4,6 +4,7 @@ import socket
 import sys
 import hmac
 import struct
+import hashlib
 import logging
 
 import util
@@ -22,6 +23,9 @@ else:
 #  will be received by an arbitrary thread. (When the signal module is
 #  available, interrupts always go to the main thread.)
 
+# hmac.new() used to default to MD5; keep using it so we can talk to older instances
+DIGEST = hashlib.md5
+
 
 @register
 class NetworkLogger(Logger):
@@ -81,7 +85,7 @@ class NetworkLogger(Logger):
     def process_batch(self):
         try:
             p = util.json_dumps(self.batch_data)
-            mac = hmac.new(self.key, p)
+            mac = hmac.new(self.key, p, DIGEST)
             send_bytes = struct.pack('B', mac.digest_size) + mac.digest() + p
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             try:
@@ -151,7 +155,7 @@ class Listener(Thread):
                     their_digest = serialized[1:mac_size + 1]
                     # then the rest is the serialized data
                     serialized = serialized[mac_size + 1:]
-                    mac = hmac.new(self.key, serialized)
+                    mac = hmac.new(self.key, serialized, DIGEST)
                     my_digest = mac.digest()
                 except IndexError:  # pragma: no cover
                     raise ValueError('Did not receive any or enough data from %s', addr[0])
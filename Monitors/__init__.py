@@ -1 +1 @@
-__all__ = ["monitor", "service", "network", "host"]
+__all__ = ["monitor", "service", "network", "host", "linux"]
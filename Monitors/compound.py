@@ -1,6 +1,12 @@
 # coding=utf-8
 """compound checks (logical and of failure of multiple probes) for SimpleMonitor."""
 
+import ast
+import fnmatch
+import re
+
+from util import MonitorConfigurationError
+
 from .monitor import Monitor, register
 
 
@@ -9,9 +15,14 @@ class CompoundMonitor(Monitor):
     """Combine (logical-and) multiple failures for emergency escalation.
 
     Check most recent proble of provided monitors, if all are fail, then report fail.
+
+    We are run after all of our monitors, and they tell us when they start or
+    stop failing, so we keep a count of how many are failing rather than
+    looking at each of them every time.
     """
 
     type = "compound"
+    watches_monitors = True
 
     def __init__(self, name, config_options):
         Monitor.__init__(self, name, config_options)
@@ -30,15 +41,13 @@ class CompoundMonitor(Monitor):
                                                   )
         self.m = -1
         self.mt = None
+        self.failcount = 0
 
     def run_test(self):
-        # we depend on the other tests to run, just check them
-        failcount = self.min_fail
-        # this check actually doesn't work, since the sub-monitors run AFTER the compound ones...
-        for i in self.monitors:
-            if self.m[i].get_success_count() > 0 and self.m[i].tests_run > 0:
-                failcount -= 1
-        return (failcount > 0)
+        # our monitors have all run by now (see post_config_setup), so just look at the count
+        if self.failcount >= self.min_fail:
+            return self.record_fail(self.get_result())
+        return self.record_success(self.get_result())
 
     def describe(self):
         """Explains what we do."""
@@ -51,6 +60,9 @@ class CompoundMonitor(Monitor):
         """ stash a ref to the global monitor list so we can examine later """
         self.mt = mmm
 
+    def get_watched_monitors(self):
+        return self.monitors
+
     def post_config_setup(self):
         """ make a nice little dict of just the monitors we need """
         if self.m != -1:
@@ -63,6 +75,27 @@ class CompoundMonitor(Monitor):
         for i in self.monitors:
             if i not in list(self.m.keys()):
                 raise RuntimeError("No such monitor %s in compound monitor" % i)
+        self.set_run_after(self.m.keys())
+        self.failcount = 0
+        for monitor in self.m.values():
+            monitor.add_failure_listener(self.monitor_failing_changed)
+            if monitor.virtual_fail_count() > 0:
+                self.failcount += 1
+
+    def monitor_failing_changed(self, monitor, failing):
+        """Called by our monitors when they start or stop failing."""
+        was_failing = self.virtual_fail_count() > 0
+        if failing:
+            self.failcount += 1
+        else:
+            self.failcount -= 1
+        if self._failure_listeners and was_failing != (self.virtual_fail_count() > 0):
+            Monitor._failing_changed(self, not was_failing)
+
+    def _failing_changed(self, failing):
+        # whether we're failing depends on our monitors, not on our own runs;
+        # see monitor_failing_changed()
+        pass
 
     def virtual_fail_count(self):
         failcount = self.fail_count()
@@ -74,12 +107,8 @@ class CompoundMonitor(Monitor):
             return 0
 
     def fail_count(self):
-        # increments the fail counter by 1 if a sub-monitor failed.
-        failcount = 0
-        for i in self.monitors:
-            if self.m[i].virtual_fail_count() > 0:
-                failcount += 1
-        return failcount
+        # the number of our monitors which are failing
+        return self.failcount
 
     def get_result(self):
         failcount = self.fail_count()
@@ -88,3 +117,246 @@ class CompoundMonitor(Monitor):
             return "{0} of {1} services failed. Fail after: {2}".format(failcount, monitorcount, self.min_fail)
         else:
             return "All {0} services OK".format(monitorcount)
+
+
+class _Selection(object):
+    """A set of monitors, keeping count of how many of them are failing.
+
+    The monitors tell us when they start or stop failing, so the counts are
+    always up to date without looking at the monitors."""
+
+    def __init__(self, monitors, weights=None, on_change=None):
+        self.weights = weights or {}
+        self.total = len(monitors)
+        self.failing = 0
+        self.failing_weight = 0
+        self.on_change = on_change
+        for monitor in monitors:
+            monitor.add_failure_listener(self.monitor_failing_changed)
+            if monitor.virtual_fail_count() > 0:
+                self.failing += 1
+                self.failing_weight += self.weights.get(monitor.name, 1)
+
+    def monitor_failing_changed(self, monitor, failing):
+        change = 1 if failing else -1
+        self.failing += change
+        self.failing_weight += change * self.weights.get(monitor.name, 1)
+        if self.on_change is not None:
+            self.on_change()
+
+
+def _format(value):
+    if isinstance(value, bool):
+        return str(value)
+    return "{0:g}".format(value)
+
+
+def _pct(part, total):
+    if total == 0:
+        return 0.0
+    return 100.0 * part / total
+
+
+@register
+class AggregateMonitor(Monitor):
+    """Fail when an expression over the state of other monitors is true.
+
+    The expression can use these functions, each of which takes monitor
+    names, and/or group= (a monitor group) and match= (a glob on monitor
+    names), to select the monitors it looks at (group= and match= never select
+    other compound or aggregate monitors):
+        failed(...), ok(...), total(...): count monitors
+        pct_failed(...), pct_ok(...): percentages (0-100) of the monitors
+        quorum(...): true if more than half the monitors are OK
+        weighted_failed({'name': weight, ...}): the total weight of the
+            failing monitors (which default to a weight of 1)
+    and combine them with comparisons, arithmetic, and/or/not. A number
+    followed by % is just that number, so pct_failed(group=web) > 20% works.
+
+    The expression is compiled once, after all the monitors are loaded, and
+    the monitors it looks at tell it when they start or stop failing, so it
+    costs the same to run however many monitors it covers."""
+
+    type = "aggregate"
+    watches_monitors = True
+
+    FUNCTIONS = {
+        'failed': lambda s: s.failing,
+        'ok': lambda s: s.total - s.failing,
+        'total': lambda s: s.total,
+        'pct_failed': lambda s: _pct(s.failing, s.total),
+        'pct_ok': lambda s: _pct(s.total - s.failing, s.total),
+        'quorum': lambda s: (s.total - s.failing) * 2 > s.total,
+        'weighted_failed': lambda s: s.failing_weight,
+    }
+
+    _ALLOWED_NODES = tuple(getattr(ast, node) for node in [
+        'Expression', 'BoolOp', 'And', 'Or', 'UnaryOp', 'Not', 'USub', 'UAdd',
+        'BinOp', 'Add', 'Sub', 'Mult', 'Div', 'Compare', 'Eq', 'NotEq', 'Lt',
+        'LtE', 'Gt', 'GtE', 'Name', 'Load', 'Constant', 'Num', 'NameConstant'
+    ] if hasattr(ast, node))
+
+    def __init__(self, name, config_options):
+        Monitor.__init__(self, name, config_options)
+        self.expression = Monitor.get_config_option(config_options, 'expression', required=True)
+        self.mt = None
+        self.code = None
+        self.selections = []
+        self.changed = True
+        # (function, names, group, match, weights, label) for each function call
+        self.calls = []
+        self.tree = self._parse(self.expression)
+
+    def _parse(self, expression):
+        try:
+            tree = ast.parse(re.sub(r'(\d+(?:\.\d+)?)\s*%', r'\1', expression.strip()), mode='eval')
+            tree = _CallExtractor(self).visit(tree)
+            for node in ast.walk(tree):
+                if not isinstance(node, self._ALLOWED_NODES):
+                    raise ValueError("%s is not allowed" % node.__class__.__name__)
+        except (SyntaxError, ValueError) as e:
+            raise MonitorConfigurationError("Bad expression for monitor {0}: {1}".format(self.name, e))
+        return tree
+
+    def set_mon_refs(self, mmm):
+        self.mt = mmm
+
+    def get_watched_monitors(self):
+        watched = []
+        for (function, names, group, match, weights, label) in self.calls:
+            watched.extend(names)
+            watched.extend(weights.keys())
+        return watched
+
+    def _select(self, names, group, match, weights):
+        if weights:
+            names = names + list(weights.keys())
+        selected = []
+        for (name, monitor) in self.mt.monitors.items():
+            if name == self.name:
+                continue
+            if name in names:
+                selected.append(monitor)
+            elif monitor.watches_monitors:
+                # other compound and aggregate monitors only if named, so two
+                # aggregates can't pick each other (and wait for each other)
+                continue
+            elif (group is not None or match is not None) and \
+                    (group is None or monitor.group == group) and \
+                    (match is None or fnmatch.fnmatchcase(name, match)):
+                selected.append(monitor)
+        for name in names:
+            if name not in self.mt.monitors:
+                raise RuntimeError("No such monitor %s in aggregate monitor" % name)
+        return selected
+
+    def _mark_changed(self):
+        self.changed = True
+
+    def post_config_setup(self):
+        if self.code is not None:
+            return
+        run_after = set()
+        for (function, names, group, match, weights, label) in self.calls:
+            monitors = self._select(names, group, match, weights)
+            if len(monitors) == 0:
+                self.monitor_logger.warning("%s doesn't match any monitors", label)
+            run_after.update(monitor.name for monitor in monitors)
+            self.selections.append(_Selection(monitors, weights, self._mark_changed))
+        self.set_run_after(sorted(run_after))
+        self.code = compile(ast.fix_missing_locations(self.tree), '<expression of {0}>'.format(self.name), 'eval')
+
+    def evaluate(self):
+        """Work out the expression, returning (result, {label: value})."""
+        values = {}
+        labels = {}
+        for (i, (call, selection)) in enumerate(zip(self.calls, self.selections)):
+            value = self.FUNCTIONS[call[0]](selection)
+            values['_v%d' % i] = value
+            labels[call[5]] = value
+        self.changed = False
+        return (eval(self.code, {'__builtins__': {}}, values), labels)
+
+    def run_test(self):
+        if not self.changed and self.tests_run > 0:
+            # none of our monitors has started or stopped failing
+            if self.error_count > 0:
+                return self.record_fail(self.last_result)
+            return self.record_success(self.last_result)
+        (result, labels) = self.evaluate()
+        message = ", ".join("{0} = {1}".format(label, _format(value)) for (label, value) in sorted(labels.items()))
+        if result:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking this is not true: {0}".format(self.expression)
+
+    def get_params(self):
+        return (self.expression, )
+
+    def __getstate__(self):
+        serialize_dict = Monitor.__getstate__(self)
+        for key in ['mt', 'code', 'tree', 'selections']:
+            serialize_dict.pop(key, None)
+        return serialize_dict
+
+
+class _CallExtractor(ast.NodeTransformer):
+    """Replace the function calls in an expression with variables, _v0 etc.
+
+    The arguments of each call are recorded in the monitor's calls list."""
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    @staticmethod
+    def _string(node):
+        # monitor and group names may be given without quotes
+        if isinstance(node, ast.Name):
+            return node.id
+        value = getattr(node, 'value', getattr(node, 's', None))
+        if isinstance(value, str):
+            return value
+        raise ValueError("expected a monitor name")
+
+    @staticmethod
+    def _number(node):
+        value = getattr(node, 'value', getattr(node, 'n', None))
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        raise ValueError("expected a number")
+
+    def visit_Name(self, node):
+        # the only names allowed outside function calls are the variables we add
+        raise ValueError("unknown name %s" % node.id)
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in AggregateMonitor.FUNCTIONS:
+            raise ValueError("unknown function")
+        function = node.func.id
+        names = []
+        weights = {}
+        options = {'group': None, 'match': None}
+        for arg in node.args:
+            if isinstance(arg, ast.Dict):
+                for (key, value) in zip(arg.keys, arg.values):
+                    weights[self._string(key)] = self._number(value)
+            else:
+                names.append(self._string(arg))
+        for keyword in node.keywords:
+            if keyword.arg not in options:
+                raise ValueError("unknown argument {0} to {1}".format(keyword.arg, function))
+            options[keyword.arg] = self._string(keyword.value)
+        if not (names or weights or options['group'] or options['match']):
+            raise ValueError("{0} needs some monitors to look at".format(function))
+        if function == 'weighted_failed' and not weights:
+            raise ValueError("weighted_failed needs a dict of weights")
+        arguments = [repr(name) for name in names]
+        if weights:
+            arguments.append(repr(weights))
+        arguments.extend('{0}={1}'.format(key, value) for (key, value) in sorted(options.items()) if value is not None)
+        label = "{0}({1})".format(function, ", ".join(arguments))
+        variable = ast.copy_location(ast.Name(id='_v%d' % len(self.monitor.calls), ctx=ast.Load()), node)
+        self.monitor.calls.append((function, names, options['group'], options['match'], weights, label))
+        return variable
@@ -1,10 +1,12 @@
 # coding=utf-8
 """ File-based monitors for SimpleMonitor. """
 
+import errno
 import os
 import os.path
 import time
 
+from . import watch
 from .monitor import Monitor, register
 
 
@@ -14,22 +16,18 @@ class MonitorBackup(Monitor):
     filename = os.path.join("C:\\", "Program Files", "VERITAS", "Backup Exec", "status.txt")
 
     def run_test(self):
-        if not os.path.exists(self.filename):
-            return self.record_fail("Status file missing")
-
         try:
-            fh = open(self.filename, "r")
-        except Exception:
+            contents = watch.read(self.filename)
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return self.record_fail("Status file missing")
             return self.record_fail("Unable to open status file")
 
         try:
-            status = fh.readline()
-            timestamp = fh.readline()
+            (status, timestamp) = contents.decode().splitlines()[:2]
         except Exception:
             return self.record_fail("Unable to read data from status file")
 
-        fh.close()
-
         status = status.strip()
         timestamp = int(timestamp.strip())
 
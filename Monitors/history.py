@@ -0,0 +1,90 @@
+# coding=utf-8
+"""A fixed-size history of a monitor's recent results.
+
+Each monitor with history enabled keeps a ring buffer of its last N runs,
+recording when each ran, whether it succeeded and how long it took. The
+buffer is allocated up front, so adding a result is O(1), and loggers can
+ask it for availability and latency percentiles without needing a
+database."""
+
+import math
+
+from array import array
+
+
+class ResultHistory(object):
+    """Ring buffer of (timestamp, success, duration) for the last size runs."""
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("history size must be at least 1")
+        self.size = size
+        self.timestamps = array('d', [0.0]) * size
+        self.durations = array('d', [0.0]) * size
+        self.outcomes = array('B', [0]) * size
+        # index of the next slot to write, and how many slots are in use
+        self.position = 0
+        self.count = 0
+        self.successes = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, success, duration):
+        """Record the result of a run."""
+        position = self.position
+        if self.count == self.size:
+            self.successes -= self.outcomes[position]
+        else:
+            self.count += 1
+        success = 1 if success else 0
+        self.timestamps[position] = timestamp
+        self.outcomes[position] = success
+        self.durations[position] = duration
+        self.successes += success
+        self.position = (position + 1) % self.size
+
+    def _order(self):
+        """Slot indexes, oldest first."""
+        start = (self.position - self.count) % self.size
+        return [(start + i) % self.size for i in range(self.count)]
+
+    def results(self):
+        """List the recorded results as (timestamp, success, duration), oldest first."""
+        return [
+            (self.timestamps[i], bool(self.outcomes[i]), self.durations[i])
+            for i in self._order()
+        ]
+
+    def availability(self):
+        """Fraction of the recorded runs which succeeded, or None if there are none."""
+        if self.count == 0:
+            return None
+        return self.successes / float(self.count)
+
+    def percentiles(self, wanted=(50, 95, 99)):
+        """Get the given percentiles of the recorded durations.
+
+        Uses the nearest-rank method. Returns a dict of percentile -> duration,
+        which is empty if nothing has been recorded."""
+        if self.count == 0:
+            return {}
+        if self.count == self.size:
+            durations = sorted(self.durations)
+        else:
+            durations = sorted(self.durations[i] for i in self._order())
+        result = {}
+        for p in wanted:
+            rank = max(int(math.ceil(p / 100.0 * self.count)), 1)
+            result[p] = durations[rank - 1]
+        return result
+
+    def percentile(self, p):
+        return self.percentiles((p, )).get(p)
+
+    def summary(self):
+        """A dict of the availability and p50/p95/p99 durations, for loggers."""
+        summary = {'runs': self.count, 'availability': self.availability()}
+        for (p, value) in self.percentiles().items():
+            summary['p%d' % p] = value
+        return summary
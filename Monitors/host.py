@@ -4,6 +4,8 @@ import subprocess
 import time
 import shlex
 import sys
+import fnmatch
+import threading
 
 try:
     import win32api
@@ -11,6 +13,9 @@ try:
 except ImportError:
     win32_available = False
 
+from util import MonitorConfigurationError, in_loop, loop_time, monotonic_ns
+
+from . import process, watch
 from .monitor import Monitor, register
 
 
@@ -51,11 +56,134 @@ def _bytes_to_size_string(b):
         return str(b)
 
 
+class _StatvfsSample(object):
+    """A statvfs() call, running in its own thread so it can't block us."""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = monotonic_ns()
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        thread = threading.Thread(target=self._run, name="statvfs %s" % path)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        try:
+            self.result = os.statvfs(self.path)
+        except OSError as e:
+            self.error = e
+        self.done.set()
+
+
+class DiskSampler(object):
+    """Takes statvfs() samples for all the partitions our monitors check.
+
+    On the first request in a loop, every known partition is sampled at once,
+    each in its own thread; the samples are then shared for the rest of the
+    loop. A filesystem which doesn't answer (e.g. a dead NFS mount) only
+    holds up the monitors checking it, and only until their timeout. While its
+    sample stays stuck, no more are started for it, and later loops report it
+    straight away."""
+
+    MOUNTINFO = '/proc/self/mountinfo'
+
+    def __init__(self):
+        # partition -> the number of monitors checking it
+        self.partitions = {}
+        self.samples = {}
+        self.loop = None
+        self.mount_points_cache = None
+
+    def add(self, partition):
+        self.partitions[partition] = self.partitions.get(partition, 0) + 1
+
+    def remove(self, partition):
+        """A monitor has stopped checking a partition."""
+        count = self.partitions.get(partition, 0) - 1
+        if count > 0:
+            self.partitions[partition] = count
+        else:
+            self.partitions.pop(partition, None)
+
+    def mount_points(self):
+        """Get the mount points from /proc/self/mountinfo, read once per loop."""
+        now = loop_time()
+        if self.mount_points_cache is not None and self.mount_points_cache[0] == now:
+            return self.mount_points_cache[1]
+        mount_points = []
+        with open(self.MOUNTINFO, 'rb') as mountinfo:
+            for line in mountinfo:
+                fields = line.split()
+                if len(fields) > 4:
+                    # spaces etc are escaped as octal, e.g. \040
+                    mount_point = re.sub(
+                        br'\\([0-7]{3})',
+                        lambda m: bytes(bytearray([int(m.group(1), 8)])),
+                        fields[4])
+                    mount_points.append(mount_point.decode('utf-8', 'replace'))
+        self.mount_points_cache = (now, mount_points)
+        return mount_points
+
+    def expand(self, partition):
+        """Get the mount points matching a partition, which may be a glob."""
+        if is_glob(partition):
+            return sorted(set(fnmatch.filter(self.mount_points(), partition)))
+        return [partition]
+
+    def _sample(self, path):
+        sample = self.samples.get(path)
+        if sample is None or sample.done.is_set():
+            sample = self.samples[path] = _StatvfsSample(path)
+        return sample
+
+    def _start_loop(self):
+        now = loop_time()
+        if self.loop == now:
+            return
+        self.loop = now
+        for partition in self.partitions:
+            try:
+                paths = self.expand(partition)
+            except (IOError, OSError):
+                continue
+            for path in paths:
+                self._sample(path)
+
+    def statvfs(self, path, timeout):
+        """Get the statvfs() result for a path, within timeout seconds."""
+        if in_loop():
+            self._start_loop()
+            sample = self.samples.get(path)
+            if sample is None:
+                sample = self._sample(path)
+        else:
+            sample = self._sample(path)
+        if not sample.done.is_set():
+            waited = (monotonic_ns() - sample.started) / 1000000000.0
+            if waited > timeout or not sample.done.wait(timeout - waited):
+                raise OSError("statvfs on %s has not returned after %0.1fs" % (
+                    path, (monotonic_ns() - sample.started) / 1000000000.0))
+        if sample.error is not None:
+            raise sample.error
+        return sample.result
+
+
+disk_sampler = DiskSampler()
+
+
+def is_glob(path):
+    return any(c in path for c in '*?[')
+
+
 @register
 class MonitorDiskSpace(Monitor):
-    """Make sure we have enough disk space."""
+    """Make sure we have enough disk space (and inodes)."""
 
     type = "diskspace"
+    limit = None
+    max_inodes_used = None
 
     def __init__(self, name, config_options):
         Monitor.__init__(self, name, config_options)
@@ -66,28 +194,104 @@ class MonitorDiskSpace(Monitor):
         else:
             self.use_statvfs = True
         self.partition = Monitor.get_config_option(config_options, 'partition', required=True)
-        self.limit = _size_string_to_bytes(Monitor.get_config_option(config_options, 'limit', required=True))
+        self.max_inodes_used = Monitor.get_config_option(
+            config_options,
+            'max_inodes_used',
+            required_type='float',
+            minimum=0,
+            maximum=100
+        )
+        self.limit = _size_string_to_bytes(Monitor.get_config_option(
+            config_options,
+            'limit',
+            required=self.max_inodes_used is None
+        ))
+        self.timeout = Monitor.get_config_option(
+            config_options,
+            'timeout',
+            required_type='float',
+            minimum=0,
+            default=5
+        )
+        if is_glob(self.partition) and not self.use_statvfs:
+            raise MonitorConfigurationError("partition globs are not supported on Windows")
+        if self.use_statvfs:
+            disk_sampler.add(self.partition)
+
+    def retire(self):
+        if self.use_statvfs:
+            disk_sampler.remove(self.partition)
+
+    def check_partition(self, partition):
+        """Returns (ok, message) for one partition, or None if it has no
+        space at all (e.g. /proc)."""
+        inodes_used = None
+        if self.use_statvfs:
+            result = disk_sampler.statvfs(partition, self.timeout)
+            if result.f_blocks == 0:
+                return None
+            space = result.f_bavail * result.f_frsize
+            percent = float(result.f_bavail) / float(result.f_blocks) * 100
+            if result.f_files:
+                inodes_used = 100 - float(result.f_favail) / float(result.f_files) * 100
+        else:
+            result = win32api.GetDiskFreeSpaceEx(partition)
+            space = result[2]
+            percent = float(result[2]) / float(result[1]) * 100
+
+        message = "%s free (%d%%)" % (_bytes_to_size_string(space), percent)
+        ok = self.limit is None or space > self.limit
+        if self.max_inodes_used is not None and inodes_used is not None:
+            message += ", %d%% inodes used" % inodes_used
+            if inodes_used > self.max_inodes_used:
+                ok = False
+        return (ok, message)
 
     def run_test(self):
+        if not is_glob(self.partition):
+            try:
+                result = self.check_partition(self.partition)
+            except Exception as e:
+                return self.record_fail("Couldn't get free disk space: %s" % e)
+            if result is None:
+                return self.record_fail("Couldn't get free disk space: %s has no blocks" % self.partition)
+            (ok, message) = result
+            if ok:
+                return self.record_success(message)
+            return self.record_fail(message)
+
         try:
-            if self.use_statvfs:
-                result = os.statvfs(self.partition)
-                space = result.f_bavail * result.f_frsize
-                percent = float(result.f_bavail) / float(result.f_blocks) * 100
-            else:
-                result = win32api.GetDiskFreeSpaceEx(self.partition)
-                space = result[2]
-                percent = float(result[2]) / float(result[1]) * 100
+            partitions = disk_sampler.expand(self.partition)
         except Exception as e:
-            return self.record_fail("Couldn't get free disk space: %s" % e)
-
-        if space <= self.limit:
-            return self.record_fail("%s free (%d%%)" % (_bytes_to_size_string(space), percent))
-        return self.record_success("%s free (%d%%)" % (_bytes_to_size_string(space), percent))
+            return self.record_fail("Couldn't read mount points: %s" % e)
+        if not partitions:
+            return self.record_fail("No mount points match %s" % self.partition)
+        failures = []
+        checked = 0
+        for partition in partitions:
+            try:
+                result = self.check_partition(partition)
+            except Exception as e:
+                result = (False, "couldn't get free disk space: %s" % e)
+            if result is None:
+                # a pseudo-filesystem; there's nothing to check
+                continue
+            checked += 1
+            (ok, message) = result
+            if not ok:
+                failures.append("%s: %s" % (partition, message))
+        if failures:
+            return self.record_fail("; ".join(failures))
+        return self.record_success("%d partitions ok" % checked)
 
     def describe(self):
         """Explains what we do."""
-        return "Checking for at least %s free space on %s" % (_bytes_to_size_string(self.limit), self.partition)
+        checks = []
+        if self.limit is not None:
+            checks.append("at least %s free space" % _bytes_to_size_string(self.limit))
+        if self.max_inodes_used is not None:
+            checks.append("no more than %d%% inodes used" % self.max_inodes_used)
+        return "Checking for %s on %s" % (" and ".join(checks), self.partition)
 
     def get_params(self):
         return (self.limit, self.partition)
@@ -117,7 +321,7 @@ class MonitorFileStat(Monitor):
 
     def run_test(self):
         try:
-            statinfo = os.stat(self.filename)
+            statinfo = watch.stat(self.filename)
         except Exception as e:
             return self.record_fail("Unable to check file: %s" % e)
 
@@ -155,6 +359,7 @@ class MonitorApcupsd(Monitor):
     """
 
     type = "apcupsd"
+    runs_commands = True
 
     path = ""
     regexp = re.compile("STATUS +: (.+)")
@@ -173,7 +378,7 @@ class MonitorApcupsd(Monitor):
             else:
                 executable = "apcaccess"
         try:
-            output = subprocess.check_output(executable)
+            output = process.check_output(executable, self.cache_lifetime)
             output = output.decode('utf-8')
         except subprocess.CalledProcessError as e:
             output = e.output
@@ -218,6 +423,7 @@ class MonitorPortAudit(Monitor):
     """Check a host doesn't have outstanding security issues."""
 
     type = "portaudit"
+    runs_commands = True
     regexp = re.compile(r"(\d+) problem\(s\) in your installed packages found")
     path = ""
 
@@ -237,7 +443,7 @@ class MonitorPortAudit(Monitor):
             if self.path == "":
                 self.path = "/usr/local/sbin/portaudit"
             try:
-                output = subprocess.check_output([self.path, '-a', '-X', '1']).decode('utf-8')
+                output = process.check_output([self.path, '-a', '-X', '1'], self.cache_lifetime).decode('utf-8')
             except subprocess.CalledProcessError as e:
                 output = e.output
             except OSError as e:
@@ -265,6 +471,7 @@ class MonitorPkgAudit(Monitor):
     """Check a host doesn't have outstanding security issues."""
 
     type = "pkgaudit"
+    runs_commands = True
     regexp = re.compile(r"(\d+) problem\(s\) in the installed packages found")
     path = ""
 
@@ -283,7 +490,7 @@ class MonitorPkgAudit(Monitor):
             if self.path == "":
                 self.path = "/usr/local/sbin/pkg"
             try:
-                output = subprocess.check_output([self.path, 'audit']).decode('utf-8')
+                output = process.check_output([self.path, 'audit'], self.cache_lifetime).decode('utf-8')
             except subprocess.CalledProcessError as e:
                 output = e.output
             except OSError as e:
@@ -377,7 +584,7 @@ class MonitorZap(Monitor):
 
     def run_test(self):
         try:
-            output = subprocess.check_output(["ztscan", str(self.span)])
+            output = process.check_output(["ztscan", str(self.span)])
             for line in output:
                 matches = self.r.match(line)
                 if matches:
@@ -409,6 +616,7 @@ class MonitorCommand(Monitor):
     result_max = None
 
     type = "command"
+    runs_commands = True
 
     available = True
 
@@ -447,7 +655,7 @@ class MonitorCommand(Monitor):
         if not self.available:
             return self.record_skip(None)
         try:
-            out = subprocess.check_output(self.command)
+            out = process.check_output(self.command, self.cache_lifetime)
             if self.result_regexp is not None:
                 out = out.decode('utf-8')
                 matches = self.result_regexp.search(out)
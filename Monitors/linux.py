@@ -0,0 +1,449 @@
+# coding=utf-8
+"""Linux host monitors which read /proc and /sys directly.
+
+The files are opened once and re-read with pread(), and each file is only
+read and parsed once per loop of the monitors; every monitor which needs it
+in that loop shares the same sample."""
+
+import fnmatch
+import os
+
+from util import loop_time
+
+from .host import _bytes_to_size_string, _size_string_to_bytes
+from .monitor import Monitor, register
+
+PROC_ROOT = '/proc'
+
+
+class ProcFile(object):
+    """A file under /proc or /sys, kept open and re-read from the start."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.size = 4096
+
+    def read(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        while True:
+            if hasattr(os, 'pread'):
+                data = os.pread(self.fd, self.size, 0)
+            else:  # pragma: no cover
+                # Python 2
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                data = os.read(self.fd, self.size)
+            if len(data) < self.size:
+                return data
+            # the buffer was filled, so there may be more
+            self.size *= 2
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+_files = {}
+# (path, parser) -> (loop time, parsed sample)
+_samples = {}
+
+
+def get_sample(path, parser):
+    """Read and parse a file, sharing the result with everything else
+    asking for the same file and parser in this loop."""
+    now = loop_time()
+    key = (path, parser)
+    cached = _samples.get(key)
+    if cached is not None and cached[0] == now:
+        return cached[1]
+    proc_file = _files.get(path)
+    if proc_file is None:
+        proc_file = _files[path] = ProcFile(path)
+    try:
+        data = proc_file.read()
+    except OSError:
+        # the file may have gone away (e.g. a network interface); try a
+        # fresh open next time
+        proc_file.close()
+        del _files[path]
+        raise
+    sample = parser(data)
+    _samples[key] = (now, sample)
+    return sample
+
+
+def proc_path(*parts):
+    return os.path.join(PROC_ROOT, *parts)
+
+
+def parse_meminfo(data):
+    """Parse /proc/meminfo into a dict of name -> bytes."""
+    result = {}
+    for line in data.split(b'\n'):
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        value = int(fields[1])
+        if len(fields) > 2 and fields[2] == b'kB':
+            value *= 1024
+        result[fields[0].rstrip(b':').decode('ascii')] = value
+    return result
+
+
+def parse_cpu_times(data):
+    """Get (busy, total) jiffies from the cpu line of /proc/stat."""
+    line = data[:data.index(b'\n')]
+    times = [int(x) for x in line.split()[1:]]
+    # idle and iowait are the 4th and 5th fields
+    idle = sum(times[3:5])
+    # guest time is already counted in user and nice
+    total = sum(times[:8])
+    return (total - idle, total)
+
+
+def parse_file_nr(data):
+    """Get (allocated, maximum) file handles from /proc/sys/fs/file-nr."""
+    (allocated, unused, maximum) = data.split()[:3]
+    return (int(allocated) - int(unused), int(maximum))
+
+
+def parse_loadavg(data):
+    """Get (running, total) processes from /proc/loadavg."""
+    (running, total) = data.split()[3].split(b'/')
+    return (int(running), int(total))
+
+
+def parse_net_dev(data):
+    """Parse /proc/net/dev into interface -> (rx errors, rx drops, tx errors, tx drops)."""
+    result = {}
+    for line in data.split(b'\n')[2:]:
+        if b':' not in line:
+            continue
+        (name, counters) = line.split(b':', 1)
+        counters = counters.split()
+        result[name.strip().decode('ascii')] = (
+            int(counters[2]), int(counters[3]), int(counters[10]), int(counters[11])
+        )
+    return result
+
+
+def parse_pressure(data):
+    """Parse a /proc/pressure file into {'some': {'avg10': ...}, 'full': {...}}."""
+    result = {}
+    for line in data.split(b'\n'):
+        fields = line.split()
+        if not fields:
+            continue
+        values = {}
+        for field in fields[1:]:
+            (key, value) = field.split(b'=')
+            values[key.decode('ascii')] = float(value)
+        result[fields[0].decode('ascii')] = values
+    return result
+
+
+def list_process_names():
+    """Get the names (as in /proc/PID/comm) of all running processes, once per loop."""
+    now = loop_time()
+    cached = _samples.get('processes')
+    if cached is not None and cached[0] == now:
+        return cached[1]
+    names = []
+    for entry in os.listdir(PROC_ROOT):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(PROC_ROOT, entry, 'comm'), 'rb') as comm:
+                names.append(comm.read().rstrip(b'\n').decode('utf-8', 'replace'))
+        except (IOError, OSError):
+            # the process went away
+            continue
+    _samples['processes'] = (now, names)
+    return names
+
+
+class ProcMonitor(Monitor):
+    """Base class for the /proc monitors."""
+
+    def run_test(self):
+        try:
+            return self.check()
+        except (IOError, OSError, ValueError, IndexError, KeyError) as e:
+            return self.record_fail("Could not read host information: %s" % e)
+
+    def check(self):
+        raise NotImplementedError
+
+
+@register
+class MonitorMemory(ProcMonitor):
+    """Check there is enough free memory and swap, using /proc/meminfo."""
+
+    type = "memory"
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.min_available = _size_string_to_bytes(Monitor.get_config_option(config_options, 'min_available'))
+        self.max_used = Monitor.get_config_option(
+            config_options,
+            'max_used',
+            required_type='float',
+            minimum=0,
+            maximum=100
+        )
+        self.max_swap_used = Monitor.get_config_option(
+            config_options,
+            'max_swap_used',
+            required_type='float',
+            minimum=0,
+            maximum=100
+        )
+
+    def check(self):
+        meminfo = get_sample(proc_path('meminfo'), parse_meminfo)
+        total = meminfo['MemTotal']
+        available = meminfo['MemAvailable']
+        used = 100.0 * (total - available) / total
+        swap_total = meminfo.get('SwapTotal', 0)
+        if swap_total:
+            swap_used = 100.0 * (swap_total - meminfo['SwapFree']) / swap_total
+        else:
+            swap_used = 0.0
+        message = "%s available (%0.1f%% used), swap %0.1f%% used" % (
+            _bytes_to_size_string(available), used, swap_used)
+        if self.min_available is not None and available < self.min_available:
+            return self.record_fail(message)
+        if self.max_used is not None and used > self.max_used:
+            return self.record_fail(message)
+        if self.max_swap_used is not None and swap_used > self.max_swap_used:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking memory and swap usage"
+
+    def get_params(self):
+        return (self.min_available, self.max_used, self.max_swap_used)
+
+
+@register
+class MonitorCPU(ProcMonitor):
+    """Check the CPU utilisation (across all CPUs) since the last check isn't too high."""
+
+    type = "cpu"
+    last_times = None
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.max = Monitor.get_config_option(
+            config_options,
+            'max',
+            required_type='float',
+            minimum=0,
+            maximum=100,
+            default=90
+        )
+
+    def check(self):
+        (busy, total) = get_sample(proc_path('stat'), parse_cpu_times)
+        last_times = self.last_times
+        self.last_times = (busy, total)
+        if last_times is None or total <= last_times[1]:
+            return self.record_success("no previous sample")
+        percent = 100.0 * (busy - last_times[0]) / (total - last_times[1])
+        message = "%0.1f%% busy" % percent
+        if percent > self.max:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking CPU utilisation is below %0.1f%%" % self.max
+
+    def get_params(self):
+        return (self.max, )
+
+    def __getstate__(self):
+        serialize_dict = ProcMonitor.__getstate__(self)
+        serialize_dict.pop('last_times', None)
+        return serialize_dict
+
+
+@register
+class MonitorFileDescriptors(ProcMonitor):
+    """Check the system isn't running out of file handles."""
+
+    type = "fds"
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.max_used = Monitor.get_config_option(
+            config_options,
+            'max_used',
+            required_type='float',
+            minimum=0,
+            maximum=100,
+            default=90
+        )
+
+    def check(self):
+        (allocated, maximum) = get_sample(proc_path('sys', 'fs', 'file-nr'), parse_file_nr)
+        used = 100.0 * allocated / maximum
+        message = "%d of %d file handles in use (%0.1f%%)" % (allocated, maximum, used)
+        if used > self.max_used:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking less than %0.1f%% of file handles are in use" % self.max_used
+
+    def get_params(self):
+        return (self.max_used, )
+
+
+@register
+class MonitorProcesses(ProcMonitor):
+    """Check the number of processes, in total or with a given name."""
+
+    type = "processes"
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.process_name = Monitor.get_config_option(config_options, 'name')
+        self.min = Monitor.get_config_option(
+            config_options,
+            'min',
+            required_type='int',
+            minimum=0,
+            default=1 if self.process_name else 0
+        )
+        self.max = Monitor.get_config_option(
+            config_options,
+            'max',
+            required_type='int',
+            minimum=0
+        )
+
+    def check(self):
+        if self.process_name:
+            count = len(fnmatch.filter(list_process_names(), self.process_name))
+            message = "%d %s processes" % (count, self.process_name)
+        else:
+            count = get_sample(proc_path('loadavg'), parse_loadavg)[1]
+            message = "%d processes" % count
+        if count < self.min or (self.max is not None and count > self.max):
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        if self.process_name:
+            return "Checking the number of %s processes" % self.process_name
+        return "Checking the number of processes"
+
+    def get_params(self):
+        return (self.process_name, self.min, self.max)
+
+
+@register
+class MonitorNetworkErrors(ProcMonitor):
+    """Check a network interface isn't seeing errors (or drops)."""
+
+    type = "neterrors"
+    last_counters = None
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.interface = Monitor.get_config_option(config_options, 'interface', required=True)
+        self.max_errors = Monitor.get_config_option(
+            config_options,
+            'max_errors',
+            required_type='int',
+            minimum=0,
+            default=0
+        )
+        self.include_drops = Monitor.get_config_option(
+            config_options,
+            'include_drops',
+            required_type='bool',
+            default=False
+        )
+
+    def check(self):
+        interfaces = get_sample(proc_path('net', 'dev'), parse_net_dev)
+        if self.interface not in interfaces:
+            return self.record_fail("No interface %s" % self.interface)
+        (rx_errors, rx_drops, tx_errors, tx_drops) = interfaces[self.interface]
+        counters = rx_errors + tx_errors
+        if self.include_drops:
+            counters += rx_drops + tx_drops
+        last_counters = self.last_counters
+        self.last_counters = counters
+        if last_counters is None or counters < last_counters:
+            return self.record_success("no previous sample")
+        errors = counters - last_counters
+        message = "%d errors since last check" % errors
+        if errors > self.max_errors:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking interface %s has no more than %d errors between checks" % (self.interface, self.max_errors)
+
+    def get_params(self):
+        return (self.interface, self.max_errors, self.include_drops)
+
+    def __getstate__(self):
+        serialize_dict = ProcMonitor.__getstate__(self)
+        serialize_dict.pop('last_counters', None)
+        return serialize_dict
+
+
+@register
+class MonitorPressure(ProcMonitor):
+    """Check the kernel's pressure stall information (PSI) for a resource."""
+
+    type = "pressure"
+
+    def __init__(self, name, config_options):
+        ProcMonitor.__init__(self, name, config_options)
+        self.resource = Monitor.get_config_option(
+            config_options,
+            'resource',
+            default='cpu',
+            allowed_values=['cpu', 'memory', 'io']
+        )
+        self.kind = Monitor.get_config_option(
+            config_options,
+            'kind',
+            default='some',
+            allowed_values=['some', 'full']
+        )
+        self.window = Monitor.get_config_option(
+            config_options,
+            'window',
+            default='avg60',
+            allowed_values=['avg10', 'avg60', 'avg300']
+        )
+        self.max = Monitor.get_config_option(
+            config_options,
+            'max',
+            required_type='float',
+            minimum=0,
+            maximum=100,
+            required=True
+        )
+
+    def check(self):
+        pressure = get_sample(proc_path('pressure', self.resource), parse_pressure)
+        value = pressure[self.kind][self.window]
+        message = "%s %s %s pressure %0.2f%%" % (self.resource, self.kind, self.window, value)
+        if value > self.max:
+            return self.record_fail(message)
+        return self.record_success(message)
+
+    def describe(self):
+        return "Checking %s %s pressure (%s) is below %0.2f%%" % (self.resource, self.kind, self.window, self.max)
+
+    def get_params(self):
+        return (self.resource, self.kind, self.window, self.max)
@@ -13,8 +13,6 @@ functions.
 import platform
 import sys
 import datetime
-import time
-import copy
 import subprocess
 import logging
 
@@ -24,105 +22,203 @@ try:
 except ImportError:
     win32_available = False
 
-from util import get_config_option, MonitorConfigurationError, short_hostname
+from util import ConfigOption, get_config_option, MonitorConfigurationError, short_hostname
 from util import subclass_dict_handler
+from util import loop_time, timestamp_to_datetime, datetime_to_timestamp
+
+from .history import ResultHistory
+
+
+def _timestamp_property(slot):
+    def getter(self):
+        return timestamp_to_datetime(getattr(self, slot))
+
+    def setter(self, value):
+        if isinstance(value, datetime.datetime):
+            value = datetime_to_timestamp(value)
+        setattr(self, slot, value)
+
+    return property(getter, setter)
+
+
+class MonitorState(object):
+    """The results a monitor has recorded so far.
+
+    This is kept apart from the monitor's configuration so it can be copied
+    or serialized cheaply.
+
+    Times are kept as UNIX timestamps, and only turned into (UTC) datetimes
+    when they are read."""
+
+    # the fields which make up the state, as seen from outside
+    FIELDS = (
+        'last_result',
+        'error_count',
+        'last_error_count',
+        'success_count',
+        'tests_run',
+        'failed_at',
+        'failures',
+        'last_failure',
+        # this is the time we last received data into this monitor (if we're remote)
+        'last_update',
+        'last_run',
+        'last_run_duration',
+        'was_skipped',
+        'skip_dep',
+        'recover_info',
+    )
+
+    __slots__ = (
+        'last_result',
+        'error_count',
+        'last_error_count',
+        'success_count',
+        'tests_run',
+        'failed_at_time',
+        'failures',
+        'last_failure_time',
+        'last_update_time',
+        'last_run',
+        'last_run_duration',
+        'was_skipped',
+        'skip_dep',
+        'recover_info',
+    )
+
+    failed_at = _timestamp_property('failed_at_time')
+    last_failure = _timestamp_property('last_failure_time')
+    last_update = _timestamp_property('last_update_time')
+
+    def __init__(self):
+        self.last_result = ""
+        self.error_count = 0
+        self.last_error_count = 0
+        self.success_count = 0
+        self.tests_run = 0
+        self.failed_at_time = None
+        self.failures = 0
+        self.last_failure_time = None
+        self.last_update_time = None
+        self.last_run = 0
+        self.last_run_duration = 0
+        self.was_skipped = False
+        self.skip_dep = None
+        self.recover_info = ""
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in MonitorState.FIELDS)
+
+    def update(self, state_dict):
+        """Load any of our fields present in the given dict."""
+        for field in MonitorState.FIELDS:
+            if field in state_dict:
+                setattr(self, field, state_dict[field])
+
+    def config_changed(self, monitor):
+        """Called when the monitor's tolerance, urgency or notify setting changes."""
+        pass
+
+    def copy(self):
+        state = MonitorState.__new__(MonitorState)
+        for field in MonitorState.__slots__:
+            setattr(state, field, getattr(self, field))
+        return state
+
+
+def _state_property(field):
+    def getter(self):
+        return getattr(self.run_state, field)
+
+    def setter(self, value):
+        setattr(self.run_state, field, value)
+
+    return property(getter, setter, doc="Shortcut to run_state.%s" % field)
 
 
-class Monitor:
+class Monitor(object):
     """Simple monitor. This class is abstract."""
 
-    last_result = ""
     type = "unknown"
-    error_count = 0
     tolerance = 0
-    failed_at = None
-    success_count = 0
-    tests_run = 0
-    last_error_count = 0
-    last_run_duration = 0
 
     minimum_gap = 0
-    last_run = 0
 
     urgent = 1
     notify = True
     group = 'default'
 
-    failures = 0
-    last_failure = None
-
-    # this is the time we last received data into this monitor (if we're remote)
-    last_update = None
-
     # we set this to true if we want a remote instance to do our alerts for us
     remote_alerting = False
 
-    # dependencies holds master list
-    _dependencies = []
+    # dependencies holds master list, deps holds temporary list; both are set
+    # per instance by set_dependencies()
+    _dependencies = ()
+    deps = ()
+
+    # monitors which must have run (whatever their result) before we do; set
+    # per instance by set_run_after()
+    _run_after = ()
+
+    # callables to tell when we start or stop failing past our tolerance; see
+    # add_failure_listener()
+    _failure_listeners = ()
 
-    # deps holds temporary list
-    deps = []
+    # set to True by monitors which look at other monitors' results, which
+    # must be remade whenever the configuration is reloaded
+    watches_monitors = False
+
+    # set to True by monitors which run a command, using process.check_output();
+    # they take the cache_lifetime option
+    runs_commands = False
+
+    # seconds to keep reusing our command's output for; 0 means run it every time
+    cache_lifetime = 0
 
     name = "unnamed"
 
     recover_command = ""
-    recover_info = ""
+
+    # a ResultHistory of our recent runs, if enabled
+    history = None
+
+    # the options all monitors take, compiled once
+    OPTIONS = dict((option.key, option) for option in [
+        ConfigOption('depend', required_type='[str]', default=(), exception=MonitorConfigurationError),
+        ConfigOption('urgent', required_type='bool', default=True, exception=MonitorConfigurationError),
+        ConfigOption('notify', required_type='bool', default=True, exception=MonitorConfigurationError),
+        ConfigOption('group', default='default', exception=MonitorConfigurationError),
+        ConfigOption('tolerance', required_type='int', default=0, minimum=0, exception=MonitorConfigurationError),
+        ConfigOption('remote_alert', required_type='bool', default=False, exception=MonitorConfigurationError),
+        ConfigOption('recover_command', exception=MonitorConfigurationError),
+        ConfigOption('gap', required_type='int', default=0, minimum=0, exception=MonitorConfigurationError),
+        ConfigOption('history', required_type='int', default=0, minimum=0, exception=MonitorConfigurationError),
+        # only read by monitors which run commands (see runs_commands)
+        ConfigOption('cache_lifetime', required_type='int', default=0, minimum=0, exception=MonitorConfigurationError),
+    ])
 
     def __init__(self, name="unnamed", config_options=None):
         """What's that coming over the hill? Is a monitor?"""
         if config_options is None:
             config_options = {}
+        self.run_state = MonitorState()
         self.name = name
         self.monitor_logger = logging.getLogger('simplemonitor.monitor-' + self.name)
-        self.set_dependencies(Monitor.get_config_option(
-            config_options,
-            'depend',
-            required_type='[str]',
-            default=list()
-        ))
-        self.set_urgency(Monitor.get_config_option(
-            config_options,
-            'urgent',
-            required_type='bool',
-            default=True
-        ))
-        self.set_notify(Monitor.get_config_option(
-            config_options,
-            'notify',
-            required_type='bool',
-            default=True
-        ))
-        self.set_group(Monitor.get_config_option(
-            config_options,
-            'group',
-            default='default'
-        ))
-        self.set_tolerance(Monitor.get_config_option(
-            config_options,
-            'tolerance',
-            required_type='int',
-            default=0,
-            minimum=0
-        ))
-        self.set_remote_alerting(Monitor.get_config_option(
-            config_options,
-            'remote_alert',
-            required_type='bool',
-            default=False
-        ))
-        self.set_recover_command(Monitor.get_config_option(
-            config_options,
-            'recover_command'
-        ))
-        self.set_gap(Monitor.get_config_option(
-            config_options,
-            'gap',
-            required_type='int',
-            minimum=0,
-            default=0
-        ))
+        options = Monitor.OPTIONS
+        self.set_dependencies(options['depend'].get(config_options))
+        self.set_urgency(options['urgent'].get(config_options))
+        self.set_notify(options['notify'].get(config_options))
+        self.set_group(options['group'].get(config_options))
+        self.set_tolerance(options['tolerance'].get(config_options))
+        self.set_remote_alerting(options['remote_alert'].get(config_options))
+        self.set_recover_command(options['recover_command'].get(config_options))
+        self.set_gap(options['gap'].get(config_options))
+        history_size = options['history'].get(config_options)
+        if history_size:
+            self.history = ResultHistory(history_size)
+        if self.runs_commands:
+            self.cache_lifetime = options['cache_lifetime'].get(config_options)
         self.running_on = short_hostname()
-        self.was_skipped = False
 
     @staticmethod
     def get_config_option(config_options, key, **kwargs):
@@ -183,7 +279,7 @@ class Monitor:
 
     def reset_dependencies(self):
         """Reset the monitor's dependency list back to default."""
-        self.deps = copy.copy(self._dependencies)
+        self.deps = list(self._dependencies)
 
     def dependency_succeeded(self, dependency):
         """Remove a dependency from the current version of the list."""
@@ -201,6 +297,28 @@ class Monitor:
         self._dependencies = dependencies
         self.reset_dependencies()
 
+    def set_run_after(self, monitors):
+        """Make sure we run after the given monitors, without depending on them succeeding."""
+        self._run_after = tuple(monitors)
+
+    def get_run_after(self):
+        return self._run_after
+
+    def get_watched_monitors(self):
+        """Return the names of the monitors we look at, which must exist (see watches_monitors)."""
+        return ()
+
+    def add_failure_listener(self, listener):
+        """Call listener(monitor, failing) when we start or stop failing past our tolerance."""
+        self._failure_listeners = self._failure_listeners + (listener, )
+
+    def clear_failure_listeners(self):
+        self._failure_listeners = ()
+
+    def _failing_changed(self, failing):
+        for listener in self._failure_listeners:
+            listener(self, failing)
+
     def log_result(self, name, logger):
         """Save our latest result to the logger.
 
@@ -236,7 +354,12 @@ class Monitor:
 
     def set_tolerance(self, tolerance):
         """Set our tolerance."""
+        if self._failure_listeners:
+            was_failing = self.virtual_fail_count() > 0
         self.tolerance = tolerance
+        self.run_state.config_changed(self)
+        if self._failure_listeners and was_failing != (self.virtual_fail_count() > 0):
+            self._failing_changed(not was_failing)
 
     def set_gap(self, gap):
         """Set our minimum gap."""
@@ -264,31 +387,44 @@ class Monitor:
 
     def record_fail(self, message=""):
         """Update internal state to show that we had a failure."""
-        self.error_count += 1
-        self.last_update = datetime.datetime.utcnow()
-        self.last_result = str(message)
+        state = self.run_state
+        now = loop_time()
+        state.error_count += 1
+        state.last_update_time = now
+        state.last_result = str(message)
         if self.virtual_fail_count() == 1:
-            self.failed_at = datetime.datetime.utcnow()
-            self.last_failure = datetime.datetime.utcnow()
-            self.failures += 1
-        self.success_count = 0
-        self.tests_run += 1
-        self.was_skipped = False
+            state.failed_at_time = now
+            state.last_failure_time = now
+            state.failures += 1
+            if self._failure_listeners:
+                self._failing_changed(True)
+        state.success_count = 0
+        state.tests_run += 1
+        state.was_skipped = False
         return False
 
     def record_success(self, message=""):
         """Update internal state to show we had a success."""
-        if self.error_count > 0:
-            self.last_error_count = self.error_count
-        self.error_count = 0
-        self.last_update = datetime.datetime.utcnow()
-        self.last_result = ""
-        self.success_count += 1
-        self.tests_run += 1
-        self.was_skipped = False
-        self.last_result = message
+        state = self.run_state
+        was_failing = state.error_count > self.tolerance
+        if state.error_count > 0:
+            state.last_error_count = state.error_count
+        state.error_count = 0
+        state.last_update_time = loop_time()
+        state.success_count += 1
+        state.tests_run += 1
+        state.was_skipped = False
+        state.last_result = message
+        if was_failing and self._failure_listeners:
+            self._failing_changed(False)
         return True
 
+    def record_run(self, duration):
+        """Record that our test ran and how long it took (in seconds)."""
+        self.last_run_duration = duration
+        if self.history is not None:
+            self.history.append(loop_time(), self.error_count == 0, duration)
+
     def record_skip(self, which_dep):
         """Record that we were skipped.
 
@@ -352,10 +488,12 @@ class Monitor:
             urgency = False
 
         self.urgent = urgency
+        self.run_state.config_changed(self)
 
     def set_notify(self, notify):
         """Record if this monitor needs notifications."""
         self.notify = notify
+        self.run_state.config_changed(self)
 
     def set_group(self, group):
         """Record if this monitor has a group."""
@@ -367,7 +505,7 @@ class Monitor:
         We always run if the minimum gap is 0, or if we're currently failing.
         Otherwise, we run if the last time we ran was more than minimum_gap seconds ago.
         """
-        now = int(time.time())
+        now = int(loop_time())
         if self.minimum_gap == 0:
             self.last_run = now
             return True
@@ -409,16 +547,42 @@ class Monitor:
         """ any post config setup needed """
         pass
 
+    def retire(self):
+        """Called when we're removed from the configuration, or replaced by a new monitor on reload."""
+        pass
+
+    def take_state(self, monitor):
+        """Carry on from where another monitor (which we are replacing) got to.
+
+        Its recorded results are copied, as is its history if ours is the same size."""
+        self.run_state.update(monitor.run_state.to_dict())
+        self.run_state.config_changed(self)
+        if self.history is not None and monitor.history is not None and self.history.size == monitor.history.size:
+            self.history = monitor.history
+
     def __getstate__(self):
         """Loggers (the Python kind, not the SimpleMonitor kind) can't be serialized.
         In order to work around that, we omit them when getting serialized (for
         being sent over the network).
+
+        Our state is flattened into the same dict as our configuration, which
+        is the format remote instances expect.
         """
         serialize_dict = dict(self.__dict__)
         del serialize_dict['monitor_logger']
+        del serialize_dict['run_state']
+        serialize_dict.pop('history', None)
+        serialize_dict.pop('_failure_listeners', None)
+        serialize_dict.update(self.run_state.to_dict())
         return serialize_dict
 
     def __setstate__(self, state):
+        state = dict(state)
+        if 'run_state' not in self.__dict__:
+            self.run_state = MonitorState()
+        self.run_state.update(state)
+        for field in MonitorState.FIELDS:
+            state.pop(field, None)
         self.__dict__.update(state)
         self._set_monitor_logger()
 
@@ -452,8 +616,44 @@ class Monitor:
         return self.describe()
 
 
+for _field in MonitorState.FIELDS:
+    setattr(Monitor, _field, _state_property(_field))
+
+
+# the modules defining each type, imported when the type is first used
+MODULES = {
+    'backup': 'Monitors.file',
+    'compound': 'Monitors.compound',
+    'aggregate': 'Monitors.compound',
+    'hass_sensor': 'Monitors.hass',
+    'diskspace': 'Monitors.host',
+    'filestat': 'Monitors.host',
+    'apcupsd': 'Monitors.host',
+    'portaudit': 'Monitors.host',
+    'pkgaudit': 'Monitors.host',
+    'loadavg': 'Monitors.host',
+    'zap': 'Monitors.host',
+    'command': 'Monitors.host',
+    'memory': 'Monitors.linux',
+    'cpu': 'Monitors.linux',
+    'fds': 'Monitors.linux',
+    'processes': 'Monitors.linux',
+    'neterrors': 'Monitors.linux',
+    'pressure': 'Monitors.linux',
+    'http': 'Monitors.network',
+    'tcp': 'Monitors.network',
+    'host': 'Monitors.network',
+    'dns': 'Monitors.network',
+    'svc': 'Monitors.service',
+    'service': 'Monitors.service',
+    'rc': 'Monitors.service',
+    'systemd-unit': 'Monitors.service',
+    'eximqueue': 'Monitors.service',
+    'dhcpscope': 'Monitors.service',
+}
+
 (register, get_class, all_types) = subclass_dict_handler(
-    'simplemonitor.Monitors.monitor', Monitor)
+    'simplemonitor.Monitors.monitor', Monitor, MODULES, 'simplemonitor.monitors')
 
 
 @register
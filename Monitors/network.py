@@ -4,16 +4,80 @@
 import re
 import sys
 import socket
-import datetime
 import subprocess
 import requests
 from requests.auth import HTTPBasicAuth
 
+from util import monotonic_ns
+
+from .history import ResultHistory
+from . import process
 from .monitor import Monitor, register
 
 
+class LatencyMonitor(Monitor):
+    """A network monitor which can also fail when responses are too slow.
+
+    With max_latency set, the monitor fails when a response takes longer than
+    that many seconds. With latency_percentile also set, it instead fails when
+    that percentile of the response times over the last latency_window
+    responses is above max_latency, so a few slow responses don't cause a
+    failure but a general slow-down does."""
+
+    max_latency = None
+    latency_percentile = None
+    latencies = None
+
+    def __init__(self, name, config_options):
+        Monitor.__init__(self, name, config_options)
+        self.max_latency = Monitor.get_config_option(
+            config_options,
+            'max_latency',
+            required_type='float',
+            minimum=0
+        )
+        self.latency_percentile = Monitor.get_config_option(
+            config_options,
+            'latency_percentile',
+            required_type='int',
+            minimum=1,
+            maximum=100
+        )
+        latency_window = Monitor.get_config_option(
+            config_options,
+            'latency_window',
+            required_type='int',
+            minimum=1,
+            default=10
+        )
+        if self.max_latency is not None and self.latency_percentile is not None:
+            self.latencies = ResultHistory(latency_window)
+
+    def check_latency(self, latency):
+        """Check a response time (in seconds) against our threshold.
+
+        Returns a failure message if it is too slow, or None."""
+        if self.max_latency is None:
+            return None
+        if self.latencies is None:
+            if latency > self.max_latency:
+                return "latency %0.3fs is above %0.3fs" % (latency, self.max_latency)
+            return None
+        self.latencies.append(0, True, latency)
+        value = self.latencies.percentile(self.latency_percentile)
+        if value > self.max_latency:
+            return "p%d latency over the last %d responses is %0.3fs, above %0.3fs" % (
+                self.latency_percentile, len(self.latencies), value, self.max_latency)
+        return None
+
+    def __getstate__(self):
+        serialize_dict = Monitor.__getstate__(self)
+        serialize_dict.pop('latencies', None)
+        return serialize_dict
+
+
 @register
-class MonitorHTTP(Monitor):
+class MonitorHTTP(LatencyMonitor):
     """Check an HTTP server is working right.
 
     We can either check that we get a 200 OK back, or we can check for a regexp match in the page.
@@ -31,7 +95,7 @@ class MonitorHTTP(Monitor):
     keyfile = None
 
     def __init__(self, name, config_options):
-        Monitor.__init__(self, name, config_options)
+        LatencyMonitor.__init__(self, name, config_options)
         self.url = Monitor.get_config_option(config_options, 'url', required=True)
 
         regexp = Monitor.get_config_option(config_options, 'regexp')
@@ -75,8 +139,7 @@ class MonitorHTTP(Monitor):
         self.password = config_options.get('password')
 
     def run_test(self):
-        start_time = datetime.datetime.now()
-        end_time = None
+        start_time = monotonic_ns()
         try:
             if self.certfile is None and self.username is None:
                 r = requests.get(self.url,
@@ -99,15 +162,14 @@ class MonitorHTTP(Monitor):
                                  verify=self.verify_hostname
                                  )
 
-            end_time = datetime.datetime.now()
-            load_time = end_time - start_time
+            load_time = (monotonic_ns() - start_time) / 1000000000.0
             if r.status_code not in self.allowed_codes:
                 return self.record_fail("Got status '{0} {1}' instead of {2}".format(r.status_code, r.reason, self.allowed_codes))
-            if self.regexp is None:
-                return self.record_success("%s in %0.2fs" % (r.status_code, (load_time.seconds + (load_time.microseconds / 1000000.2))))
-            matches = self.regexp.search(r.text)
-            if matches:
-                return self.record_success("%s in %0.2fs" % (r.status_code, (load_time.seconds + (load_time.microseconds / 1000000.2))))
+            if self.regexp is None or self.regexp.search(r.text):
+                latency_error = self.check_latency(load_time)
+                if latency_error is not None:
+                    return self.record_fail("%s in %0.2fs: %s" % (r.status_code, load_time, latency_error))
+                return self.record_success("%s in %0.2fs" % (r.status_code, load_time))
             return self.record_fail("Got '{0} {1}' but couldn't match /{2}/ in page.".format(r.status_code, r.reason, self.regexp_text))
         except requests.exceptions.RequestException as e:
             return self.record_fail("Requests exception while opening URL: {0}".format(e))
@@ -127,7 +189,7 @@ class MonitorHTTP(Monitor):
 
 
 @register
-class MonitorTCP(Monitor):
+class MonitorTCP(LatencyMonitor):
     """TCP port monitor"""
 
     host = ""
@@ -136,7 +198,7 @@ class MonitorTCP(Monitor):
 
     def __init__(self, name, config_options):
         """Constructor"""
-        Monitor.__init__(self, name, config_options)
+        LatencyMonitor.__init__(self, name, config_options)
         self.host = Monitor.get_config_option(config_options, 'host', required=True)
         self.port = Monitor.get_config_option(
             config_options,
@@ -151,10 +213,15 @@ class MonitorTCP(Monitor):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             s.settimeout(5.0)
+            start_time = monotonic_ns()
             s.connect((self.host, self.port))
+            connect_time = (monotonic_ns() - start_time) / 1000000000.0
         except Exception:
             return self.record_fail()
         s.close()
+        latency_error = self.check_latency(connect_time)
+        if latency_error is not None:
+            return self.record_fail(latency_error)
         return self.record_success()
 
     def describe(self):
@@ -166,7 +233,7 @@ class MonitorTCP(Monitor):
 
 
 @register
-class MonitorHost(Monitor):
+class MonitorHost(LatencyMonitor):
     """Ping a host to make sure it's up"""
 
     host = ""
@@ -183,7 +250,7 @@ class MonitorHost(Monitor):
         This is to stop ping holding things up too much. A machine that can't ping back in <5s is
         a machine in trouble anyway, so should probably count as a failure.
         """
-        Monitor.__init__(self, name, config_options)
+        LatencyMonitor.__init__(self, name, config_options)
         ping_ttl = Monitor.get_config_option(
             config_options,
             'ping_ttl',
@@ -205,7 +272,7 @@ class MonitorHost(Monitor):
         elif platform.startswith('linux'):
             self.ping_command = "ping -c1 -W" + ping_ttl + " %s"
             self.ping_regexp = "bytes from"
-            self.time_regexp = r"min/avg/max/stddev = [\d.]+/(?P<ms>[\d.]+)/"
+            self.time_regexp = r"min/avg/max/(?:stddev|mdev) = [\d.]+/(?P<ms>[\d.]+)/"
         else:
             RuntimeError("Don't know how to run ping on this platform, help!")
 
@@ -226,19 +293,20 @@ class MonitorHost(Monitor):
 
         try:
             cmd = (self.ping_command % self.host).split(' ')
-            output = subprocess.check_output(cmd)
-            for line in str(output).split("\n"):
-                matches = self.r.search(line)
-                if matches:
+            output = process.check_output(cmd).decode('utf-8', 'replace')
+            for line in output.split("\n"):
+                if self.r.search(line):
                     success = True
-                else:
-                    matches = self.r2.search(line)
-                    if matches:
-                        pingtime = matches.group("ms")
+                matches = self.r2.search(line)
+                if matches:
+                    pingtime = float(matches.group("ms"))
         except Exception as e:
             return self.record_fail(e)
         if success:
             if pingtime > 0:
+                latency_error = self.check_latency(pingtime / 1000)
+                if latency_error is not None:
+                    return self.record_fail("%sms: %s" % (pingtime, latency_error))
                 return self.record_success("%sms" % pingtime)
             return self.record_success()
         return self.record_fail()
@@ -286,7 +354,7 @@ class MonitorDNS(Monitor):
 
     def run_test(self):
         try:
-            result = subprocess.check_output(self.params).decode('utf-8')
+            result = process.check_output(self.params).decode('utf-8')
             result = result.strip()
             if result is None or result == '':
                 return self.record_fail("failed to resolve %s" % self.path)
@@ -0,0 +1,151 @@
+# coding=utf-8
+"""Running external commands for monitors.
+
+Monitors which run a command should use the functions here in place of their
+subprocess equivalents. By default they just call subprocess, but in "pool"
+mode the commands are run by a small pool of helper processes which are
+started once, before the monitors are loaded. Starting a command then means
+forking one of the small helpers rather than the main SimpleMonitor process,
+and the number of helpers limits how many commands run at once.
+
+check_output() can also share the output of a command between monitors:
+within one loop of the monitors (and for a while afterwards, if asked) the
+same command is only run once, however many monitors want its output."""
+
+import logging
+import multiprocessing
+import subprocess
+import threading
+
+from util import loop_time, monotonic_ns
+
+MODES = ('direct', 'pool')
+
+process_logger = logging.getLogger('simplemonitor.process')
+
+_mode = 'direct'
+_workers = 2
+_pool = None
+_lock = threading.Lock()
+
+# A cache of command output shared by all monitors, so a command is run once
+# for all the monitors which want it: argv -> (loop time, expiry, output, exception)
+_output_cache = {}
+
+
+def _get_context():
+    # forkserver helpers are forked from a fresh interpreter, not from us
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def configure(mode='direct', workers=2):
+    """Choose how commands are run.
+
+    In pool mode, the helper processes are started straight away."""
+    global _mode, _workers
+    if mode not in MODES:
+        raise ValueError("mode must be one of {0}".format(', '.join(MODES)))
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if mode == 'pool' and not hasattr(multiprocessing, 'get_context'):
+        # Python 2 can only start the helpers by forking us, which is what pool mode avoids
+        raise ValueError("pool mode needs Python 3.4 or later")
+    shutdown()
+    _mode = mode
+    _workers = workers
+    if mode == 'pool':
+        _get_pool()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                process_logger.info("Starting %d command helper processes", _workers)
+                _pool = _get_context().Pool(_workers)
+    return _pool
+
+
+def shutdown():
+    """Stop the helper processes, if any."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+            _pool = None
+
+
+def _run(args, capture_output):
+    """Run a command, returning (returncode, output). Runs in a helper process."""
+    if capture_output:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    else:
+        process = subprocess.Popen(args)
+    (output, _) = process.communicate()
+    return (process.returncode, output)
+
+
+def _execute(args, capture_output):
+    return _get_pool().apply(_run, (args, capture_output))
+
+
+def _check_output(args):
+    if _mode == 'direct':
+        return subprocess.check_output(args)
+    (returncode, output) = _execute(args, True)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args, output=output)
+    return output
+
+
+def check_output(args, cache_lifetime=None):
+    """Like subprocess.check_output().
+
+    If cache_lifetime (in seconds) is given and not 0, the result (output or
+    exception) is shared with every other caller running the same command
+    during this loop, and for cache_lifetime seconds after it was run."""
+    if not cache_lifetime:
+        return _check_output(args)
+    if isinstance(args, str):
+        key = (args, )
+    else:
+        key = tuple(args)
+    now = monotonic_ns()
+    this_loop = loop_time()
+    cached = _output_cache.get(key)
+    if cached is None or (cached[0] != this_loop and cached[1] < now):
+        try:
+            cached = (this_loop, now + cache_lifetime * 1000000000, _check_output(args), None)
+        except (subprocess.CalledProcessError, OSError) as e:
+            cached = (this_loop, now + cache_lifetime * 1000000000, None, e)
+        _output_cache[key] = cached
+    else:
+        process_logger.debug("Using cached output of %s", args)
+    if cached[3] is not None:
+        raise cached[3]
+    return cached[2]
+
+
+def clear_cache():
+    _output_cache.clear()
+
+
+def call(args):
+    """Like subprocess.call()."""
+    if _mode == 'direct':
+        return subprocess.call(args)
+    return _execute(args, False)[0]
+
+
+def check_call(args):
+    """Like subprocess.check_call()."""
+    if _mode == 'direct':
+        return subprocess.check_call(args)
+    returncode = call(args)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+    return 0
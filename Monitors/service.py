@@ -1,21 +1,25 @@
 # coding=utf-8
 import fnmatch
+import logging
 import platform
 import re
 import os
 import subprocess
 import sys
-import time
+import threading
 
 try:
     import pydbus
 except ImportError:
     pydbus = None
 
-from util import MonitorConfigurationError
+from util import MonitorConfigurationError, in_loop, loop_time
 
+from . import process
 from .monitor import Monitor, register
 
+service_logger = logging.getLogger('simplemonitor.service')
+
 
 @register
 class MonitorSvc(Monitor):
@@ -33,7 +37,7 @@ class MonitorSvc(Monitor):
         if self.path == "":
             return
         try:
-            result = subprocess.call(self.params)
+            result = process.call(self.params)
             if result is None:
                 result = 0
             if result > 0:
@@ -91,7 +95,7 @@ class MonitorService(Monitor):
                 # we need windows for sc
                 return self.record_fail("Cannot check for Windows services while running on a non-Windows platform.")
 
-            output = str(subprocess.check_output(['sc', host, 'query', self.service_name]))
+            output = str(process.check_output(['sc', host, 'query', self.service_name]))
             matches = r.search(output)
             if matches:
                 return self.record_success()
@@ -141,7 +145,7 @@ class MonitorRC(Monitor):
             self.is_error = True
             return False
         try:
-            returncode = subprocess.check_call([self.script_path, 'status'])
+            returncode = process.check_call([self.script_path, 'status'])
             if returncode == self.want_return_code:
                 return self.record_success()
         except subprocess.CalledProcessError as e:
@@ -167,46 +171,174 @@ class MonitorSystemdUnit(Monitor):
     This monitor checks the state of the unit as given by
     /org/freedesktop/systemd1/ListUnits
     and reports failure if it is not one of the expected states.
+
+    All instances share one connection to the system bus and one list of the
+    units, fetched at most once per loop. Each monitor's unit name (which may
+    be a glob) is matched against that list once, and then only again when
+    units come or go. With subscribe enabled, systemd pushes changes to the
+    units' states to us, and the list is only fetched again when units are
+    added or removed (or every RESYNC_INTERVAL seconds, in case we missed
+    something).
     """
 
     type = "systemd-unit"
 
-    # A cached shared by all instances of MonitorSystemdUnit, so a single
+    # State shared by all instances of MonitorSystemdUnit, so a single
     # call is done for all monitors at once.
-    _listunit_cache = []
-    _listunit_cache_expiry = 0
-    CACHE_LIFETIME = 1  # in seconds
+    _bus = None
+    _systemd = None
+    # unit name -> (load state, active state, sub state), and unit path -> name
+    _units = None
+    _unit_paths = {}
+    _units_time = None
+    # unit name pattern -> matching unit names, for the current set of units
+    _matches = {}
+    _stale = False
+    _subscribed = False
+    _want_subscribe = False
+    _lock = threading.Lock()
+    CACHE_LIFETIME = 1  # in seconds, when not in a loop
+    RESYNC_INTERVAL = 300  # in seconds, when subscribed
 
     def __init__(self, name, config_options):
         Monitor.__init__(self, name, config_options)
         if not pydbus:
-            self.alerter_logger.critical("pydbus package is not available, cannot use MonitorSystemdUnit.")
+            self.monitor_logger.critical("pydbus package is not available, cannot use MonitorSystemdUnit.")
             return
         self.unit_name = Monitor.get_config_option(config_options, 'name', required=True)
         self.want_load_states = Monitor.get_config_option(config_options, 'load_states', required_type='[str]', default=['loaded'])
         self.want_active_states = Monitor.get_config_option(config_options, 'active_states', required_type='[str]', default=['active', 'reloading'])
         self.want_sub_states = Monitor.get_config_option(config_options, 'sub_states', required_type='[str]', default=[])
+        if Monitor.get_config_option(config_options, 'subscribe', required_type='bool', default=False):
+            MonitorSystemdUnit._want_subscribe = True
+        if not any(c in self.unit_name for c in '*?['):
+            self._match = None
+        else:
+            self._match = re.compile(fnmatch.translate(self.unit_name)).match
+
+    @classmethod
+    def _get_systemd(cls):
+        if cls._systemd is None:
+            cls._bus = pydbus.SystemBus()
+            cls._systemd = cls._bus.get(".systemd1")
+        return cls._systemd
+
+    @classmethod
+    def _disconnect(cls):
+        cls._bus = None
+        cls._systemd = None
+        cls._subscribed = False
+
+    @classmethod
+    def _subscribe(cls):
+        try:
+            from gi.repository import GLib
+        except ImportError:
+            service_logger.warning("GLib is not available, cannot subscribe to systemd; polling instead.")
+            cls._want_subscribe = False
+            return
+        systemd = cls._get_systemd()
+        systemd.Subscribe()
+        cls._bus.subscribe(
+            sender='org.freedesktop.systemd1',
+            iface='org.freedesktop.DBus.Properties',
+            signal='PropertiesChanged',
+            arg0='org.freedesktop.systemd1.Unit',
+            signal_fired=cls._properties_changed)
+        for signal in ['UnitNew', 'UnitRemoved']:
+            cls._bus.subscribe(
+                sender='org.freedesktop.systemd1',
+                iface='org.freedesktop.systemd1.Manager',
+                signal=signal,
+                signal_fired=cls._units_changed)
+        thread = threading.Thread(target=GLib.MainLoop().run, name='systemd-signals')
+        thread.daemon = True
+        thread.start()
+        cls._subscribed = True
+
+    @classmethod
+    def _properties_changed(cls, sender, object_path, iface, signal, params):
+        (interface, changed, invalidated) = params
+        with cls._lock:
+            name = cls._unit_paths.get(object_path)
+            if name is None or cls._units is None or name not in cls._units:
+                cls._stale = True
+                return
+            if set(invalidated) & set(['LoadState', 'ActiveState', 'SubState']):
+                cls._stale = True
+                return
+            (load_state, active_state, sub_state) = cls._units[name]
+            cls._units[name] = (
+                changed.get('LoadState', load_state),
+                changed.get('ActiveState', active_state),
+                changed.get('SubState', sub_state)
+            )
+
+    @classmethod
+    def _units_changed(cls, *args):
+        cls._stale = True
+
+    @classmethod
+    def _needs_refresh(cls):
+        if cls._units is None or cls._stale:
+            return True
+        now = loop_time()
+        if cls._subscribed:
+            return now - cls._units_time >= cls.RESYNC_INTERVAL
+        if in_loop():
+            return now != cls._units_time
+        return now - cls._units_time >= cls.CACHE_LIFETIME
 
     @classmethod
     def _list_units(cls):
-        if cls._listunit_cache_expiry < time.time():
-            bus = pydbus.SystemBus()
-            systemd = bus.get(".systemd1")
-            cls._listunit_cache_expiry = time.time() + cls.CACHE_LIFETIME
-            cls._listunit_cache = list(systemd.ListUnits())
-        return cls._listunit_cache
+        if cls._needs_refresh():
+            try:
+                if cls._want_subscribe and not cls._subscribed:
+                    cls._subscribe()
+                units = list(cls._get_systemd().ListUnits())
+            except Exception:
+                # the connection may have gone away; start again next time
+                cls._disconnect()
+                raise
+            with cls._lock:
+                cls._stale = False
+                cls._units_time = loop_time()
+                old_names = cls._units
+                cls._units = {}
+                cls._unit_paths = {}
+                for unit in units:
+                    (name, desc, load_state, active_state, sub_state, follower, unit_path, job_id, job_type, job_path) = unit
+                    cls._units[name] = (load_state, active_state, sub_state)
+                    cls._unit_paths[unit_path] = name
+                if old_names is None or set(old_names) != set(cls._units):
+                    cls._matches = {}
+        return cls._units
+
+    def _matching_units(self, units):
+        if self._match is None:
+            if self.unit_name in units:
+                return [self.unit_name]
+            return []
+        matches = MonitorSystemdUnit._matches.get(self.unit_name)
+        if matches is None:
+            matches = MonitorSystemdUnit._matches[self.unit_name] = sorted(
+                name for name in units if self._match(name))
+        return matches
 
     def run_test(self):
         """Check the service is in the desired state."""
-        nb_matches = 0
-        for unit in self._list_units():
-            (name, desc, load_state, active_state, sub_state, follower, unit_path, job_id, job_type, job_path) = unit
-            if fnmatch.fnmatch(name, self.unit_name):
-                self._check_unit(name, load_state, active_state, sub_state)
-                nb_matches += 1
-
-        if nb_matches == 0:
+        try:
+            units = self._list_units()
+        except Exception as e:
+            return self.record_fail("Unable to list units: %s" % e)
+        names = self._matching_units(units)
+        if len(names) == 0:
             return self.record_fail("No unit %s" % self.unit_name)
+        for name in names:
+            (load_state, active_state, sub_state) = units[name]
+            if not self._check_unit(name, load_state, active_state, sub_state):
+                return
+        return self.record_success()
 
     def _check_unit(self, name, load_state, active_state, sub_state):
         if self.want_load_states and load_state not in self.want_load_states:
@@ -216,14 +348,15 @@ class MonitorSystemdUnit(Monitor):
             return self.record_fail("Unit {0} has active state: {1} (wanted {2})".format(
                 name, active_state, self.want_active_states))
         if self.want_sub_states and sub_state not in self.want_sub_states:
-            return self.record_fail("Unit {0} has sub state: {0} (wanted {2})".format(
+            return self.record_fail("Unit {0} has sub state: {1} (wanted {2})".format(
                 name, sub_state, self.want_sub_states))
+        return True
 
     def get_params(self):
         return (self.unit_name, self.want_load_states, self.want_active_states, self.want_sub_states)
 
     def describe(self):
-        return "Checks unit %s is running" % self.script_path
+        return "Checks unit %s is running" % self.unit_name
 
 
 @register
@@ -231,6 +364,7 @@ class MonitorEximQueue(Monitor):
     """Make sure an exim queue isn't too big."""
 
     type = "eximqueue"
+    runs_commands = True
     max_length = 10
     r = re.compile(r"(?P<count>\d+) matches out of (?P<total>\d+) messages")
     path = "/usr/local/sbin"
@@ -247,7 +381,7 @@ class MonitorEximQueue(Monitor):
 
     def run_test(self):
         try:
-            output = subprocess.check_output([self.path, "-xc"])
+            output = process.check_output([self.path, "-xc"], self.cache_lifetime)
             output = output.decode('utf-8')
             for line in output.splitlines():
                 matches = self.r.match(line)
@@ -295,7 +429,7 @@ class MonitorWindowsDHCPScope(Monitor):
 
     def run_test(self):
         try:
-            output = str(subprocess.check_output(["netsh", "dhcp", "server", "scope", self.scope, "show", "clients"]))
+            output = str(process.check_output(["netsh", "dhcp", "server", "scope", self.scope, "show", "clients"]))
             matches = self.r.search(output)
             if matches:
                 clients = int(matches.group("clients"))
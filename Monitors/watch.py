@@ -0,0 +1,257 @@
+# coding=utf-8
+"""Watching files for the file-based monitors.
+
+By default, every check of a file stat()s it (and re-reads it, if the monitor
+needs its contents). With the inotify backend (Linux only), the directories
+containing the watched files are watched for changes instead, and each file's
+stat() result and contents are cached until the kernel says something about
+it changed, so checking an unchanged file costs a single stat() of its
+directory (to notice the directory, or one of its parents, being replaced).
+Files which are symlinks are never cached, as changes to their targets
+wouldn't be seen.
+
+Monitors should use stat() and read() from here rather than the os module."""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import stat as stat_module
+import struct
+import sys
+
+watch_logger = logging.getLogger('simplemonitor.watch')
+
+BACKENDS = ('poll', 'inotify')
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+WATCH_MASK |= IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+_EVENT = struct.Struct('iIII')
+
+
+class PollingWatcher(object):
+    """Looks at the files every time it's asked."""
+
+    backend = 'poll'
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def read(self, path):
+        with open(path, 'rb') as file_handle:
+            return file_handle.read()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """Caches files' stat() results and contents until inotify reports a change."""
+
+    backend = 'inotify'
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        # Python 2 has no os.O_CLOEXEC; this is its value on most Linux architectures
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0o2000000))
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        # directory -> watch descriptor, and back (several directories can
+        # share a watch, if they're symlinks to the same place)
+        self.wds = {}
+        self.dirs = {}
+        # directory -> (st_dev, st_ino) of what we're watching there
+        self.dir_ids = {}
+        # path -> ('stat', result), ('error', exception) or ('link', None)
+        self.stats = {}
+        # path -> contents
+        self.contents = {}
+
+    def _watch(self, directory):
+        """Make sure we're watching a directory, returning False if we can't.
+
+        If the directory at that path isn't the one we were watching (it, or
+        one of its parents, has been replaced or is a symlink which now points
+        elsewhere), we start again with the new one."""
+        try:
+            result = os.stat(directory)
+        except OSError:
+            if directory in self.wds:
+                self._unwatch(directory)
+            return False
+        dir_id = (result.st_dev, result.st_ino)
+        if directory in self.wds:
+            if self.dir_ids[directory] == dir_id:
+                return True
+            watch_logger.debug("%s has been replaced", directory)
+            self._unwatch(directory)
+        wd = self._add_watch(self.fd, directory.encode(sys.getfilesystemencoding()), WATCH_MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            watch_logger.debug("Can't watch %s: %s", directory, os.strerror(e))
+            return False
+        self.wds[directory] = wd
+        self.dirs.setdefault(wd, []).append(directory)
+        self.dir_ids[directory] = dir_id
+        return True
+
+    def _unwatch(self, directory, removed=False):
+        """Stop watching a directory, and forget about its files.
+
+        removed says the kernel has already dropped the watch."""
+        wd = self.wds.pop(directory)
+        del self.dir_ids[directory]
+        directories = self.dirs[wd]
+        directories.remove(directory)
+        if not directories:
+            del self.dirs[wd]
+            if not removed:
+                self._rm_watch(self.fd, wd)
+        self._forget(directory)
+
+    def _forget(self, directory, name=None):
+        """Drop our cached information about a directory's files (or one file in it)."""
+        if name is not None:
+            path = os.path.join(directory, name)
+            self.stats.pop(path, None)
+            self.contents.pop(path, None)
+            return
+        for cache in (self.stats, self.contents):
+            for path in [p for p in cache if os.path.dirname(p) == directory]:
+                del cache[path]
+
+    def _process_events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return
+                raise
+            if not data:
+                return
+            offset = 0
+            while offset < len(data):
+                (wd, mask, _, length) = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # we missed events, so we can't trust anything we have
+                    self.stats.clear()
+                    self.contents.clear()
+                    continue
+                for directory in list(self.dirs.get(wd, ())):
+                    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                        # the directory has gone from where we were watching
+                        # it; whatever is there now is watched on its next use
+                        self._unwatch(directory, removed=bool(mask & IN_IGNORED))
+                    elif name:
+                        self._forget(directory, name.decode(sys.getfilesystemencoding()))
+                    else:
+                        self._forget(directory)
+
+    def _check(self, path):
+        """Catch up with events and make sure the path's directory is watched.
+
+        Returns False if the path can't be watched (so we should just poll it)."""
+        self._process_events()
+        return self._watch(os.path.dirname(path))
+
+    def _stat(self, path):
+        """Get the cached stat() result for a path, which must be watched."""
+        cached = self.stats.get(path)
+        if cached is None:
+            try:
+                if stat_module.S_ISLNK(os.lstat(path).st_mode):
+                    cached = ('link', None)
+                else:
+                    cached = ('stat', os.stat(path))
+            except OSError as e:
+                cached = ('error', e)
+            self.stats[path] = cached
+        return cached
+
+    def stat(self, path):
+        path = os.path.abspath(path)
+        if not self._check(path):
+            return os.stat(path)
+        cached = self._stat(path)
+        if cached[0] == 'link':
+            return os.stat(path)
+        if cached[0] == 'error':
+            raise cached[1]
+        return cached[1]
+
+    def read(self, path):
+        path = os.path.abspath(path)
+        if not self._check(path) or self._stat(path)[0] != 'stat':
+            return PollingWatcher.read(self, path)
+        contents = self.contents.get(path)
+        if contents is None:
+            contents = self.contents[path] = PollingWatcher.read(self, path)
+        return contents
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+_watcher = PollingWatcher()
+
+
+def configure(backend='poll'):
+    """Choose how files are watched.
+
+    If inotify is asked for but isn't available, we fall back to polling."""
+    global _watcher
+    if backend not in BACKENDS:
+        raise ValueError("backend must be one of {0}".format(', '.join(BACKENDS)))
+    _watcher.close()
+    if backend == 'inotify':
+        try:
+            _watcher = InotifyWatcher()
+            return
+        except (OSError, AttributeError, TypeError) as e:
+            watch_logger.warning("Cannot use inotify (%s), falling back to polling files", e)
+    _watcher = PollingWatcher()
+
+
+def get_backend():
+    return _watcher.backend
+
+
+def stat(path):
+    """Like os.stat()."""
+    return _watcher.stat(path)
+
+
+def read(path):
+    """Get the contents of a file, as bytes.
+
+    Like open(), this raises IOError (Python 2) or OSError if the file can't be read."""
+    return _watcher.read(path)
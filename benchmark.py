@@ -0,0 +1,458 @@
+# coding=utf-8
+"""Benchmarks for SimpleMonitor.
+
+Builds synthetic fleets of null and fail monitors and times the parts of the
+main loop (running the tests, alerting, and each type of logger) against
+them, along with receiving results from a remote instance and loading the
+monitors file. Monitors which talk to the network are timed against local
+stand-in HTTP, TCP and DNS servers, so nothing leaves the machine.
+
+Results are printed as a table, and can be saved as JSON (--output) and
+compared with an earlier run (--compare)."""
+
+import datetime
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from optparse import OptionParser
+
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from shutil import which
+except ImportError:
+    # Python 2
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from distutils.spawn import find_executable as which
+
+import envconfig
+import monitor
+import util
+from simplemonitor import SimpleMonitor
+
+import Alerters.alerter
+import Loggers.logger
+import Loggers.network
+
+BENCHMARK_VERSION = 1
+
+DEFAULT_SIZES = '100,1000,10000,100000'
+
+# the loggers which don't need anything outside this machine
+LOGGER_TYPES = ('logfile', 'json', 'html', 'db', 'dbstatus', 'network')
+
+
+class NullAlerter(Alerters.alerter.Alerter):
+    """An alerter which goes through the motions, but only counts its alerts."""
+
+    type = "benchmark-null"
+
+    def __init__(self, config_options=None):
+        Alerters.alerter.Alerter.__init__(self, config_options)
+        self.sent = []
+
+    def send_alert(self, name, monitor):
+        alert_type = self.should_alert(monitor)
+        if alert_type:
+            self.run_send(self.sent.append, (alert_type, name))
+
+
+def timed(function, repeat=3, setup=None):
+    """Run function repeat times, returning statistics about how long it took, in seconds.
+
+    setup, if given, is run (untimed) before each run."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # don't make this run pay for collecting the last one's garbage
+        gc.collect()
+        start = util.monotonic_ns()
+        function()
+        times.append((util.monotonic_ns() - start) / 1000000000.0)
+    times.sort()
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'runs': len(times),
+    }
+
+
+# Stand-in servers
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = b'OK\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TCPHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        pass
+
+
+class _DNSHandler(socketserver.BaseRequestHandler):
+    """Answer every query with an A record of 127.0.0.1."""
+
+    def handle(self):
+        (data, sock) = self.request
+        # so indexing gives numbers on Python 2 too
+        data = bytearray(data)
+        try:
+            # the question is the name (as length-prefixed labels), type and class
+            end = 12
+            while data[end] != 0:
+                end += data[end] + 1
+            end += 5
+        except IndexError:
+            return
+        header = struct.pack('!HHHHHH', struct.unpack('!H', data[:2])[0], 0x8180, 1, 1, 0, 0)
+        answer = struct.pack('!HHHIH', 0xc00c, 1, 1, 60, 4) + socket.inet_aton('127.0.0.1')
+        sock.sendto(header + bytes(data[12:end]) + answer, self.client_address)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+# http.server.ThreadingHTTPServer is only in Python 3.7+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInServers(object):
+    """Local HTTP, TCP and DNS servers for the network monitors to talk to."""
+
+    def __init__(self):
+        self.servers = {
+            'http': _ThreadingHTTPServer(('127.0.0.1', 0), _HTTPHandler),
+            'tcp': _ThreadingTCPServer(('127.0.0.1', 0), _TCPHandler),
+            'dns': socketserver.ThreadingUDPServer(('127.0.0.1', 0), _DNSHandler),
+        }
+        self.threads = []
+
+    def port(self, kind):
+        return self.servers[kind].server_address[1]
+
+    def __enter__(self):
+        for server in self.servers.values():
+            thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1})
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def __exit__(self, *args):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+# Fleets
+
+def fleet_configs(size, fail_ratio=0.1):
+    """Make the config for a fleet of size monitors, fail_ratio of which fail."""
+    configs = {}
+    fail_every = int(1 / fail_ratio) if fail_ratio > 0 else 0
+    for i in range(size):
+        name = 'monitor{0}'.format(i)
+        if fail_every and i % fail_every == 0:
+            # a big interval, so the monitor keeps failing
+            configs[name] = {'type': 'fail', 'interval': '1000000', 'group': 'group{0}'.format(i % 10)}
+        else:
+            configs[name] = {'type': 'null', 'group': 'group{0}'.format(i % 10)}
+    return configs
+
+
+def make_fleet(size, fail_ratio=0.1, state_store=False):
+    m = SimpleMonitor(state_store=state_store)
+    m.update_monitors(fleet_configs(size, fail_ratio))
+    return m
+
+
+def logger_config(logger_type, directory, listener_port=None):
+    """Make the config for a logger of the given type, writing into directory."""
+    config = {'type': logger_type, '_name': logger_type}
+    if logger_type in ('logfile', 'json'):
+        config['filename'] = os.path.join(directory, logger_type + '.log')
+    elif logger_type in ('db', 'dbstatus'):
+        config['db_path'] = os.path.join(directory, logger_type + '.db')
+    elif logger_type == 'html':
+        for filename in ('header.html', 'footer.html'):
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html', filename), directory)
+        config.update({'filename': 'status.html', 'header': 'header.html', 'footer': 'footer.html', 'folder': directory})
+    elif logger_type == 'network':
+        config.update({'host': '127.0.0.1', 'port': str(listener_port), 'key': 'benchmark'})
+    return config
+
+
+class Listener(object):
+    """A Listener feeding a SimpleMonitor of its own, on a free port."""
+
+    def __init__(self):
+        self.simplemonitor = SimpleMonitor()
+        self.thread = Loggers.network.Listener(self.simplemonitor, 0, 'benchmark', allow_pickle=False)
+        self.thread.daemon = True
+        self.port = self.thread.sock.getsockname()[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.thread.running = False
+        self.thread.sock.close()
+
+    def wait_for(self, count, timeout=600):
+        deadline = time.time() + timeout
+        while len(self.simplemonitor.remote_monitors) < count:
+            if time.time() > deadline:
+                raise RuntimeError("Listener only received {0} of {1} monitors".format(
+                    len(self.simplemonitor.remote_monitors), count))
+            time.sleep(0.001)
+
+
+# Benchmarks; each yields result dicts
+
+def bench_core(size, repeat, directory, logger_types=LOGGER_TYPES):
+    yield {'benchmark': 'build', 'size': size, 'seconds': timed(lambda: make_fleet(size), repeat)}
+    m = make_fleet(size)
+    yield {'benchmark': 'run_tests', 'size': size, 'seconds': timed(m.run_tests, repeat)}
+
+    alerter = NullAlerter()
+    m.add_alerter('null', alerter)
+    yield {'benchmark': 'do_alerts', 'size': size, 'seconds': timed(m.do_alerts, repeat)}
+
+    listener = Listener()
+    with listener:
+        for logger_type in logger_types:
+            config = logger_config(logger_type, directory, listener.port)
+            if logger_type in ('db', 'dbstatus') and os.path.exists(config['db_path']):
+                # start each fleet size with an empty database
+                os.unlink(config['db_path'])
+            m.loggers = {}
+            m.add_logger(logger_type, Loggers.logger.get_class(logger_type)(config))
+            if logger_type == 'network':
+                # include the time for the other end to take the results in
+                def log():
+                    m.do_logs()
+                    listener.wait_for(size)
+                result = timed(log, repeat, listener.simplemonitor.remote_monitors.clear)
+            else:
+                result = timed(m.do_logs, repeat)
+            yield {'benchmark': 'do_logs', 'size': size, 'logger': logger_type, 'seconds': result}
+        m.loggers = {}
+
+        # the receiving end on its own
+        data = dict(
+            (name, {'cls_type': monitor.type, 'data': monitor.to_python_dict()})
+            for (name, monitor) in m.monitors.items()
+        )
+        payload = util.json_dumps(data)
+
+        def ingest():
+            listener.simplemonitor.update_remote_monitor(util.json_loads(payload), '127.0.0.1')
+        yield {'benchmark': 'listener_ingest', 'size': size, 'seconds': timed(ingest, repeat)}
+
+
+def write_monitors_file(filename, size, fail_ratio=0.1):
+    with open(filename, 'w') as f:
+        f.write('[defaults]\ntolerance=1\n\n')
+        for (name, config) in sorted(fleet_configs(size, fail_ratio).items()):
+            f.write('[{0}]\n'.format(name))
+            for (key, value) in sorted(config.items()):
+                f.write('{0}={1}\n'.format(key, value))
+            f.write('\n')
+
+
+def bench_config(size, repeat, directory):
+    filename = os.path.join(directory, 'monitors-{0}.ini'.format(size))
+    cache_dir = os.path.join(directory, 'cache')
+    write_monitors_file(filename, size)
+
+    def load(cache_dir=None):
+        m = SimpleMonitor()
+        monitor.load_monitors(m, filename, cache_dir)
+
+    yield {
+        'benchmark': 'config_load', 'size': size, 'cache': 'none',
+        'seconds': timed(load, repeat, envconfig._sections_cache.clear)
+    }
+    # fill the disk cache, then load from it with an empty memory cache
+    load(cache_dir)
+    yield {
+        'benchmark': 'config_load', 'size': size, 'cache': 'disk',
+        'seconds': timed(lambda: load(cache_dir), repeat, envconfig._sections_cache.clear)
+    }
+    yield {'benchmark': 'config_load', 'size': size, 'cache': 'memory', 'seconds': timed(load, repeat)}
+
+
+def bench_network(size, repeat):
+    """Time fleets of http, tcp and dns monitors against the stand-in servers."""
+    with StandInServers() as servers:
+        kinds = {
+            'http': {'type': 'http', 'url': 'http://127.0.0.1:{0}/'.format(servers.port('http'))},
+            'tcp': {'type': 'tcp', 'host': '127.0.0.1', 'port': str(servers.port('tcp'))},
+            'dns': {'type': 'dns', 'record': 'benchmark.example', 'server': '127.0.0.1', 'desired_val': '127.0.0.1'},
+        }
+        for (kind, config) in sorted(kinds.items()):
+            result = {'benchmark': 'run_tests', 'size': size, 'monitor': kind}
+            if kind == 'dns' and which('dig') is None:
+                result['skipped'] = 'dig is not installed'
+                yield result
+                continue
+            m = SimpleMonitor()
+            try:
+                m.update_monitors(dict(('{0}{1}'.format(kind, i), config) for i in range(size)))
+            except ImportError as e:
+                result['skipped'] = str(e)
+                yield result
+                continue
+            if kind == 'dns':
+                # the dns monitor always asks port 53, so tell dig where our server is
+                for dns_monitor in m.monitors.values():
+                    dns_monitor.params[-2:-2] = ['-p', str(servers.port('dns'))]
+            result['seconds'] = timed(m.run_tests, repeat)
+            failing = m.count_failing()['failing']
+            if failing:
+                result['failing'] = failing
+            yield result
+
+
+# Output
+
+def result_key(result):
+    """What identifies a result, for comparing runs."""
+    return tuple((key, result[key]) for key in sorted(result) if key not in ('seconds', 'skipped', 'failing'))
+
+
+def describe_result(result):
+    extra = ', '.join('{0}={1}'.format(key, value) for (key, value) in result_key(result) if key not in ('benchmark', 'size'))
+    if extra:
+        return '{0} ({1})'.format(result['benchmark'], extra)
+    return result['benchmark']
+
+
+def format_result(result, baseline=None):
+    line = '{0:<40} {1:>7}'.format(describe_result(result), result['size'])
+    if 'skipped' in result:
+        return line + '  skipped: ' + result['skipped']
+    median = result['seconds']['median']
+    line += ' {0:>10.4f}s {1:>10.2f}us/item'.format(median, median * 1000000 / max(result['size'], 1))
+    if baseline is not None and 'seconds' in baseline:
+        before = baseline['seconds']['median']
+        if before > 0:
+            line += ' {0:>7.2f}x'.format(median / before)
+    if result.get('failing'):
+        line += '  ({0} failing)'.format(result['failing'])
+    return line
+
+
+def git_revision():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=devnull
+            ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat=3, benchmarks=('core', 'config', 'network'), network_size=100, logger_types=LOGGER_TYPES):
+    """Run the benchmarks, yielding a result dict for each measurement."""
+    directory = tempfile.mkdtemp(prefix='simplemonitor-benchmark-')
+    try:
+        for size in sizes:
+            if 'core' in benchmarks:
+                for result in bench_core(size, repeat, directory, logger_types):
+                    yield result
+            if 'config' in benchmarks:
+                for result in bench_config(size, repeat, directory):
+                    yield result
+        if 'network' in benchmarks:
+            for result in bench_network(network_size, repeat):
+                yield result
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]", description="Time SimpleMonitor's main loop and subsystems against synthetic fleets of monitors.")
+    parser.add_option('-s', '--sizes', dest='sizes', default=DEFAULT_SIZES, help='Comma-separated fleet sizes [default: %default]')
+    parser.add_option('-r', '--repeat', dest='repeat', default=3, type=int, help='Times to run each benchmark; the median is reported [default: %default]')
+    parser.add_option('-b', '--benchmarks', dest='benchmarks', default='core,config,network', help='Which benchmarks to run: core, config, network [default: %default]')
+    parser.add_option('-l', '--loggers', dest='loggers', default=','.join(LOGGER_TYPES), help='Which loggers to time do_logs for [default: %default]')
+    parser.add_option('-n', '--network-size', dest='network_size', default=100, type=int, help='Number of each kind of network monitor [default: %default]')
+    parser.add_option('-o', '--output', dest='output', default=None, help='Save the results to this file, as JSON')
+    parser.add_option('-c', '--compare', dest='compare', default=None, help='Compare with the results saved in this file')
+    (options, _) = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    try:
+        sizes = [int(size) for size in options.sizes.split(',')]
+    except ValueError:
+        parser.error('--sizes should be a comma-separated list of numbers')
+    benchmarks = [benchmark.strip() for benchmark in options.benchmarks.split(',')]
+    for benchmark in benchmarks:
+        if benchmark not in ('core', 'config', 'network'):
+            parser.error('Unknown benchmark {0}'.format(benchmark))
+    logger_types = [logger_type.strip() for logger_type in options.loggers.split(',') if logger_type.strip()]
+    for logger_type in logger_types:
+        if logger_type not in LOGGER_TYPES:
+            parser.error('Unknown logger {0}; choose from {1}'.format(logger_type, ', '.join(LOGGER_TYPES)))
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            for result in json.load(f)['results']:
+                baseline[result_key(result)] = result
+
+    results = []
+    for result in run(sizes, options.repeat, benchmarks, options.network_size, logger_types):
+        print(format_result(result, baseline.get(result_key(result))))
+        sys.stdout.flush()
+        results.append(result)
+
+    if options.output:
+        document = {
+            'version': BENCHMARK_VERSION,
+            'date': datetime.datetime.utcnow().isoformat() + 'Z',
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'repeat': options.repeat,
+            'results': results,
+        }
+        with open(options.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,25 @@
+import io
 import os
 import re
+import glob
+import json
+import hashlib
 import functools
+import multiprocessing
+
+from collections import OrderedDict
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    # Python 2 has no read-only view of a dict; callers mustn't change what they get
+    MappingProxyType = dict
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2: config files are parsed one at a time
+    ProcessPoolExecutor = None
 
 import sys
 if sys.version_info[0] == 2:
@@ -32,11 +51,39 @@ else:
         return f
 
 
+ENV_RE = re.compile('%env:([a-zA-Z0-9_]+)%')
+
+
+def expand_env(value, used=None):
+    """Replace the %env:VAR% references in a string with the variables' values.
+
+    The names of the variables are added to used, if given. Variables whose
+    values themselves contain references are expanded in turn."""
+    def replace(match):
+        env_key = match.group(1)
+        if used is not None:
+            used.add(env_key)
+        if env_key not in os.environ:
+            raise ValueError('Cannot find {0} in environment for config interpolation'.format(env_key))
+        return os.environ[env_key]
+
+    while '%env:' in value:
+        new_value = ENV_RE.sub(replace, value)
+        if new_value == value:
+            break
+        value = new_value
+    return value
+
+
 class EnvironmentAwareConfigParser(ConfigParser):
     """A subclass of ConfigParser which allows %env:VAR% interpolation via the
-    get method."""
+    get method.
+
+    Each section's values are interpolated once, the first time the section
+    is looked at, and kept in a read-only mapping (see section_options()), so
+    get() and items() don't repeat the work."""
 
-    r = re.compile('%env:([a-zA-Z0-9_]+)%')
+    r = ENV_RE
 
     def __init__(self, *args, **kwargs):
         """Init with our specific interpolation class (for Python 3)"""
@@ -46,31 +93,85 @@ class EnvironmentAwareConfigParser(ConfigParser):
         except Exception:
             # Python 2
             pass
+        # section -> interpolated options
+        self._frozen = {}
+        # environment variables used in section names (and so already
+        # interpolated into those sections' values)
+        self._env_vars = set()
         ConfigParser.__init__(self, *args, **kwargs)
 
     def read(self, filenames):
         """Load a config file and do environment variable interpolation on the section names."""
         result = ConfigParser.read(self, filenames)
+        self.interpolate_section_names()
+        return result
+
+    def _read(self, *args, **kwargs):
+        self._frozen.clear()
+        return ConfigParser._read(self, *args, **kwargs)
+
+    def interpolate_section_names(self):
         for section in self.sections():
             original_section = section
-            matches = self.r.search(section)
-            while matches:
-                env_key = matches.group(1)
-                if env_key in os.environ:
-                    section = section.replace(matches.group(0), os.environ[env_key])
-                else:
-                    raise ValueError('Cannot find {0} in environment for config interpolation'.format(env_key))
-
-                matches = self.r.search(section)
+            section = expand_env(section, self._env_vars)
             if section != original_section:
                 self.add_section(section)
-                for (option, value) in self.items(original_section):
-                    self.set(section, option, value)
+                for (option, value) in self.items(original_section, raw=True):
+                    self.set(section, option, expand_env(value, self._env_vars))
                 self.remove_section(original_section)
-        return result
+
+    def referenced_env_vars(self):
+        """Get the names of the environment variables the config refers to.
+
+        If none of these change, interpolating the config again would give the
+        same result."""
+        used = set(self._env_vars)
+        sections = [self.defaults()] + [self._sections[section] for section in self.sections()]
+        for options in sections:
+            for value in options.values():
+                if value and '%env:' in value:
+                    expand_env(value, used)
+        return frozenset(used)
+
+    def section_options(self, section):
+        """Get a section's interpolated options (including the defaults), as a read-only mapping."""
+        frozen = self._frozen.get(section)
+        if frozen is None:
+            options = ConfigParser.items(self, section)
+            if sys.version_info[0] == 2:
+                # there's no interpolation class to do this for us
+                options = [(option, expand_env(value)) for (option, value) in options]
+            frozen = MappingProxyType(OrderedDict(options))
+            self._frozen[section] = frozen
+        return frozen
+
+    def set(self, section, option, value=None):
+        self._frozen.clear()
+        return ConfigParser.set(self, section, option, value)
+
+    def remove_option(self, section, option):
+        self._frozen.clear()
+        return ConfigParser.remove_option(self, section, option)
+
+    def remove_section(self, section):
+        self._frozen.clear()
+        return ConfigParser.remove_section(self, section)
+
+    def items(self, section=_NO_FALLBACK, raw=False, vars=None):
+        if section is _NO_FALLBACK:
+            return ConfigParser.items(self)
+        if raw or vars:
+            return ConfigParser.items(self, section, raw=raw, vars=vars)
+        return list(self.section_options(section).items())
 
     @with_fallback
     def get(self, *args, **kwargs):
+        if len(args) == 2 and not kwargs.get('raw') and not kwargs.get('vars'):
+            try:
+                return self.section_options(args[0])[self.optionxform(args[1])]
+            except (NoSectionError, KeyError):
+                # let ConfigParser deal with the fallback, or raise the right error
+                pass
         if sys.version_info[0] > 2:
             return ConfigParser.get(self, *args, **kwargs)
         result = ConfigParser.get(self, *args, **kwargs)
@@ -101,17 +202,171 @@ if sys.version_info[0] > 2:
         r = re.compile('%env:([a-zA-Z0-9_]+)%')
 
         def before_get(self, parser, section, option, value, defaults):
-            parser.get(section, option, raw=True, fallback=value)
-            matches = self.r.search(value)
-            old_value = value
-            while matches:
-                env_key = matches.group(1)
-                if env_key in os.environ:
-                    value = value.replace(matches.group(0), os.environ[env_key])
-                else:
-                    raise ValueError('Cannot find {0} in environment for config interpolation'.format(env_key))
-                matches = self.r.search(value)
-                if value == old_value:
-                    break
-                old_value = value
-            return value
+            return expand_env(value)
+
+
+# path -> ((modification time, size), environment variables used, their hash, sections); see read_sections()
+_sections_cache = {}
+
+
+def _environment_hash(env_vars):
+    """Hash the values of some environment variables, to tell when they change."""
+    values = [(env_var, os.environ.get(env_var)) for env_var in sorted(env_vars)]
+    # JSON rather than repr(), which differs between str and unicode on Python 2
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+
+def _disk_cache_path(cache_dir, path):
+    return os.path.join(cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json')
+
+
+def _load_disk_cache(cache_file, content_hash):
+    """Get (environment variables used, sections) from the cache, if it's still good."""
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        if cache['hash'] == content_hash and cache['environment'] == _environment_hash(cache['env_vars']):
+            return (cache['env_vars'], OrderedDict((section, OrderedDict(options)) for (section, options) in cache['sections']))
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _save_disk_cache(cache_file, content_hash, env_vars, sections):
+    try:
+        directory = os.path.dirname(cache_file)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp_file = '{0}.{1}'.format(cache_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump({
+                'hash': content_hash,
+                'env_vars': env_vars,
+                # only a hash, so the values of the variables aren't written out
+                'environment': _environment_hash(env_vars),
+                'sections': [[section, list(options.items())] for (section, options) in sections.items()]
+            }, f)
+        os.rename(temp_file, cache_file)
+    except (IOError, OSError):
+        pass
+
+
+# below this much (stale) config, starting processes to parse it takes longer than parsing it
+PARALLEL_MIN_BYTES = 256 * 1024
+
+
+def _parse(path, content):
+    """Parse a config file's contents into (environment variables used, {section: {option: value}})."""
+    config = EnvironmentAwareConfigParser()
+    if sys.version_info[0] == 2:
+        # native strings, as ConfigParser.read() would give
+        config.readfp(io.BytesIO(content), path)
+    else:
+        config.read_string(content.decode('utf-8'), source=path)
+    config.interpolate_section_names()
+    sections = OrderedDict((section, OrderedDict(config.section_options(section))) for section in config.sections())
+    return (sorted(config.referenced_env_vars()), sections)
+
+
+def _parse_all(files, workers=None):
+    """Parse a list of (path, content), in parallel if it's worth it."""
+    if workers is None:
+        try:
+            workers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            workers = 1
+    workers = min(workers, len(files))
+    # without multiprocessing.get_context() (Python 2, even with the futures
+    # backport) processes can only be forked, which isn't safe while other
+    # threads may be running
+    if ProcessPoolExecutor is None or not hasattr(multiprocessing, 'get_context'):
+        workers = 1
+    if workers < 2 or sum(len(content) for (_, content) in files) < PARALLEL_MIN_BYTES:
+        return [_parse(path, content) for (path, content) in files]
+    # parsing is all Python, so it needs processes rather than threads
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+    else:
+        context = multiprocessing.get_context('spawn')
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    except (OSError, NotImplementedError, TypeError):
+        # TypeError: before Python 3.7 there's no mp_context, and forking (the
+        # only choice there) isn't safe while other threads may be running
+        return [_parse(path, content) for (path, content) in files]
+    with executor:
+        return list(executor.map(_parse, *zip(*files)))
+
+
+def config_files_in(directory):
+    """List the *.ini files in a directory, in name order."""
+    return sorted(glob.glob(os.path.join(directory, '*.ini')))
+
+
+def read_sections(filename, cache_dir=None):
+    """Read a config file into {section: {option: value}}, in file order.
+
+    Values are interpolated (including %env:VAR%) as by
+    EnvironmentAwareConfigParser.items(). As with ConfigParser.read(), a
+    missing file gives no sections.
+
+    Parsing a large file takes a while, so the result is kept, and used again
+    until the file's modification time or size, or the value of one of the
+    environment variables it uses, changes. If cache_dir is given, it's also
+    saved there, keyed by the hash of the file's contents, so the next run
+    doesn't have to parse the file either."""
+    return read_sections_from([filename], cache_dir)[0]
+
+
+def referenced_env_vars(filename):
+    """Get the names of the environment variables used by a file last read with read_sections()."""
+    cached = _sections_cache.get(os.path.abspath(filename))
+    if cached is None:
+        return frozenset()
+    return frozenset(cached[1])
+
+
+def read_sections_from(filenames, cache_dir=None, workers=None):
+    """Read several config files, returning a list of their sections (as from read_sections()).
+
+    Each file is cached separately, so only the files which have changed are
+    parsed again. If there are several of those (and enough of them to be
+    worth it), they are parsed in parallel by up to workers processes (by
+    default, one per CPU)."""
+    results = [None] * len(filenames)
+    stale = []
+    for (i, filename) in enumerate(filenames):
+        path = os.path.abspath(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            results[i] = OrderedDict()
+            continue
+        key = (stat.st_mtime, stat.st_size)
+        cached = _sections_cache.get(path)
+        if cached is not None and cached[0] == key and cached[2] == _environment_hash(cached[1]):
+            results[i] = OrderedDict(cached[3])
+            continue
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        content_hash = hashlib.sha1(content).hexdigest()
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = _disk_cache_path(cache_dir, path)
+            disk_cached = _load_disk_cache(cache_file, content_hash)
+            if disk_cached is not None:
+                (env_vars, sections) = disk_cached
+                _sections_cache[path] = (key, env_vars, _environment_hash(env_vars), sections)
+                results[i] = OrderedDict(sections)
+                continue
+        stale.append((i, path, key, content, content_hash, cache_file))
+
+    if stale:
+        parsed = _parse_all([(path, content) for (_, path, _, content, _, _) in stale], workers)
+        for ((i, path, key, _, content_hash, cache_file), (env_vars, sections)) in zip(stale, parsed):
+            if cache_file is not None:
+                _save_disk_cache(cache_file, content_hash, env_vars, sections)
+            _sections_cache[path] = (key, env_vars, _environment_hash(env_vars), sections)
+            results[i] = OrderedDict(sections)
+    return results
@@ -7,40 +7,28 @@ import sys
 import time
 import logging
 
-from envconfig import EnvironmentAwareConfigParser
+from collections import OrderedDict
+
+from envconfig import EnvironmentAwareConfigParser, config_files_in, read_sections_from
 
 from optparse import OptionParser, SUPPRESS_HELP
 
 from socket import gethostname
 
-from util import get_config_dict
+from util import get_config_dict, SimpleMonitorConfigurationError
 
+# the monitor, logger and alerter types are imported when they're first used;
+# see MODULES in each of these
 import Monitors.monitor
-import Monitors.network
-import Monitors.service
-import Monitors.host
-import Monitors.file
-import Monitors.compound
-import Monitors.hass
+import Monitors.process
+import Monitors.watch
 
 from simplemonitor import SimpleMonitor
 
-import Loggers.file
-import Loggers.db
+import Loggers.logger
 import Loggers.network
-import Loggers.mqtt
-
-import Alerters.mail
-import Alerters.ses
-import Alerters.bulksms
-import Alerters.fortysixelks
-import Alerters.syslogger
-import Alerters.execute
-import Alerters.slack
-import Alerters.pushover
-import Alerters.pushbullet
-import Alerters.telegram
-import Alerters.nc
+
+import Alerters.alerter
 
 try:
     import colorlog
@@ -52,104 +40,153 @@ VERSION = "1.8"
 main_logger = logging.getLogger('simplemonitor')
 
 
-def load_monitors(m, filename):
-    """Load all the monitors from the config file and return a populated SimpleMonitor."""
-    config = EnvironmentAwareConfigParser()
-    config.read(filename)
-    monitors = config.sections()
-    if "defaults" in monitors:
-        default_config = get_config_dict(config, "defaults")
-        monitors.remove("defaults")
-    else:
-        default_config = {}
+def monitor_files(filename, directories=()):
+    """List the files the monitors are read from: the monitors file, then the *.ini files in each directory."""
+    files = [filename]
+    for directory in directories:
+        files.extend(config_files_in(directory))
+    return files
 
-    myhostname = gethostname().lower()
 
-    main_logger.info('=== Loading monitors')
-    for monitor in monitors:
-        if config.has_option(monitor, "runon"):
-            if myhostname != config.get(monitor, "runon").lower():
-                main_logger.warning("Ignoring monitor %s because it's only for host %s", monitor, config.get(monitor, "runon"))
-                continue
-        monitor_type = config.get(monitor, "type")
-        new_monitor = None
-        config_options = default_config.copy()
-        config_options.update(get_config_dict(config, monitor))
+def monitor_configs(filename, cache_dir=None, directories=()):
+    """Read the monitors, returning {name: config options} for the monitors which should run here.
 
-        try:
-            cls = Monitors.monitor.get_class(monitor_type)
-        except KeyError:
-            main_logger.error(
-                "Unknown monitor type %s; valid types are: %s",
-                monitor_type, ', '.join(Monitors.monitor.all_types()))
-            continue
-        new_monitor = cls(monitor, config_options)
-        new_monitor.set_mon_refs(m)
-
-        main_logger.info("Adding %s monitor %s: %s", monitor_type, monitor, new_monitor)
-        m.add_monitor(monitor, new_monitor)
-
-    for i in list(m.monitors.keys()):
-        m.monitors[i].post_config_setup()
-    main_logger.info('--- Loaded %d monitors', m.count_monitors())
-    return m
+    As well as the monitors file, the *.ini files in the given directories are
+    read (each one is only parsed again when it changes). The [defaults] in
+    the monitors file apply to every monitor; [defaults] in one of the other
+    files only apply to the monitors in that file."""
+    files = monitor_files(filename, directories)
+    all_sections = read_sections_from(files, cache_dir)
+    default_config = all_sections[0].pop("defaults", {})
 
+    myhostname = gethostname().lower()
 
-def load_loggers(m, config):
-    """Load the loggers listed in the config object."""
+    configs = OrderedDict()
+    for (config_file, sections) in zip(files, all_sections):
+        file_defaults = default_config
+        if config_file != filename and "defaults" in sections:
+            file_defaults = default_config.copy()
+            file_defaults.update(sections.pop("defaults"))
+        for (monitor, options) in sections.items():
+            if "runon" in options:
+                if myhostname != options["runon"].lower():
+                    main_logger.warning("Ignoring monitor %s because it's only for host %s", monitor, options["runon"])
+                    continue
+            if "type" not in options:
+                main_logger.error("Monitor %s has no type", monitor)
+                continue
+            if monitor in configs:
+                main_logger.warning("Monitor %s is defined more than once; using the one in %s", monitor, config_file)
+            config_options = file_defaults.copy()
+            config_options.update(options)
+            configs[monitor] = config_options
+    return configs
 
+
+def logger_configs(config):
+    """Get {name: config options} for the loggers listed in the config object."""
     if config.has_option("reporting", "loggers"):
         loggers = config.get("reporting", "loggers").split(",")
     else:
         loggers = []
 
-    main_logger.info('=== Loading loggers')
+    configs = OrderedDict()
     for config_logger in loggers:
-        logger_type = config.get(config_logger, "type")
         config_options = get_config_dict(config, config_logger)
         config_options['_name'] = config_logger
-        try:
-            logger_cls = Loggers.logger.get_class(logger_type)
-        except KeyError:
-            main_logger.error(
-                "Unknown logger type %s; valid types are: %s",
-                logger_type, ', '.join(Loggers.logger.all_types()))
-            continue
-        new_logger = logger_cls(config_options)
-        main_logger.info("Adding %s logger %s: %s", logger_type, config_logger, new_logger)
-        m.add_logger(config_logger, new_logger)
-        del new_logger
-    main_logger.info('--- Loaded %d loggers', len(m.loggers))
-    return m
+        configs[config_logger] = config_options
+    return configs
 
 
-def load_alerters(m, config):
-    """Load the alerters listed in the config object."""
+def alerter_configs(config):
+    """Get {name: config options} for the alerters listed in the config object."""
     if config.has_option("reporting", "alerters"):
         alerters = config.get("reporting", "alerters").split(",")
     else:
         alerters = []
 
-    main_logger.info('=== Loading alerters')
+    configs = OrderedDict()
     for alerter in alerters:
-        alerter_type = config.get(alerter, "type")
-        config_options = get_config_dict(config, alerter)
-        try:
-            alerter_cls = Alerters.alerter.get_class(alerter_type)
-        except KeyError:
-            main_logger.error(
-                "Unknown alerter type %s; valid types are: %s",
-                alerter_type, ', '.join(Alerters.alerter.all_types()))
-            continue
-        new_alerter = alerter_cls(config_options)
-        main_logger.info("Adding %s alerter %s", alerter_type, alerter)
-        new_alerter.name = alerter
-        m.add_alerter(alerter, new_alerter)
-        del new_alerter
+        configs[alerter] = get_config_dict(config, alerter)
+    return configs
+
+
+def load_monitors(m, filename, cache_dir=None, directories=()):
+    """Load all the monitors from the config file(s) and return a populated SimpleMonitor."""
+    main_logger.info('=== Loading monitors')
+    m.update_monitors(monitor_configs(filename, cache_dir, directories))
+    main_logger.info('--- Loaded %d monitors', m.count_monitors())
+    return m
+
+
+def load_loggers(m, config):
+    """Load the loggers listed in the config object."""
+    main_logger.info('=== Loading loggers')
+    m.update_loggers(logger_configs(config))
+    main_logger.info('--- Loaded %d loggers', len(m.loggers))
+    return m
+
+
+def load_alerters(m, config):
+    """Load the alerters listed in the config object."""
+    main_logger.info('=== Loading alerters')
+    m.update_alerters(alerter_configs(config))
     main_logger.info('--- Loaded %d alerters', len(m.alerters))
     return m
 
 
+def monitors_dirs(config):
+    """Get the directories of extra monitor config files from the config object."""
+    if not config.has_option("monitor", "monitors_dir"):
+        return []
+    return [directory.strip() for directory in config.get("monitor", "monitors_dir").split(",") if directory.strip()]
+
+
+def config_files(config_file, config=None):
+    """Get the files the configuration is read from, for watching for changes.
+
+    Directories are included too, so files being added or removed is noticed."""
+    files = [config_file]
+    if config is not None:
+        directories = monitors_dirs(config)
+        files.extend(monitor_files(config.get("monitor", "monitors", fallback="monitors.ini"), directories))
+        files.extend(directories)
+    return files
+
+
+def config_mtimes(files):
+    mtimes = []
+    for filename in files:
+        try:
+            mtimes.append(os.stat(filename).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def reload_config(m, config_file):
+    """Read the configuration again, updating the monitors, loggers and alerters which have changed.
+
+    Returns the new config object, or None if it couldn't be loaded (in which
+    case everything is left as it was)."""
+    main_logger.warning('Reloading configuration from %s', config_file)
+    config = EnvironmentAwareConfigParser()
+    try:
+        if not config.read(config_file):
+            raise IOError('Configuration file "{0}" does not exist'.format(config_file))
+        monitors_file = config.get("monitor", "monitors", fallback="monitors.ini")
+        monitors = monitor_configs(monitors_file, config.get("monitor", "config_cache", fallback=None) or None, monitors_dirs(config))
+        if not monitors:
+            raise SimpleMonitorConfigurationError("no monitors in {0}".format(monitors_file))
+        m.update_config(monitors, logger_configs(config), alerter_configs(config))
+    except Exception as e:
+        main_logger.error('Unable to reload configuration, carrying on with the old one: %s', e)
+        return None
+    main_logger.warning('Reloaded configuration: %d monitors, %d loggers, %d alerters',
+                        m.count_monitors(), len(m.loggers), len(m.alerters))
+    return config
+
+
 def main():
     r"""This is where it happens \o/"""
 
@@ -272,9 +309,37 @@ def main():
         main_logger.critical('allow_pickle should be "true" or "false".')
         sys.exit(1)
 
-    m = SimpleMonitor(allow_pickle=allow_pickle)
+    try:
+        state_store = config.getboolean("monitor", "state_store",
+                                        fallback='false')
+    except ValueError:
+        main_logger.critical('state_store should be "true" or "false".')
+        sys.exit(1)
+
+    if config.has_option("monitor", "subprocess_mode"):
+        try:
+            Monitors.process.configure(
+                config.get("monitor", "subprocess_mode"),
+                int(config.get("monitor", "subprocess_workers", fallback='2'))
+            )
+        except ValueError as e:
+            main_logger.critical('Bad subprocess_mode/subprocess_workers setting: %s', e)
+            sys.exit(1)
+
+    if config.has_option("monitor", "file_watch"):
+        try:
+            Monitors.watch.configure(config.get("monitor", "file_watch"))
+        except ValueError as e:
+            main_logger.critical('Bad file_watch setting: %s', e)
+            sys.exit(1)
 
-    m = load_monitors(m, monitors_file)
+    m = SimpleMonitor(allow_pickle=allow_pickle, state_store=state_store)
+
+    try:
+        m = load_monitors(m, monitors_file, config.get("monitor", "config_cache", fallback=None) or None, monitors_dirs(config))
+    except SimpleMonitorConfigurationError as e:
+        main_logger.critical('Configuration error: %s', e)
+        sys.exit(1)
 
     count = m.count_monitors()
     if count == 0:
@@ -325,6 +390,14 @@ def main():
 
     if not options.quiet:
         main_logger.info("=== Starting... (loop runs every %ds) Hit ^C to stop", interval)
+    try:
+        reload_on_change = config.getboolean("monitor", "reload_on_change", fallback='false')
+    except ValueError:
+        main_logger.critical('reload_on_change should be "true" or "false".')
+        sys.exit(1)
+    watched_files = config_files(options.config, config)
+    watched_mtimes = config_mtimes(watched_files)
+
     loop = True
     heartbeat = 0
 
@@ -337,6 +410,19 @@ def main():
                 if loops == 0:
                     main_logger.warning('Ran out of loop counter, will stop after this one')
                     loop = False
+            if reload_on_change and not m.need_reload:
+                mtimes = config_mtimes(watched_files)
+                if mtimes != watched_mtimes:
+                    main_logger.info('Configuration files have changed')
+                    m.need_reload = True
+            if m.need_reload:
+                m.need_reload = False
+                new_config = reload_config(m, options.config)
+                if new_config is not None:
+                    config = new_config
+                    interval = config.getint("monitor", "interval", fallback=interval)
+                    watched_files = config_files(options.config, config)
+                watched_mtimes = config_mtimes(watched_files)
             m.run_loop()
 
             if options.loglevel in ['error', 'critical', 'warn'] and not options.no_heartbeat:
@@ -379,6 +465,8 @@ def main():
         except Exception:
             main_logger.error("Couldn't remove pidfile!")
 
+    Monitors.process.shutdown()
+
     if not options.quiet:
         main_logger.info("Finished.")
 
@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Finding third-party monitors, loggers and alerters.
+
+Other packages can provide plugins by declaring entry points in these groups:
+    simplemonitor.monitors, simplemonitor.loggers, simplemonitor.alerters
+Each entry point's name is the plugin's type (as used in the config), and it
+points at the plugin class, e.g. in setup.py:
+    entry_points={'simplemonitor.monitors': ['mything = mypackage.monitors:MonitorMyThing']}
+
+Looking for entry points means reading the metadata of every installed
+distribution, so the entry points found are saved to a small cache file. The
+cache is used for as long as nothing is installed or removed, which we notice
+from the modification times of the directories on sys.path, and of the
+entry_points.txt files in them (which change without the directory changing
+when a package installed in development mode is edited)."""
+
+import json
+import logging
+import os
+import sys
+
+GROUPS = ('simplemonitor.monitors', 'simplemonitor.loggers', 'simplemonitor.alerters')
+
+plugin_logger = logging.getLogger('simplemonitor.plugins')
+
+# group -> {type: "module:attribute"}, once loaded
+_index = None
+
+
+def cache_path():
+    """Where to keep the index of entry points.
+
+    Set SIMPLEMONITOR_PLUGIN_CACHE to change it, or to an empty string to
+    not keep one."""
+    path = os.environ.get('SIMPLEMONITOR_PLUGIN_CACHE')
+    if path is not None:
+        return path or None
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'simplemonitor', 'plugins.json')
+
+
+def _fingerprint():
+    """Something which changes when distributions are installed or removed."""
+    fingerprint = [sys.version]
+    for path in sys.path:
+        # the current directory changes whenever we write a file to it
+        if path in ('', '.'):
+            continue
+        try:
+            fingerprint.append([path, os.stat(path).st_mtime])
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in sorted(names):
+            if not name.endswith(('.dist-info', '.egg-info')):
+                continue
+            entry_points = os.path.join(path, name, 'entry_points.txt')
+            try:
+                fingerprint.append([entry_points, os.stat(entry_points).st_mtime])
+            except OSError:
+                pass
+    return fingerprint
+
+
+def _entry_points():
+    """List all the (group, name, value) of the entry points in our groups."""
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+    if metadata is not None:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            found = [(ep.group, ep.name, ep.value) for group in GROUPS for ep in entry_points.select(group=group)]
+        else:
+            found = [(group, ep.name, ep.value) for group in GROUPS for ep in entry_points.get(group, [])]
+        return found
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+    # pkg_resources.working_set is made when pkg_resources is first imported;
+    # make a new one, so it's of sys.path as it is now (as importlib.metadata's is)
+    working_set = pkg_resources.WorkingSet()
+    return [
+        (group, ep.name, '{0}:{1}'.format(ep.module_name, '.'.join(ep.attrs)))
+        for group in GROUPS for ep in working_set.iter_entry_points(group)
+    ]
+
+
+def _scan():
+    index = dict((group, {}) for group in GROUPS)
+    for (group, name, value) in _entry_points():
+        if name in index[group]:
+            plugin_logger.warning("Entry point %s in %s is defined more than once; using %s", name, group, index[group][name])
+            continue
+        index[group][name] = value
+    return index
+
+
+def _load_cache(path, fingerprint):
+    try:
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('fingerprint') != fingerprint:
+        return None
+    return cache.get('index')
+
+
+def _save_cache(path, fingerprint, index):
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp_path = '{0}.{1}'.format(path, os.getpid())
+        with open(temp_path, 'w') as cache_file:
+            json.dump({'fingerprint': fingerprint, 'index': index}, cache_file)
+        os.rename(temp_path, path)
+    except (IOError, OSError) as e:
+        plugin_logger.debug("Couldn't save plugin cache %s: %s", path, e)
+
+
+def get_index():
+    """Get the entry points in all our groups, as {group: {type: "module:attribute"}}."""
+    global _index
+    if _index is not None:
+        return _index
+    path = cache_path()
+    # JSON turns the tuples into lists, so compare with what it will give us
+    fingerprint = json.loads(json.dumps(_fingerprint()))
+    index = None
+    if path is not None:
+        index = _load_cache(path, fingerprint)
+    if index is None:
+        plugin_logger.debug("Looking for plugins")
+        index = _scan()
+        if path is not None:
+            _save_cache(path, fingerprint, index)
+    _index = index
+    return _index
+
+
+def find_plugins(group):
+    """Get the plugins in an entry point group, as {type: "module:attribute"}."""
+    return get_index().get(group, {})
+
+
+def clear_cache():
+    global _index
+    _index = None
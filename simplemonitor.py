@@ -4,11 +4,16 @@
 import signal
 import copy
 import pickle
-import time
 import logging
 
+import Alerters.alerter
+import Alerters.template
 import Loggers
+import Loggers.logger
 import Monitors
+import Monitors.monitor
+import statestore
+import util
 
 module_logger = logging.getLogger('simplemonitor')
 
@@ -18,11 +23,26 @@ class SimpleMonitor:
     # TODO: move this outside into monitor.py?
     #      could give better control over restarting the listener thread
     need_hup = False
+    # set when we should re-read our configuration
+    need_reload = False
 
-    def __init__(self, allow_pickle=True):
-        """Main class turn on."""
+    def __init__(self, allow_pickle=True, state_store=False):
+        """Main class turn on.
+
+        If state_store is set, the monitors' counters are kept in a columnar
+        StateStore, which makes fleet-wide queries cheap for large numbers of
+        monitors."""
         self.allow_pickle = allow_pickle
+        if state_store:
+            self.state_store = statestore.StateStore()
+        else:
+            self.state_store = None
         self.monitors = {}
+        # the config options each monitor, logger and alerter was made from
+        # (see update_monitors() etc), so we can tell what changes on reload
+        self.monitor_configs = {}
+        self.logger_configs = {}
+        self.alerter_configs = {}
         self.failed = []
         self.still_failing = []
         self.skipped = []
@@ -31,6 +51,10 @@ class SimpleMonitor:
 
         self.loggers = {}
         self.alerters = {}
+        # group name -> list of alerters for that group
+        self.alerter_groups = {}
+        # monitors which might need alerting for this loop, in the order they ran
+        self.alert_pending = []
 
         try:
             signal.signal(signal.SIGHUP, self.hup_loggers)
@@ -40,15 +64,261 @@ class SimpleMonitor:
             module_logger.warning("Unable to trap SIGHUP... maybe it doesn't exist on this platform.\n")
 
     def hup_loggers(self, sig_number, stack_frame):
-        """Handle a SIGHUP (rotate logfiles).
+        """Handle a SIGHUP.
+
+        A SIGHUP does two things: the loggers reopen their files (so they can
+        be rotated), and the configuration is reloaded. Reloading a
+        configuration which hasn't changed changes nothing, so a SIGHUP sent
+        just to rotate the logs is harmless.
 
-        We set a variable to say we want to do this later (so it's done at the right time)."""
+        We set variables to say we want to do this later (so it's done at the right time)."""
 
         self.need_hup = True
-        module_logger.info("We get signal.")
+        self.need_reload = True
+        module_logger.info("SIGHUP received; will reopen log files and reload the configuration")
 
     def add_monitor(self, name, monitor):
         self.monitors[name] = monitor
+        if self.state_store is not None:
+            self.state_store.add(name, monitor)
+
+    @staticmethod
+    def _changed(objects, old_configs, configs):
+        """Work out which of the named objects need making, and which removing.
+
+        Returns (names to make, names to remove)."""
+        make = [name for (name, config) in configs.items()
+                if name not in objects or old_configs.get(name) != config]
+        remove = [name for name in objects if name not in configs]
+        return (make, remove)
+
+    def update_config(self, monitors, loggers, alerters):
+        """Make our monitors, loggers and alerters match the given configs.
+
+        Everything is made (and checked) before anything is changed, so if
+        any of them can't be made, an exception is raised and nothing
+        changes. See update_monitors() etc."""
+        monitor_plan = self.prepare_monitors(monitors)
+        try:
+            logger_plan = self.prepare_loggers(loggers)
+            alerter_plan = self.prepare_alerters(alerters)
+        except Exception:
+            self.discard_monitors(monitor_plan)
+            raise
+        self.apply_monitors(monitor_plan)
+        self.apply_loggers(logger_plan)
+        self.apply_alerters(alerter_plan)
+
+    def update_monitors(self, configs):
+        """Make our monitors match the given configs, {name: config options}.
+
+        Only monitors which are new, or whose config options have changed, are
+        made; the others (and their state) are left alone. A changed monitor
+        whose type is the same takes over the old one's state. Monitors which
+        watch other monitors (e.g. compound) are always remade, as the monitors
+        they watch may have been.
+
+        Nothing is changed if any of the monitors can't be made, or if any of
+        their dependencies are missing; a SimpleMonitorConfigurationError (or
+        MonitorConfigurationError) is raised instead."""
+        self.apply_monitors(self.prepare_monitors(configs))
+
+    def prepare_monitors(self, configs):
+        """Make the monitors update_monitors() would, without changing anything yet.
+
+        Returns a plan to give to apply_monitors() (or discard_monitors())."""
+        (make, remove) = self._changed(self.monitors, self.monitor_configs, configs)
+        if make or remove:
+            make.extend(name for (name, monitor) in self.monitors.items()
+                        if monitor.watches_monitors and name in configs and name not in make)
+        new_monitors = {}
+        try:
+            for name in make:
+                monitor_type = configs[name].get('type')
+                try:
+                    cls = Monitors.monitor.get_class(monitor_type)
+                except KeyError:
+                    module_logger.error(
+                        "Unknown monitor type %s; valid types are: %s",
+                        monitor_type, ', '.join(Monitors.monitor.all_types()))
+                    if name in self.monitors:
+                        remove.append(name)
+                    continue
+                new_monitors[name] = cls(name, dict(configs[name]))
+
+            # check everything post_config_setup() would, so it can't fail once
+            # we've started changing things
+            names = (set(self.monitors) - set(remove)) | set(new_monitors)
+            missing = []
+            for name in sorted(names):
+                monitor = new_monitors.get(name) or self.monitors[name]
+                missing.extend(
+                    "dependency {0} of monitor {1} is not defined".format(dependency, name)
+                    for dependency in monitor._dependencies if dependency not in names)
+                missing.extend(
+                    "monitor {0} watched by monitor {1} is not defined".format(watched, name)
+                    for watched in monitor.get_watched_monitors() if watched not in names)
+            cycle = self._find_watch_cycle(dict((name, new_monitors.get(name) or self.monitors[name]) for name in names))
+            if cycle:
+                missing.append("monitors {0} watch each other".format(" -> ".join(cycle)))
+            if missing:
+                raise util.SimpleMonitorConfigurationError("; ".join(missing))
+        except Exception:
+            self.discard_monitors((new_monitors, remove, configs))
+            raise
+        return (new_monitors, remove, configs)
+
+    @staticmethod
+    def _find_watch_cycle(monitors):
+        """Find monitors which watch each other (e.g. compound monitors of each other).
+
+        monitors is {name: monitor}. Returns the names round the cycle, or None."""
+        watching = dict(
+            (name, [watched for watched in monitor.get_watched_monitors() if watched in monitors])
+            for (name, monitor) in monitors.items() if monitor.watches_monitors)
+        # name -> True while it's on the path being followed, False once done
+        on_path = {}
+        for start in sorted(watching):
+            if start in on_path:
+                continue
+            path = [start]
+            on_path[start] = True
+            stack = [iter(watching[start])]
+            while stack:
+                for name in stack[-1]:
+                    if name not in watching:
+                        continue
+                    if on_path.get(name):
+                        return path[path.index(name):] + [name]
+                    if name not in on_path:
+                        path.append(name)
+                        on_path[name] = True
+                        stack.append(iter(watching[name]))
+                        break
+                else:
+                    on_path[path.pop()] = False
+                    stack.pop()
+        return None
+
+    def discard_monitors(self, plan):
+        """Throw away the monitors made for a plan which won't be applied."""
+        for monitor in plan[0].values():
+            monitor.retire()
+
+    def apply_monitors(self, plan):
+        """Put the monitors from prepare_monitors() in place."""
+        (new_monitors, remove, configs) = plan
+        # if a monitor watching others goes, or a new one comes, the others'
+        # listeners must go too; the watching monitors are all being remade,
+        # and will start listening again in post_config_setup()
+        clear_listeners = any(
+            monitor.watches_monitors
+            for monitor in list(new_monitors.values()) + [self.monitors[name] for name in remove])
+        for name in remove:
+            module_logger.info("Removing monitor %s", name)
+            if self.state_store is not None:
+                self.state_store.remove(name)
+            self.monitors[name].retire()
+            del self.monitors[name]
+            del self.monitor_configs[name]
+        if clear_listeners:
+            for monitor in self.monitors.values():
+                monitor.clear_failure_listeners()
+        for (name, monitor) in new_monitors.items():
+            module_logger.info("Adding %s monitor %s: %s", monitor.type, name, monitor)
+            old_monitor = self.monitors.get(name)
+            if old_monitor is not None:
+                if old_monitor.type == monitor.type:
+                    monitor.take_state(old_monitor)
+                old_monitor.retire()
+            monitor.set_mon_refs(self)
+            if self.state_store is not None:
+                if old_monitor is not None:
+                    self.state_store.remove(name)
+                self.state_store.add(name, monitor)
+            self.monitors[name] = monitor
+            self.monitor_configs[name] = configs[name]
+        for monitor in new_monitors.values():
+            monitor.post_config_setup()
+
+    def update_loggers(self, configs):
+        """Make our loggers match the given configs, {name: config options}.
+
+        As for update_monitors(), only new or changed loggers are made."""
+        self.apply_loggers(self.prepare_loggers(configs))
+
+    def prepare_loggers(self, configs):
+        """Make the loggers update_loggers() would; returns a plan for apply_loggers()."""
+        (make, remove) = self._changed(self.loggers, self.logger_configs, configs)
+        new_loggers = {}
+        for name in make:
+            logger_type = configs[name].get('type')
+            try:
+                cls = Loggers.logger.get_class(logger_type)
+            except KeyError:
+                module_logger.error(
+                    "Unknown logger type %s; valid types are: %s",
+                    logger_type, ', '.join(Loggers.logger.all_types()))
+                if name in self.loggers:
+                    remove.append(name)
+                continue
+            new_loggers[name] = cls(dict(configs[name]))
+        return (new_loggers, remove, configs)
+
+    def apply_loggers(self, plan):
+        """Put the loggers from prepare_loggers() in place."""
+        (new_loggers, remove, configs) = plan
+        for name in remove:
+            module_logger.info("Removing logger %s", name)
+            del self.loggers[name]
+            del self.logger_configs[name]
+        for (name, logger) in new_loggers.items():
+            module_logger.info("Adding %s logger %s: %s", logger.type, name, logger)
+            self.add_logger(name, logger)
+            self.logger_configs[name] = configs[name]
+
+    def update_alerters(self, configs):
+        """Make our alerters match the given configs, {name: config options}.
+
+        As for update_monitors(), only new or changed alerters are made. A
+        changed alerter of the same type keeps the list of failures it has yet
+        to send out-of-hours alerts for."""
+        self.apply_alerters(self.prepare_alerters(configs))
+
+    def prepare_alerters(self, configs):
+        """Make the alerters update_alerters() would; returns a plan for apply_alerters()."""
+        (make, remove) = self._changed(self.alerters, self.alerter_configs, configs)
+        new_alerters = {}
+        for name in make:
+            alerter_type = configs[name].get('type')
+            try:
+                cls = Alerters.alerter.get_class(alerter_type)
+            except KeyError:
+                module_logger.error(
+                    "Unknown alerter type %s; valid types are: %s",
+                    alerter_type, ', '.join(Alerters.alerter.all_types()))
+                if name in self.alerters:
+                    remove.append(name)
+                continue
+            new_alerters[name] = cls(dict(configs[name]))
+            new_alerters[name].name = name
+        return (new_alerters, remove, configs)
+
+    def apply_alerters(self, plan):
+        """Put the alerters from prepare_alerters() in place."""
+        (new_alerters, remove, configs) = plan
+        for name in remove:
+            module_logger.info("Removing alerter %s", name)
+            del self.alerters[name]
+            del self.alerter_configs[name]
+        for (name, alerter) in new_alerters.items():
+            module_logger.info("Adding %s alerter %s", alerter.type, name)
+            old_alerter = self.alerters.get(name)
+            if old_alerter is not None and old_alerter.type == alerter.type:
+                alerter.ooh_failures = old_alerter.ooh_failures
+            self.alerters[name] = alerter
+            self.alerter_configs[name] = configs[name]
+        self.update_alerter_groups()
 
     def set_tolerance(self, monitor, tolerance):
         self.monitors[monitor].set_tolerance(tolerance)
@@ -74,12 +344,51 @@ class SimpleMonitor:
                     ok = False
         return ok
 
+    def note_alert_state(self, name):
+        """Queue a monitor for the alerters if its current state could generate an alert."""
+        monitor = self.monitors[name]
+        if monitor.virtual_fail_count() > 0:
+            self.alert_pending.append(name)
+        elif monitor.all_better_now() and monitor.last_virtual_fail_count() > 0:
+            self.alert_pending.append(name)
+
     def run_tests(self):
+        util.start_loop()
+        try:
+            self._run_tests()
+        finally:
+            util.end_loop()
+        self.update_failing()
+
+    def update_failing(self):
+        """Note which monitors are failing past their tolerance.
+
+        failed gets the monitors which have just started failing, and
+        still_failing those which were already failing."""
+        failed = []
+        still_failing = []
+        for (name, count) in self.virtual_fail_counts().items():
+            if count == 1:
+                failed.append(name)
+            else:
+                still_failing.append(name)
+        self.failed = failed
+        self.still_failing = still_failing
+
+    def _run_tests(self):
         self.reset_monitors()
+        self.alert_pending = []
 
         joblist = list(self.monitors.keys())
         new_joblist = []
-        failed = []
+        failed = set()
+        # dependency -> the monitors which depend on it
+        dependents = {}
+        for (name, monitor) in self.monitors.items():
+            for dependency in monitor.get_dependencies():
+                dependents.setdefault(dependency, []).append(name)
+        # monitors which have finished this loop, whatever their result
+        finished = set()
 
         not_run = False
 
@@ -97,8 +406,10 @@ class SimpleMonitor:
                         if dep in failed:
                             # oh wait, actually one of its deps failed, so we'll never be able to run it
                             module_logger.info("Doesn't look like %s worked, skipping %s", dep, monitor)
-                            failed.append(monitor)
+                            failed.add(monitor)
+                            finished.add(monitor)
                             self.monitors[monitor].record_skip(dep)
+                            self.note_alert_state(monitor)
                             try:
                                 new_joblist.remove(monitor)
                             except Exception:
@@ -106,35 +417,49 @@ class SimpleMonitor:
                                 module_logger.debug("new_joblist is currently: %s", new_joblist)
                             break
                     continue
+                if any(m not in finished for m in self.monitors[monitor].get_run_after()):
+                    # this monitor wants to look at others' results, so wait for them
+                    new_joblist.append(monitor)
+                    continue
                 try:
                     if self.monitors[monitor].should_run():
                         not_run = False
-                        start_time = time.time()
+                        start_time = util.monotonic_ns()
                         self.monitors[monitor].run_test()
-                        end_time = time.time()
-                        self.monitors[monitor].last_run_duration = end_time - start_time
+                        end_time = util.monotonic_ns()
+                        self.monitors[monitor].record_run((end_time - start_time) / 1000000000.0)
                     else:
                         not_run = True
                         self.monitors[monitor].record_skip(None)
                         module_logger.info("Not run: %s", monitor)
                 except Exception:
                     module_logger.exception("Monitor %s threw exception during run_test()", monitor)
+                finished.add(monitor)
+                self.note_alert_state(monitor)
                 if self.monitors[monitor].get_error_count() > 0:
                     if self.monitors[monitor].virtual_fail_count() == 0:
                         module_logger.warning("monitor failed but within tolerance: %s", monitor)
                     else:
                         module_logger.error("monitor failed: %s (%s)", monitor, self.monitors[monitor].last_result)
-                    failed.append(monitor)
+                    failed.add(monitor)
                 else:
                     if not not_run:
                         module_logger.info("monitor passed: %s", monitor)
-                    for monitor2 in joblist:
+                    for monitor2 in dependents.get(monitor, ()):
                         self.monitors[monitor2].dependency_succeeded(monitor)
+            if len(new_joblist) == len(joblist):
+                module_logger.critical("Monitors %s are waiting for each other and can't be run; check their dependencies", ", ".join(new_joblist))
+                break
             joblist = copy.copy(new_joblist)
 
-    def log_result(self, logger):
-        """Use the given logger object to log our state."""
+    def log_result(self, logger, counts=None):
+        """Use the given logger object to log our state.
+
+        counts is the result of count_failing(), if it's already known."""
         logger.check_dependencies(self.failed + self.still_failing + self.skipped)
+        if counts is None:
+            counts = self.count_failing()
+        logger.counts = counts
         logger.start_batch()
         for key in list(self.monitors.keys()):
             self.monitors[key].log_result(key, logger)
@@ -148,47 +473,97 @@ class SimpleMonitor:
 
     def do_alert(self, alerter):
         """Use the given alerter object to send an alert, if needed."""
-        alerter.check_dependencies(self.failed + self.still_failing + self.skipped)
-        for key in list(self.monitors.keys()):
+        self._send_alerts([alerter])
+
+    def _send_alerts(self, alerters):
+        """Send alerts for this loop's candidate monitors via the given alerters.
+
+        Only monitors in alert_pending are considered (those which are failing,
+        or have just recovered); monitors in a steady OK state can never
+        generate an alert. The group index maps each monitor straight to the
+        alerters which handle its group."""
+        Alerters.template.start_round()
+        for alerter in alerters:
+            alerter.check_dependencies(self.failed + self.still_failing + self.skipped)
+            alerter.start_batch()
+        for key in self.alert_pending:
+            monitor = self.monitors[key]
             # Don't generate alerts for monitors which want it done remotely
-            if self.monitors[key].remote_alerting:
+            if monitor.remote_alerting:
                 # TODO: could potentially disable alerts by setting a monitor to remote alerting, but not having anywhere to send it!
                 module_logger.debug("skipping alert for monitor %s as it wants remote alerting", key)
                 continue
-            module_logger.debug("considering alert for monitor %s (group: %s) with alerter %s (groups: %s)",
-                                self.monitors[key].name,
-                                self.monitors[key].group,
-                                alerter.name,
-                                alerter.groups
-                                )
-            try:
-                if self.monitors[key].group in alerter.groups:
-                    # Only notifications for services that have it enabled
-                    if self.monitors[key].notify:
-                        module_logger.debug("notifying alerter %s", alerter.name)
-                        alerter.send_alert(key, self.monitors[key])
-                    else:
-                        module_logger.info("skipping alerters for disabled monitor %s", key)
-                else:
-                    module_logger.info("skipping alerter %s as monitor is not in group", alerter.name)
-            except Exception:  # pragma: no cover
-                module_logger.exception("exception caught while alerting for %s", key)
+            # Only notifications for services that have it enabled
+            if not monitor.notify:
+                module_logger.info("skipping alerters for disabled monitor %s", key)
+                continue
+            for alerter in self.alerter_groups.get(monitor.group, []):
+                if alerter not in alerters:
+                    continue
+                module_logger.debug("notifying alerter %s for monitor %s", alerter.name, key)
+                try:
+                    alerter.send_alert(key, monitor)
+                except Exception:  # pragma: no cover
+                    module_logger.exception("exception caught while alerting for %s", key)
         for key in list(self.remote_monitors.keys()):
-            try:
-                if self.remote_monitors[key].remote_alerting:
+            if not self.remote_monitors[key].remote_alerting:
+                module_logger.debug("not alerting for monitor %s as it doesn't want remote alerts", key)
+                continue
+            for alerter in alerters:
+                try:
                     alerter.send_alert(key, self.remote_monitors[key])
-                else:
-                    module_logger.debug("not alerting for monitor %s as it doesn't want remote alerts", key)
-                    continue
+                except Exception:  # pragma: no cover
+                    module_logger.exception("exception caught while alerting for %s", key)
+        for alerter in alerters:
+            try:
+                alerter.end_batch()
             except Exception:  # pragma: no cover
-                module_logger.exception("exception caught while alerting for %s", key)
+                module_logger.exception("exception caught while finishing alert batch for %s", alerter.name)
+        Alerters.template.end_round()
 
     def count_monitors(self):
         """Gets the number of monitors we have defined."""
         return len(self.monitors)
 
+    def failing_monitors(self):
+        """Get the names of the monitors which are failing past their tolerance."""
+        if self.state_store is not None:
+            return self.state_store.failing()
+        return [key for (key, monitor) in self.monitors.items() if monitor.virtual_fail_count() > 0]
+
+    def virtual_fail_counts(self):
+        """Map the name of each monitor failing past its tolerance to its virtual fail count."""
+        if self.state_store is not None:
+            return self.state_store.virtual_fail_counts()
+        counts = {}
+        for (key, monitor) in self.monitors.items():
+            count = monitor.virtual_fail_count()
+            if count > 0:
+                counts[key] = count
+        return counts
+
+    def count_failing(self):
+        """Count our monitors by status; see StateStore.counts()."""
+        if self.state_store is not None:
+            return self.state_store.counts()
+        failing = [m for m in self.monitors.values() if m.virtual_fail_count() > 0]
+        return {
+            'ok': len(self.monitors) - len(failing),
+            'failing': len(failing),
+            'urgent': len([m for m in failing if m.urgent and m.notify]),
+        }
+
     def add_alerter(self, name, alerter):
         self.alerters[name] = alerter
+        self.update_alerter_groups()
+
+    def update_alerter_groups(self):
+        """Rebuild the index of which alerters handle each monitor group."""
+        alerter_groups = {}
+        for alerter in self.alerters.values():
+            for group in alerter.groups:
+                alerter_groups.setdefault(group, []).append(alerter)
+        self.alerter_groups = alerter_groups
 
     def add_logger(self, name, logger):
         if isinstance(logger, Loggers.logger.Logger):
@@ -197,8 +572,7 @@ class SimpleMonitor:
             module_logger.critical('Failed to add logger because it is not the right type')
 
     def do_alerts(self):
-        for key in list(self.alerters.keys()):
-            self.do_alert(self.alerters[key])
+        self._send_alerts(list(self.alerters.values()))
 
     def do_recovery(self):
         for key in list(self.monitors.keys()):
@@ -211,8 +585,9 @@ class SimpleMonitor:
                 self.loggers[logger].hup()
             self.need_hup = False
 
+        counts = self.count_failing()
         for key in list(self.loggers.keys()):
-            self.log_result(self.loggers[key])
+            self.log_result(self.loggers[key], counts)
 
     def update_remote_monitor(self, data, hostname):
         for (name, state) in data.items():
@@ -0,0 +1,223 @@
+# coding=utf-8
+"""Columnar storage for the hot per-monitor counters.
+
+With a large number of monitors, questions about the whole fleet ("which
+monitors are failing?", "how many are OK?") mean calling methods on every
+Monitor object. A StateStore instead keeps the counters for all monitors in
+parallel typed arrays, indexed by monitor, so those questions become a single
+pass over a few arrays (or a vectorized operation, if NumPy is available).
+
+Monitors added to the store get a StoredMonitorState, which reads and writes
+its counters straight from the arrays, so the Monitor API is unchanged."""
+
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Monitors.monitor import MonitorState
+
+# the typecode of the counter columns: 'q' (64 bits) only exists from Python
+# 3.3, so Python 2 uses the platform's long
+INT_TYPECODE = 'q' if sys.version_info >= (3, 3) else 'l'
+
+
+class StateStore(object):
+    """Parallel arrays of monitor counters, indexed by monitor."""
+
+    # (field, array typecode)
+    COLUMNS = (
+        ('error_count', INT_TYPECODE),
+        ('tolerance', INT_TYPECODE),
+        ('success_count', INT_TYPECODE),
+        ('last_run', 'd'),
+        ('last_run_duration', 'd'),
+        ('urgent', 'B'),
+        ('notify', 'B'),
+    )
+    # columns which are part of the monitor's state (the rest mirror its config)
+    STATE_FIELDS = ('error_count', 'success_count', 'last_run', 'last_run_duration')
+    CONFIG_FIELDS = ('tolerance', 'urgent', 'notify')
+
+    def __init__(self, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise ImportError("numpy is not available")
+        self.use_numpy = use_numpy
+        self.names = []
+        self.index = {}
+        # the monitor in each slot
+        self.monitors = []
+        self.types = dict(self.COLUMNS)
+        self.columns = {}
+        for (field, typecode) in self.COLUMNS:
+            if use_numpy:
+                self.columns[field] = numpy.zeros(16, dtype=typecode)
+            else:
+                self.columns[field] = array(typecode)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def add(self, name, monitor):
+        """Move a monitor's counters into the store.
+
+        The monitor's state is replaced by a StoredMonitorState."""
+        if name in self.index:
+            raise KeyError("monitor %s is already in the state store" % name)
+        index = len(self.names)
+        if self.use_numpy:
+            if index == len(self.columns['error_count']):
+                for field in self.columns:
+                    column = self.columns[field]
+                    self.columns[field] = numpy.concatenate((column, numpy.zeros_like(column)))
+        else:
+            for column in self.columns.values():
+                column.append(0)
+        self.names.append(name)
+        self.index[name] = index
+        self.monitors.append(monitor)
+        old_state = monitor.run_state
+        monitor.run_state = StoredMonitorState(self, index)
+        monitor.run_state.update(old_state.to_dict())
+        monitor.run_state.config_changed(monitor)
+        return index
+
+    def remove(self, name):
+        """Take a monitor out of the store.
+
+        The monitor gets a plain MonitorState holding its counters, and the
+        last monitor in the store moves into its slot."""
+        index = self.index.pop(name)
+        monitor = self.monitors[index]
+        old_state = monitor.run_state
+        monitor.run_state = MonitorState()
+        monitor.run_state.update(old_state.to_dict())
+        last = len(self.names) - 1
+        if index != last:
+            for column in self.columns.values():
+                column[index] = column[last]
+            moved = self.monitors[last]
+            moved.run_state._index = index
+            self.names[index] = self.names[last]
+            self.monitors[index] = moved
+            self.index[self.names[index]] = index
+        if not self.use_numpy:
+            for column in self.columns.values():
+                column.pop()
+        self.names.pop()
+        self.monitors.pop()
+
+    def get(self, field, index):
+        value = self.columns[field][index]
+        typecode = self.types[field]
+        if typecode == 'B':
+            return bool(value)
+        if typecode == INT_TYPECODE:
+            return int(value)
+        return float(value)
+
+    def set(self, field, index, value):
+        self.columns[field][index] = value
+
+    def column(self, field):
+        """Get the values of a column for every monitor in the store."""
+        column = self.columns[field]
+        if self.use_numpy:
+            return column[:len(self.names)]
+        return column
+
+    def _select(self, mask):
+        if self.use_numpy:
+            return [self.names[i] for i in numpy.flatnonzero(mask)]
+        return [name for (name, selected) in zip(self.names, mask) if selected]
+
+    def _failing_mask(self):
+        error_count = self.column('error_count')
+        tolerance = self.column('tolerance')
+        if self.use_numpy:
+            return error_count > tolerance
+        return [e > t for (e, t) in zip(error_count, tolerance)]
+
+    def failing(self):
+        """Names of the monitors with a virtual fail count above zero."""
+        return self._select(self._failing_mask())
+
+    def failing_in_tolerance(self):
+        """Names of the monitors which have failed, but not past their tolerance."""
+        error_count = self.column('error_count')
+        tolerance = self.column('tolerance')
+        if self.use_numpy:
+            return self._select((error_count > 0) & (error_count <= tolerance))
+        return self._select([0 < e <= t for (e, t) in zip(error_count, tolerance)])
+
+    def virtual_fail_counts(self):
+        """Map the name of each failing monitor to its virtual fail count."""
+        error_count = self.column('error_count')
+        tolerance = self.column('tolerance')
+        if self.use_numpy:
+            vfc = error_count - tolerance
+            return dict((self.names[i], int(vfc[i])) for i in numpy.flatnonzero(vfc > 0))
+        return dict(
+            (name, e - t)
+            for (name, e, t) in zip(self.names, error_count, tolerance)
+            if e > t
+        )
+
+    def counts(self):
+        """Count the monitors by status.
+
+        Returns a dict with the number of monitors which are ok, failing, and
+        failing with urgent and notify set."""
+        failing = self._failing_mask()
+        if self.use_numpy:
+            fail_count = int(numpy.count_nonzero(failing))
+            urgent_count = int(numpy.count_nonzero(
+                failing & (self.column('urgent') != 0) & (self.column('notify') != 0)))
+        else:
+            fail_count = sum(failing)
+            urgent_count = sum(
+                1 for (f, u, n) in zip(failing, self.column('urgent'), self.column('notify'))
+                if f and u and n
+            )
+        return {
+            'ok': len(self.names) - fail_count,
+            'failing': fail_count,
+            'urgent': urgent_count,
+        }
+
+
+def _stored_property(field):
+    def getter(self):
+        return self._store.get(field, self._index)
+
+    def setter(self, value):
+        self._store.set(field, self._index, value)
+
+    return property(getter, setter, doc="%s, kept in the StateStore" % field)
+
+
+class StoredMonitorState(MonitorState):
+    """A MonitorState whose counters live in a StateStore."""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+        MonitorState.__init__(self)
+
+    def config_changed(self, monitor):
+        for field in StateStore.CONFIG_FIELDS:
+            self._store.set(field, self._index, getattr(monitor, field))
+
+
+for _field in StateStore.STATE_FIELDS:
+    setattr(StoredMonitorState, _field, _stored_property(_field))
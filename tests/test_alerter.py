@@ -1,6 +1,7 @@
 import unittest
 import datetime
 import Alerters.alerter
+import Alerters.transport
 import Monitors.monitor
 import util
 
@@ -106,3 +107,98 @@ class TestAlerter(unittest.TestCase):
         a.available = False
         m = Monitors.monitor.MonitorNull()
         self.assertEqual(a.should_alert(m), '', 'Alerter did not handle being unavailable')
+
+    def test_batch_unsupported(self):
+        a = Alerters.alerter.Alerter(None)
+        a.start_batch()
+        self.assertFalse(a.doing_batch)
+        a.end_batch()
+        self.assertFalse(a.doing_batch)
+
+    def test_batch(self):
+        a = Alerters.alerter.Alerter(None)
+        a.supports_batch = True
+        processed = []
+        a.process_batch = lambda: processed.append(list(a.batch_data))
+        a.start_batch()
+        self.assertTrue(a.doing_batch)
+        a.batch_data.append('one')
+        a.end_batch()
+        self.assertFalse(a.doing_batch)
+        self.assertEqual(processed, [['one']])
+        self.assertEqual(a.batch_data, [])
+
+    def test_time_windows(self):
+        config_options = {
+            'times_type': 'only',
+            'time_windows': '08:00-12:00, 13:00-17:30, 11:00-12:30'
+        }
+        a = Alerters.alerter.Alerter(config_options)
+        self.assertEqual(a.time_info, [datetime.time(8, 0), datetime.time(12, 0)])
+        self.assertEqual(len(a.time_windows), 2)
+        monday = datetime.date(2018, 1, 1)
+        for (hour, minute, allowed) in [(7, 0, False), (9, 0, True), (12, 15, True), (12, 45, False), (17, 0, True), (18, 0, False)]:
+            now = datetime.datetime.combine(monday, datetime.time(hour, minute))
+            self.assertEqual(a.allowed_time(now), allowed, now)
+
+    def test_holidays(self):
+        config_options = {
+            'holidays': '2018-12-25,2018-12-26'
+        }
+        a = Alerters.alerter.Alerter(config_options)
+        self.assertFalse(a.allowed_today(datetime.datetime(2018, 12, 25, 12, 0)))
+        self.assertTrue(a.allowed_today(datetime.datetime(2018, 12, 27, 12, 0)))
+        self.assertTrue(a.is_out_of_hours(datetime.datetime(2018, 12, 26, 12, 0)))
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.alerter.Alerter({'holidays': 'christmas'})
+
+    def test_timezone(self):
+        if Alerters.alerter.zoneinfo is None:
+            self.skipTest('zoneinfo is not available')
+        a = Alerters.alerter.Alerter({'timezone': 'Europe/London'})
+        self.assertEqual(a._now().tzinfo, a.timezone)
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.alerter.Alerter({'timezone': 'Not/A_Zone'})
+
+    def test_out_of_hours_per_round(self):
+        a = Alerters.alerter.Alerter({'days': '0'})
+        a.is_out_of_hours = lambda now=None: True
+        self.assertIsNone(a.out_of_hours)
+        a.start_batch()
+        self.assertTrue(a.out_of_hours)
+        a.end_batch()
+        self.assertIsNone(a.out_of_hours)
+
+    def test_ooh_failures_not_shared(self):
+        a = Alerters.alerter.Alerter(None)
+        b = Alerters.alerter.Alerter(None)
+        a.ooh_failures.add('test')
+        self.assertEqual(b.ooh_failures, set())
+
+    def test_run_send(self):
+        a = Alerters.alerter.Alerter(None)
+        sent = []
+        a.run_send(sent.append, 'direct')
+        self.assertEqual(sent, ['direct'])
+        a.start_batch()
+        a.run_send(sent.append, 'pooled')
+        self.assertEqual(len(a.pending_sends), 1)
+        a.end_batch()
+        self.assertEqual(sent, ['direct', 'pooled'])
+        self.assertIsNone(a.pending_sends)
+
+    def test_run_send_without_pool(self):
+        real_executor = Alerters.transport.ThreadPoolExecutor
+        Alerters.transport.ThreadPoolExecutor = None
+        try:
+            a = Alerters.alerter.Alerter(None)
+            sent = []
+            a.start_batch()
+            a.run_send(sent.append, 'sync')
+            # sent straight away, rather than when the batch ends
+            self.assertEqual(sent, ['sync'])
+            a.run_send(int, 'not a number')
+            a.end_batch()
+            self.assertEqual(sent, ['sync'])
+        finally:
+            Alerters.transport.ThreadPoolExecutor = real_executor
@@ -0,0 +1,36 @@
+import json
+import unittest
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_fleet(self):
+        m = benchmark.make_fleet(20, fail_ratio=0.25)
+        self.assertEqual(m.count_monitors(), 20)
+        m.run_tests()
+        self.assertEqual(m.count_failing()['failing'], 5)
+
+    def test_run(self):
+        results = list(benchmark.run([10], repeat=1, network_size=2))
+        described = set(benchmark.describe_result(result) for result in results)
+        for name in ['build', 'run_tests', 'do_alerts', 'listener_ingest', 'config_load (cache=disk)',
+                     'do_logs (logger=network)', 'do_logs (logger=db)', 'run_tests (monitor=http)',
+                     'run_tests (monitor=tcp)', 'run_tests (monitor=dns)']:
+            self.assertIn(name, described)
+        for result in results:
+            if 'skipped' in result:
+                continue
+            self.assertEqual(result['seconds']['runs'], 1)
+            # the stand-in servers answer every monitor
+            self.assertNotIn('failing', result)
+        # results survive a round trip through JSON, and can be compared
+        loaded = json.loads(json.dumps(results))
+        self.assertEqual([benchmark.result_key(result) for result in loaded],
+                         [benchmark.result_key(result) for result in results])
+        self.assertIn('x', benchmark.format_result(results[0], loaded[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+import Monitors.monitor
+from Monitors.compound import AggregateMonitor
+from simplemonitor import SimpleMonitor
+from util import MonitorConfigurationError
+
+
+class SwitchMonitor(Monitors.monitor.MonitorNull):
+    """Fails when we tell it to."""
+
+    failing = False
+
+    def run_test(self):
+        if self.failing:
+            return self.record_fail("switched off")
+        return self.record_success()
+
+
+class TestAggregateMonitor(unittest.TestCase):
+
+    def _make_monitor(self, expression):
+        m = SimpleMonitor()
+        aggregate = AggregateMonitor('aggregate', {'expression': expression})
+        m.add_monitor('aggregate', aggregate)
+        for name in ['web-0', 'web-1', 'web-2', 'web-3']:
+            m.add_monitor(name, SwitchMonitor(name, {'group': 'web'}))
+        for name in ['db1', 'db2', 'db3']:
+            m.add_monitor(name, SwitchMonitor(name, {}))
+        aggregate.set_mon_refs(m)
+        aggregate.post_config_setup()
+        return (m, aggregate)
+
+    def test_pct_failed(self):
+        (m, aggregate) = self._make_monitor('pct_failed(group=web) > 20%')
+        self.assertEqual(aggregate.get_run_after(), ('web-0', 'web-1', 'web-2', 'web-3'))
+        m.run_tests()
+        self.assertTrue(aggregate.test_success())
+        self.assertEqual(aggregate.last_result, 'pct_failed(group=web) = 0')
+        m.monitors['web-1'].failing = True
+        m.run_tests()
+        self.assertFalse(aggregate.test_success())
+        self.assertEqual(aggregate.last_result, 'pct_failed(group=web) = 25')
+
+    def test_quorum(self):
+        (m, aggregate) = self._make_monitor("not quorum(match='db*')")
+        self.assertEqual(aggregate.get_run_after(), ('db1', 'db2', 'db3'))
+        m.monitors['db1'].failing = True
+        m.run_tests()
+        self.assertTrue(aggregate.test_success())
+        m.monitors['db2'].failing = True
+        m.run_tests()
+        self.assertFalse(aggregate.test_success())
+        self.assertEqual(aggregate.last_result, 'quorum(match=db*) = False')
+        m.monitors['db1'].failing = False
+        m.run_tests()
+        self.assertTrue(aggregate.test_success())
+
+    def test_weights(self):
+        (m, aggregate) = self._make_monitor("weighted_failed({'db1': 3, 'web-0': 1}) >= 3 and failed(db2, 'db3') == 0")
+        m.monitors['db1'].failing = True
+        m.run_tests()
+        self.assertFalse(aggregate.test_success())
+        self.assertEqual(
+            aggregate.last_result,
+            "failed('db2', 'db3') = 0, weighted_failed({'db1': 3, 'web-0': 1}) = 3")
+
+    def test_unchanged(self):
+        (m, aggregate) = self._make_monitor('failed(group=web) > 0')
+        m.monitors['web-0'].failing = True
+        m.run_tests()
+        self.assertFalse(aggregate.changed)
+        m.run_tests()
+        self.assertFalse(aggregate.changed)
+        self.assertFalse(aggregate.test_success())
+        self.assertEqual(aggregate.error_count, 2)
+
+    def test_other_aggregates_not_selected(self):
+        (m, aggregate) = self._make_monitor("failed(match='*') > 0")
+        other = AggregateMonitor('other', {'expression': "failed(match='*') > 0"})
+        m.add_monitor('other', other)
+        other.set_mon_refs(m)
+        other.post_config_setup()
+        self.assertNotIn('aggregate', other.get_run_after())
+        self.assertEqual(len(other.get_run_after()), 7)
+        # unless they're asked for by name
+        named = AggregateMonitor('named', {'expression': "failed(other) > 0"})
+        m.add_monitor('named', named)
+        named.set_mon_refs(m)
+        named.post_config_setup()
+        self.assertEqual(named.get_run_after(), ('other', ))
+
+    def test_bad_expressions(self):
+        for expression in [
+            'pct_failed(group=web) >',
+            '__import__("os").system("true")',
+            'failed()',
+            'failed(group=web, colour=red)',
+            'web > 1',
+            '_v0 > 1',
+            'weighted_failed(web)',
+            'failed(group=web).real',
+        ]:
+            with self.assertRaises(MonitorConfigurationError):
+                AggregateMonitor('aggregate', {'expression': expression})
+        with self.assertRaises(RuntimeError):
+            self._make_monitor('failed(nosuchmonitor) > 0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import envconfig
+
+
+class TestReadSections(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'monitors.ini')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        os.environ['SM_TEST_HOST'] = 'example.com'
+        self._write('[defaults]\ntolerance=1\n\n[web-%env:SM_TEST_HOST%]\ntype=http\nurl=http://%env:SM_TEST_HOST%/\n\n[a]\ntype=null\n')
+
+    def tearDown(self):
+        del os.environ['SM_TEST_HOST']
+        envconfig._sections_cache.clear()
+        shutil.rmtree(self.directory)
+
+    def _write(self, content):
+        with open(self.filename, 'w') as f:
+            f.write(content)
+
+    def test_read(self):
+        sections = envconfig.read_sections(self.filename)
+        self.assertEqual(sorted(sections), ['a', 'defaults', 'web-example.com'])
+        self.assertEqual(sections['web-example.com'], {'type': 'http', 'url': 'http://example.com/'})
+        self.assertIsInstance(sections['a']['type'], str)
+        # the caller can't change the cached copy
+        sections.pop('defaults')
+        self.assertIn('defaults', envconfig.read_sections(self.filename))
+        self.assertEqual(envconfig.read_sections(os.path.join(self.directory, 'missing.ini')), {})
+
+    def test_changes(self):
+        envconfig.read_sections(self.filename)
+        self._write('[b]\ntype=null\n')
+        self.assertEqual(list(envconfig.read_sections(self.filename)), ['b'])
+        os.environ['SM_TEST_HOST'] = 'example.org'
+        self._write('[c-%env:SM_TEST_HOST%]\ntype=null\n')
+        self.assertEqual(list(envconfig.read_sections(self.filename)), ['c-example.org'])
+        os.environ['SM_TEST_HOST'] = 'example.net'
+        self.assertEqual(list(envconfig.read_sections(self.filename)), ['c-example.net'])
+
+    def test_disk_cache(self):
+        sections = envconfig.read_sections(self.filename, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        envconfig._sections_cache.clear()
+        real_parser = envconfig.EnvironmentAwareConfigParser
+        envconfig.EnvironmentAwareConfigParser = None
+        try:
+            # the file hasn't changed, so it isn't parsed again
+            os.utime(self.filename, (0, 0))
+            self.assertEqual(envconfig.read_sections(self.filename, self.cache_dir), sections)
+        finally:
+            envconfig.EnvironmentAwareConfigParser = real_parser
+        envconfig._sections_cache.clear()
+        self._write('[b]\ntype=null\n')
+        self.assertEqual(list(envconfig.read_sections(self.filename, self.cache_dir)), ['b'])
+
+    def test_unrelated_environment_change(self):
+        envconfig.read_sections(self.filename)
+        self.assertEqual(envconfig.referenced_env_vars(self.filename), frozenset(['SM_TEST_HOST']))
+        real_parse = envconfig._parse
+        envconfig._parse = None
+        os.environ['SM_TEST_OTHER'] = '1'
+        try:
+            self.assertIn('web-example.com', envconfig.read_sections(self.filename))
+        finally:
+            envconfig._parse = real_parse
+            del os.environ['SM_TEST_OTHER']
+
+
+class TestEnvironmentAwareConfigParser(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['SM_TEST_HOST'] = 'example.com'
+        os.environ['SM_TEST_PORT'] = '80'
+        self.config = envconfig.EnvironmentAwareConfigParser()
+        content = (
+            u'[DEFAULT]\nport=%env:SM_TEST_PORT%\n\n'
+            u'[web-%env:SM_TEST_HOST%]\nhost=%env:SM_TEST_HOST%\n\n'
+            u'[plain]\nname=plain\n')
+        if sys.version_info[0] == 2:
+            self.config.readfp(io.StringIO(content))
+        else:
+            self.config.read_string(content)
+        self.config.interpolate_section_names()
+
+    def tearDown(self):
+        del os.environ['SM_TEST_HOST']
+        del os.environ['SM_TEST_PORT']
+
+    def test_get(self):
+        self.assertEqual(self.config.get('web-example.com', 'host'), 'example.com')
+        self.assertEqual(self.config.get('plain', 'PORT'), '80')
+        self.assertEqual(self.config.getint('plain', 'port'), 80)
+        self.assertEqual(self.config.get('plain', 'missing', fallback='x'), 'x')
+        self.assertEqual(self.config.get('missing', 'name', fallback='y'), 'y')
+        with self.assertRaises(envconfig.NoOptionError):
+            self.config.get('plain', 'missing')
+        self.assertEqual(self.config.items('plain'), [('port', '80'), ('name', 'plain')])
+
+    def test_interpolated_once(self):
+        options = self.config.section_options('plain')
+        self.assertIs(self.config.section_options('plain'), options)
+        if sys.version_info[0] > 2:
+            with self.assertRaises(TypeError):
+                options['name'] = 'changed'
+        os.environ['SM_TEST_PORT'] = '81'
+        self.assertEqual(self.config.get('plain', 'port'), '80')
+        self.config.set('plain', 'name', 'changed')
+        self.assertEqual(self.config.get('plain', 'name'), 'changed')
+        self.assertEqual(self.config.get('plain', 'port'), '81')
+
+    def test_referenced_env_vars(self):
+        self.assertEqual(self.config.referenced_env_vars(), frozenset(['SM_TEST_HOST', 'SM_TEST_PORT']))
+
+    def test_expand_env(self):
+        os.environ['SM_TEST_URL'] = 'http://%env:SM_TEST_HOST%:%env:SM_TEST_PORT%/'
+        try:
+            used = set()
+            self.assertEqual(envconfig.expand_env('url=%env:SM_TEST_URL%', used), 'url=http://example.com:80/')
+            self.assertEqual(used, set(['SM_TEST_URL', 'SM_TEST_HOST', 'SM_TEST_PORT']))
+        finally:
+            del os.environ['SM_TEST_URL']
+        with self.assertRaises(ValueError):
+            envconfig.expand_env('%env:SM_TEST_MISSING%')
+
+
+class TestReadSectionsFrom(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = []
+        for name in ['b', 'a', 'c']:
+            filename = os.path.join(self.directory, name + '.ini')
+            with open(filename, 'w') as f:
+                f.write('[{0}1]\ntype=null\n\n[{0}2]\ntype=null\n'.format(name))
+            self.files.append(filename)
+
+    def tearDown(self):
+        envconfig._sections_cache.clear()
+        shutil.rmtree(self.directory)
+
+    def test_config_files_in(self):
+        open(os.path.join(self.directory, 'ignored.txt'), 'w').close()
+        self.assertEqual(envconfig.config_files_in(self.directory), sorted(self.files))
+
+    def test_only_changed_files_parsed(self):
+        results = envconfig.read_sections_from(self.files)
+        self.assertEqual([list(sections) for sections in results], [['b1', 'b2'], ['a1', 'a2'], ['c1', 'c2']])
+        with open(self.files[1], 'w') as f:
+            f.write('[a3]\ntype=null\n')
+        parsed = []
+        real_parse = envconfig._parse
+
+        def parse(path, content):
+            parsed.append(path)
+            return real_parse(path, content)
+        envconfig._parse = parse
+        try:
+            results = envconfig.read_sections_from(self.files, workers=1)
+        finally:
+            envconfig._parse = real_parse
+        self.assertEqual(parsed, [self.files[1]])
+        self.assertEqual(list(results[1]), ['a3'])
+
+    def test_parallel(self):
+        real_minimum = envconfig.PARALLEL_MIN_BYTES
+        envconfig.PARALLEL_MIN_BYTES = 0
+        try:
+            results = envconfig.read_sections_from(self.files, workers=2)
+        finally:
+            envconfig.PARALLEL_MIN_BYTES = real_minimum
+        self.assertEqual([list(sections) for sections in results], [['b1', 'b2'], ['a1', 'a2'], ['c1', 'c2']])
+        self.assertEqual(results[2]['c2'], {'type': 'null'})
+
+    def test_parallel_unavailable(self):
+        real_minimum = envconfig.PARALLEL_MIN_BYTES
+        real_executor = envconfig.ProcessPoolExecutor
+
+        def executor(max_workers=None):
+            # as on Python 3.6, which can't be told how to start the processes
+            raise AssertionError('processes should not be started')
+        envconfig.PARALLEL_MIN_BYTES = 0
+        envconfig.ProcessPoolExecutor = executor
+        try:
+            results = envconfig.read_sections_from(self.files, workers=2)
+        finally:
+            envconfig.PARALLEL_MIN_BYTES = real_minimum
+            envconfig.ProcessPoolExecutor = real_executor
+        self.assertEqual([list(sections) for sections in results], [['b1', 'b2'], ['a1', 'a2'], ['c1', 'c2']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import Monitors.monitor
+from Monitors.history import ResultHistory
+
+
+class TestResultHistory(unittest.TestCase):
+
+    def test_empty(self):
+        h = ResultHistory(5)
+        self.assertEqual(len(h), 0)
+        self.assertIsNone(h.availability())
+        self.assertEqual(h.percentiles(), {})
+        self.assertEqual(h.results(), [])
+        with self.assertRaises(ValueError):
+            ResultHistory(0)
+
+    def test_ring(self):
+        h = ResultHistory(4)
+        for i in range(6):
+            h.append(float(i), i % 3 != 0, i / 10.0)
+        self.assertEqual(len(h), 4)
+        self.assertEqual(
+            h.results(),
+            [(2.0, True, 0.2), (3.0, False, 0.3), (4.0, True, 0.4), (5.0, True, 0.5)]
+        )
+        self.assertEqual(h.availability(), 0.75)
+
+    def test_percentiles(self):
+        h = ResultHistory(200)
+        for i in range(100, 0, -1):
+            h.append(0, True, float(i))
+        self.assertEqual(h.percentiles(), {50: 50.0, 95: 95.0, 99: 99.0})
+        self.assertEqual(h.percentile(100), 100.0)
+        self.assertEqual(h.percentile(0), 1.0)
+        summary = h.summary()
+        self.assertEqual(summary['runs'], 100)
+        self.assertEqual(summary['availability'], 1.0)
+        self.assertEqual(summary['p95'], 95.0)
+
+    def test_monitor(self):
+        m = Monitors.monitor.MonitorNull('null', {})
+        self.assertIsNone(m.history)
+        m = Monitors.monitor.MonitorFail('fail', {'history': '3', 'interval': '2'})
+        for i in range(4):
+            m.run_test()
+            m.record_run(0.5)
+        self.assertEqual(len(m.history), 3)
+        self.assertEqual([r[1] for r in m.history.results()], [False, True, False])
+        self.assertEqual(m.last_run_duration, 0.5)
+        self.assertNotIn('history', m.to_python_dict())
+        with self.assertRaises(Monitors.monitor.MonitorConfigurationError):
+            Monitors.monitor.MonitorNull('null', {'history': '-1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
+import os
+import tempfile
+import threading
 import unittest
 import Monitors.host
+import util
 
 from Monitors.monitor import MonitorConfigurationError
 
@@ -105,6 +109,64 @@ class TestHostMonitors(unittest.TestCase):
         m = Monitors.host.MonitorDiskSpace('test', config_options)
         self.assertTupleEqual(m.get_params(), (1, '/'))
 
+    def test_DiskSpace_inodes(self):
+        m = Monitors.host.MonitorDiskSpace('test', {'partition': '/', 'max_inodes_used': '100'})
+        self.assertIsNone(m.limit)
+        self.assertEqual(m.describe(), 'Checking for no more than 100% inodes used on /')
+        m.run_test()
+        self.assertTrue(m.test_success())
+        self.assertRegexpMatches(m.last_result, "inodes used")
+
+    def test_DiskSpace_glob(self):
+        sampler = Monitors.host.DiskSampler()
+        fd, sampler.MOUNTINFO = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as mountinfo:
+            mountinfo.write("23 28 0:22 / /proc rw,relatime - proc proc rw\n")
+            mountinfo.write("29 1 8:1 / / rw,relatime - ext4 /dev/sda1 rw\n")
+            mountinfo.write("30 29 0:40 / /mnt/nfs\\040one rw - nfs host:/one rw\n")
+            mountinfo.write("31 29 0:41 / /mnt/nfs2 rw - nfs host:/two rw\n")
+        try:
+            self.assertEqual(sampler.expand('/mnt/*'), ['/mnt/nfs one', '/mnt/nfs2'])
+            self.assertEqual(sampler.expand('/'), ['/'])
+        finally:
+            os.unlink(sampler.MOUNTINFO)
+
+    def test_DiskSpace_glob_monitor(self):
+        m = Monitors.host.MonitorDiskSpace('test', {'partition': '/no-such-mount-*', 'limit': '1'})
+        self.assertIn('/no-such-mount-*', Monitors.host.disk_sampler.partitions)
+        m.run_test()
+        self.assertEqual(m.last_result, "No mount points match /no-such-mount-*")
+        m = Monitors.host.MonitorDiskSpace('test', {'partition': '/*', 'limit': '1'})
+        m.run_test()
+        self.assertRegexpMatches(m.last_result, "partitions ok|: ")
+
+    def test_DiskSpace_shared_sample(self):
+        sampler = Monitors.host.DiskSampler()
+        sampler.add('/')
+        util.start_loop()
+        try:
+            first = sampler.statvfs('/', 5)
+            self.assertIs(sampler.statvfs('/', 5), first)
+        finally:
+            util.end_loop()
+        self.assertIsNot(sampler.statvfs('/', 5), first)
+
+    def test_DiskSpace_timeout(self):
+        sampler = Monitors.host.DiskSampler()
+        stuck = Monitors.host._StatvfsSample.__new__(Monitors.host._StatvfsSample)
+        stuck.started = util.monotonic_ns()
+        stuck.done = threading.Event()
+        sampler.samples['/stuck'] = stuck
+        with self.assertRaises(OSError):
+            sampler.statvfs('/stuck', 0.1)
+        # a stuck sample isn't replaced, and is reported without waiting again
+        stuck.started -= 10 * 1000000000
+        with self.assertRaises(OSError):
+            sampler.statvfs('/stuck', 5)
+        self.assertIs(sampler.samples['/stuck'], stuck)
+        with self.assertRaises(OSError):
+            sampler.statvfs('/this/does/not/exist', 5)
+
     def test_Filestat_get_params(self):
         config_options = {'maxage': '10', 'minsize': '20', 'filename': '/test'}
         m = Monitors.host.MonitorFileStat('test', config_options)
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import Monitors.linux
+import util
+
+MEMINFO = b"""MemTotal:        1000 kB
+MemFree:          100 kB
+MemAvailable:     250 kB
+SwapTotal:        400 kB
+SwapFree:         300 kB
+"""
+
+NET_DEV = b"""Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 100 10 0 0 0 0 0 0 100 10 0 0 0 0 0 0
+  eth0: 100 10 1 2 0 0 0 0 100 10 3 4 0 0 0 0
+"""
+
+PRESSURE = b"""some avg10=1.50 avg60=20.00 avg300=3.00 total=1000
+full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+"""
+
+
+class TestLinuxMonitors(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_root = Monitors.linux.PROC_ROOT
+        Monitors.linux.PROC_ROOT = self.root
+        for path in ['sys/fs', 'net', 'pressure', '123', '456']:
+            os.makedirs(os.path.join(self.root, path))
+        self.write('meminfo', MEMINFO)
+        self.write('stat', b"cpu  100 0 100 700 100 0 0 0 0 0\ncpu0 100 0 100 700 100 0 0 0 0 0\n")
+        self.write('sys/fs/file-nr', b"1100\t100\t2000\n")
+        self.write('loadavg', b"0.26 0.30 0.34 2/71 6049\n")
+        self.write('net/dev', NET_DEV)
+        self.write('pressure/cpu', PRESSURE)
+        self.write('123/comm', b"nginx\n")
+        self.write('456/comm', b"sshd\n")
+
+    def tearDown(self):
+        Monitors.linux.PROC_ROOT = self.old_root
+        shutil.rmtree(self.root)
+
+    def write(self, path, data):
+        with open(os.path.join(self.root, path), 'wb') as f:
+            f.write(data)
+
+    def test_proc_file(self):
+        path = os.path.join(self.root, 'big')
+        self.write('big', b'x' * 10000)
+        f = Monitors.linux.ProcFile(path)
+        self.assertEqual(len(f.read()), 10000)
+        self.write('big', b'y' * 5)
+        self.assertEqual(f.read(), b'yyyyy')
+        f.close()
+
+    def test_shared_sample(self):
+        path = Monitors.linux.proc_path('loadavg')
+        util.start_loop()
+        try:
+            first = Monitors.linux.get_sample(path, Monitors.linux.parse_loadavg)
+            self.write('loadavg', b"0.26 0.30 0.34 2/90 6049\n")
+            self.assertIs(Monitors.linux.get_sample(path, Monitors.linux.parse_loadavg), first)
+        finally:
+            util.end_loop()
+        self.assertEqual(Monitors.linux.get_sample(path, Monitors.linux.parse_loadavg), (2, 90))
+
+    def test_memory(self):
+        m = Monitors.linux.MonitorMemory('test', {'max_used': '80'})
+        self.assertTrue(m.run_test())
+        self.assertEqual(m.get_result(), "250.00KiB available (75.0% used), swap 25.0% used")
+        m = Monitors.linux.MonitorMemory('test', {'max_swap_used': '20'})
+        self.assertFalse(m.run_test())
+        m = Monitors.linux.MonitorMemory('test', {'min_available': '1M'})
+        self.assertFalse(m.run_test())
+
+    def test_cpu(self):
+        m = Monitors.linux.MonitorCPU('test', {'max': '50'})
+        self.assertTrue(m.run_test())
+        self.write('stat', b"cpu  200 0 200 800 100 0 0 0 0 0\n")
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "66.7% busy")
+        self.assertNotIn('last_times', m.to_python_dict())
+
+    def test_fds(self):
+        m = Monitors.linux.MonitorFileDescriptors('test', {'max_used': '40'})
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "1000 of 2000 file handles in use (50.0%)")
+
+    def test_processes(self):
+        m = Monitors.linux.MonitorProcesses('test', {'max': '70'})
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "71 processes")
+        m = Monitors.linux.MonitorProcesses('test', {'name': 'ngin*'})
+        self.assertTrue(m.run_test())
+        m = Monitors.linux.MonitorProcesses('test', {'name': 'apache2'})
+        self.assertFalse(m.run_test())
+
+    def test_neterrors(self):
+        m = Monitors.linux.MonitorNetworkErrors('test', {'interface': 'eth0'})
+        self.assertTrue(m.run_test())
+        self.write('net/dev', NET_DEV.replace(b' 1 2 ', b' 5 2 '))
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "4 errors since last check")
+        self.assertTrue(m.run_test())
+        m = Monitors.linux.MonitorNetworkErrors('test', {'interface': 'eth1'})
+        self.assertFalse(m.run_test())
+
+    def test_pressure(self):
+        m = Monitors.linux.MonitorPressure('test', {'max': '10'})
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "cpu some avg60 pressure 20.00%")
+        m = Monitors.linux.MonitorPressure('test', {'max': '10', 'window': 'avg10'})
+        self.assertTrue(m.run_test())
+        m = Monitors.linux.MonitorPressure('test', {'max': '10', 'resource': 'io'})
+        self.assertFalse(m.run_test())
+        self.assertTrue(m.get_result().startswith("Could not read host information"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import datetime
 import Monitors.monitor
+import util
 
 
 class TestMonitor(unittest.TestCase):
@@ -127,3 +128,56 @@ class TestMonitor(unittest.TestCase):
 
         m.failed_at = yesterday
         self.assertEqual(m.get_downtime(), (1, 0, 0, 0))
+
+    def test_state(self):
+        m = Monitors.monitor.MonitorFail('test', {})
+        m.run_test()
+        self.assertEqual(m.run_state.error_count, 1)
+        self.assertEqual(m.run_state.last_result, 'This monitor always fails.')
+        self.assertFalse(m.state())
+        m.error_count = 3
+        self.assertEqual(m.run_state.error_count, 3)
+        with self.assertRaises(AttributeError):
+            m.run_state.not_a_field = 1
+        snapshot = m.run_state.copy()
+        m.record_fail()
+        self.assertEqual(snapshot.error_count, 3)
+        self.assertEqual(m.error_count, 4)
+
+    def test_dependencies_not_shared(self):
+        a = Monitors.monitor.MonitorNull()
+        b = Monitors.monitor.MonitorNull()
+        a.set_dependencies(['x'])
+        self.assertEqual(b.get_dependencies(), [])
+        a.dependency_succeeded('x')
+        self.assertEqual(a._dependencies, ['x'])
+
+    def test_serialization(self):
+        m = Monitors.monitor.MonitorFail('test', {'interval': '3'})
+        m.run_test()
+        d = m.to_python_dict()
+        self.assertNotIn('run_state', d)
+        self.assertNotIn('monitor_logger', d)
+        self.assertEqual(d['error_count'], 1)
+        self.assertEqual(d['interval'], 3)
+        m2 = Monitors.monitor.MonitorFail.from_python_dict(d)
+        self.assertIsInstance(m2, Monitors.monitor.MonitorFail)
+        self.assertEqual(m2.error_count, 1)
+        self.assertEqual(m2.failed_at, m.failed_at)
+        self.assertEqual(m2.interval, 3)
+        self.assertNotIn('error_count', m2.__dict__)
+
+    def test_state_times(self):
+        m = Monitors.monitor.MonitorFail('test', {})
+        util.start_loop()
+        try:
+            m.run_test()
+            now = util.loop_time()
+        finally:
+            util.end_loop()
+        self.assertEqual(m.run_state.failed_at_time, now)
+        self.assertEqual(m.run_state.last_update_time, now)
+        self.assertEqual(m.failed_at, util.timestamp_to_datetime(now))
+        self.assertIsInstance(m.to_python_dict()['last_failure'], datetime.datetime)
+        m.failed_at = datetime.datetime(2018, 1, 1)
+        self.assertEqual(m.run_state.failed_at_time, 1514764800)
@@ -0,0 +1,70 @@
+import os
+import socket
+import sys
+import unittest
+
+import Monitors.network
+from Monitors.monitor import MonitorConfigurationError
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_no_threshold(self):
+        m = Monitors.network.MonitorTCP('test', {'host': 'localhost', 'port': '22'})
+        self.assertIsNone(m.check_latency(100))
+
+    def test_max_latency(self):
+        m = Monitors.network.MonitorTCP('test', {'host': 'localhost', 'port': '22', 'max_latency': '0.5'})
+        self.assertIsNone(m.latencies)
+        self.assertIsNone(m.check_latency(0.4))
+        self.assertEqual(m.check_latency(0.6), "latency 0.600s is above 0.500s")
+
+    def test_percentile(self):
+        m = Monitors.network.MonitorTCP('test', {
+            'host': 'localhost', 'port': '22',
+            'max_latency': '0.5', 'latency_percentile': '90', 'latency_window': '10'
+        })
+        for i in range(9):
+            self.assertIsNone(m.check_latency(0.1))
+        # one slow response in ten is fine at p90
+        self.assertIsNone(m.check_latency(2))
+        self.assertEqual(
+            m.check_latency(2),
+            "p90 latency over the last 10 responses is 2.000s, above 0.500s"
+        )
+        self.assertNotIn('latencies', m.to_python_dict())
+
+    def test_bad_config(self):
+        with self.assertRaises(MonitorConfigurationError):
+            Monitors.network.MonitorTCP('test', {'host': 'localhost', 'port': '22', 'max_latency': 'slow'})
+        with self.assertRaises(MonitorConfigurationError):
+            Monitors.network.MonitorTCP('test', {'host': 'localhost', 'port': '22', 'latency_percentile': '101'})
+
+    def test_tcp(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        s.listen(1)
+        try:
+            port = str(s.getsockname()[1])
+            m = Monitors.network.MonitorTCP('test', {'host': '127.0.0.1', 'port': port})
+            self.assertTrue(m.run_test())
+            m = Monitors.network.MonitorTCP('test', {'host': '127.0.0.1', 'port': port, 'max_latency': '0'})
+            self.assertFalse(m.run_test())
+        finally:
+            s.close()
+
+    @unittest.skipIf(not sys.platform.startswith('linux'), 'uses linux ping output')
+    def test_host(self):
+        ping = os.path.join(os.path.dirname(__file__), 'mocks', 'ping-mock', 'ping')
+        m = Monitors.network.MonitorHost('test', {'host': 'localhost', 'max_latency': '0.3'})
+        m.ping_command = ping + " -c1 %s"
+        self.assertTrue(m.run_test())
+        self.assertEqual(m.get_result(), "250.0ms")
+        m = Monitors.network.MonitorHost('test', {'host': 'localhost', 'max_latency': '0.2'})
+        m.ping_command = ping + " -c1 %s"
+        self.assertFalse(m.run_test())
+        self.assertEqual(m.get_result(), "250.0ms: latency 0.250s is above 0.200s")
+
+
+if __name__ == '__main__':
+    unittest.main()
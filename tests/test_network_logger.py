@@ -0,0 +1,60 @@
+import hashlib
+import hmac
+import socket
+import struct
+import time
+import unittest
+
+import Loggers.network
+import Monitors.monitor
+import util
+from simplemonitor import SimpleMonitor
+
+
+class TestNetworkLogger(unittest.TestCase):
+
+    def setUp(self):
+        self.simplemonitor = SimpleMonitor()
+        self.listener = Loggers.network.Listener(self.simplemonitor, 0, 'secret', allow_pickle=False)
+        self.listener.daemon = True
+        self.port = self.listener.sock.getsockname()[1]
+        # so connections made before the thread gets going aren't refused
+        self.listener.sock.listen(5)
+        self.listener.start()
+
+    def tearDown(self):
+        self.listener.running = False
+        self.listener.sock.close()
+
+    def _wait_for(self, name):
+        deadline = time.time() + 10
+        while name not in self.simplemonitor.remote_monitors:
+            if time.time() > deadline:
+                self.fail("{0} was not received".format(name))
+            time.sleep(0.01)
+        return self.simplemonitor.remote_monitors[name]
+
+    def test_send(self):
+        logger = Loggers.network.NetworkLogger({'host': '127.0.0.1', 'port': str(self.port), 'key': 'secret'})
+        monitor = Monitors.monitor.MonitorFail('sent', {})
+        monitor.run_test()
+        logger.start_batch()
+        logger.save_result2('sent', monitor)
+        logger.end_batch()
+        self.assertEqual(self._wait_for('sent').error_count, 1)
+
+    def test_older_instance(self):
+        # as sent by instances from before hmac.new() needed a digest, when it defaulted to MD5
+        monitor = Monitors.monitor.MonitorNull('old', {})
+        payload = util.json_dumps({'old': {'cls_type': monitor.type, 'data': monitor.to_python_dict()}})
+        mac = hmac.new(b'secret', payload, hashlib.md5)
+        s = socket.create_connection(('127.0.0.1', self.port))
+        try:
+            s.sendall(struct.pack('B', mac.digest_size) + mac.digest() + payload)
+        finally:
+            s.close()
+        self._wait_for('old')
+
+
+if __name__ == '__main__':
+    unittest.main()
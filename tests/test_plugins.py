@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import plugins
+import util
+import Monitors.monitor
+
+PLUGIN = '''
+import Monitors.monitor
+
+
+class MonitorThing(Monitors.monitor.Monitor):
+    type = "thing"
+
+    def run_test(self):
+        return self.record_success("thing ok")
+'''
+
+ENTRY_POINTS = '''[simplemonitor.monitors]
+thing = smplugin_thing:MonitorThing
+null = smplugin_thing:MonitorThing
+'''
+
+
+class TestPlugins(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'smplugin_thing.py'), 'w') as f:
+            f.write(PLUGIN)
+        dist_info = os.path.join(self.directory, 'smplugin_thing-1.0.dist-info')
+        os.mkdir(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as f:
+            f.write('Metadata-Version: 2.1\nName: smplugin-thing\nVersion: 1.0\n')
+        with open(os.path.join(dist_info, 'entry_points.txt'), 'w') as f:
+            f.write(ENTRY_POINTS)
+        self.cache_directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.cache_directory, 'simplemonitor', 'plugins.json')
+        os.environ['SIMPLEMONITOR_PLUGIN_CACHE'] = self.cache
+        sys.path.insert(0, self.directory)
+        plugins.clear_cache()
+
+    def tearDown(self):
+        sys.path.remove(self.directory)
+        del os.environ['SIMPLEMONITOR_PLUGIN_CACHE']
+        plugins.clear_cache()
+        sys.modules.pop('smplugin_thing', None)
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.cache_directory)
+
+    def test_find_plugins(self):
+        self.assertEqual(plugins.find_plugins('simplemonitor.monitors').get('thing'), 'smplugin_thing:MonitorThing')
+        self.assertTrue(os.path.exists(self.cache))
+        # the second time, the cache is used
+        plugins.clear_cache()
+        real_scan = plugins._scan
+        plugins._scan = None
+        try:
+            self.assertIn('thing', plugins.find_plugins('simplemonitor.monitors'))
+        finally:
+            plugins._scan = real_scan
+
+    def test_cache_invalidated(self):
+        plugins.find_plugins('simplemonitor.monitors')
+        plugins.clear_cache()
+        # installing something changes the directory's modification time
+        os.utime(self.directory, (0, 0))
+        self.assertEqual(plugins._load_cache(self.cache, plugins._fingerprint()), None)
+        self.assertIn('thing', plugins.find_plugins('simplemonitor.monitors'))
+
+    def test_entry_points_changed(self):
+        plugins.find_plugins('simplemonitor.monitors')
+        fingerprint = plugins._fingerprint()
+        # as when the setup.py of a package installed with "pip install -e" changes
+        entry_points = os.path.join(self.directory, 'smplugin_thing-1.0.dist-info', 'entry_points.txt')
+        os.utime(self.directory, (0, os.stat(self.directory).st_mtime))
+        os.utime(entry_points, (0, 0))
+        self.assertNotEqual(plugins._fingerprint(), fingerprint)
+
+    def test_no_cache(self):
+        os.environ['SIMPLEMONITOR_PLUGIN_CACHE'] = ''
+        self.assertIn('thing', plugins.find_plugins('simplemonitor.monitors'))
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_registry(self):
+        (register, get_class, all_types) = util.subclass_dict_handler(
+            'test', Monitors.monitor.Monitor, None, 'simplemonitor.monitors')
+        self.assertIn('thing', all_types())
+        monitor = get_class('thing')('thing', {})
+        monitor.run_test()
+        self.assertEqual(monitor.last_result, 'thing ok')
+        # our own types come first
+        self.assertIs(Monitors.monitor.get_class('null'), Monitors.monitor.MonitorNull)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import multiprocessing
+import subprocess
+import sys
+import types
+import unittest
+
+import Monitors.host
+import Monitors.monitor
+import Monitors.process
+import util
+
+
+class TestProcess(unittest.TestCase):
+
+    def tearDown(self):
+        Monitors.process.configure('direct')
+
+    def _check_mode(self):
+        self.assertEqual(Monitors.process.check_output([sys.executable, '-c', 'print("hi")']).strip(), b'hi')
+        self.assertEqual(Monitors.process.call([sys.executable, '-c', 'import sys; sys.exit(3)']), 3)
+        self.assertEqual(Monitors.process.check_call([sys.executable, '-c', '']), 0)
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            Monitors.process.check_output([sys.executable, '-c', 'print("out"); import sys; sys.exit(2)'])
+        self.assertEqual(cm.exception.returncode, 2)
+        self.assertEqual(cm.exception.output.strip(), b'out')
+        with self.assertRaises(subprocess.CalledProcessError):
+            Monitors.process.check_call([sys.executable, '-c', 'import sys; sys.exit(1)'])
+        with self.assertRaises(OSError):
+            Monitors.process.check_output(['/this/does/not/exist'])
+
+    def test_direct(self):
+        Monitors.process.configure('direct')
+        self._check_mode()
+
+    @unittest.skipIf(not hasattr(multiprocessing, 'get_context'), 'pool mode needs Python 3.4 or later')
+    def test_pool(self):
+        Monitors.process.configure('pool', 1)
+        self.assertIsNotNone(Monitors.process._pool)
+        self._check_mode()
+        Monitors.process.shutdown()
+        self.assertIsNone(Monitors.process._pool)
+
+    def test_cache(self):
+        Monitors.process.clear_cache()
+        command = [sys.executable, '-c', 'import time; print(time.time())']
+        util.start_loop()
+        try:
+            # without a lifetime, nothing is shared, even within a loop
+            first = Monitors.process.check_output(command, 0)
+            self.assertNotEqual(Monitors.process.check_output(command, 0), first)
+            self.assertNotEqual(Monitors.process.check_output(command), first)
+            first = Monitors.process.check_output(command, 60)
+            self.assertEqual(Monitors.process.check_output(command, 60), first)
+        finally:
+            util.end_loop()
+        first = Monitors.process.check_output(command, 60)
+        self.assertEqual(Monitors.process.check_output(command, 60), first)
+        Monitors.process.clear_cache()
+        self.assertNotEqual(Monitors.process.check_output(command, 60), first)
+
+    def test_cache_errors(self):
+        Monitors.process.clear_cache()
+        command = [sys.executable, '-c', 'print("out"); import sys; sys.exit(2)']
+        with self.assertRaises(subprocess.CalledProcessError):
+            Monitors.process.check_output(command, 60)
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            Monitors.process.check_output(command, 60)
+        self.assertEqual(cm.exception.output.strip(), b'out')
+
+    def test_command_monitors_share(self):
+        Monitors.process.clear_cache()
+        config = {'command': '%s -c "import time; print(time.time())"' % sys.executable, 'result_max': '1', 'cache_lifetime': '60'}
+        a = Monitors.host.MonitorCommand('a', config)
+        b = Monitors.host.MonitorCommand('b', config)
+        self.assertEqual(a.cache_lifetime, 60)
+        # only monitors which run commands take the option
+        self.assertEqual(Monitors.monitor.MonitorNull('null', {'cache_lifetime': '60'}).cache_lifetime, 0)
+        with self.assertRaises(util.MonitorConfigurationError):
+            Monitors.host.MonitorCommand('c', dict(config, cache_lifetime='-1'))
+        util.start_loop()
+        try:
+            a.run_test()
+            b.run_test()
+        finally:
+            util.end_loop()
+        self.assertEqual(a.get_result(), b.get_result())
+
+    def test_bad_config(self):
+        with self.assertRaises(ValueError):
+            Monitors.process.configure('fork')
+        with self.assertRaises(ValueError):
+            Monitors.process.configure('pool', 0)
+        # as on Python 2
+        real_multiprocessing = Monitors.process.multiprocessing
+        Monitors.process.multiprocessing = types.ModuleType('multiprocessing')
+        try:
+            with self.assertRaises(ValueError):
+                Monitors.process.configure('pool', 1)
+        finally:
+            Monitors.process.multiprocessing = real_multiprocessing
+        self.assertEqual(Monitors.process._mode, 'direct')
+
+
+if __name__ == '__main__':
+    unittest.main()
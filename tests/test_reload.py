@@ -0,0 +1,263 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import Monitors.host
+import monitor
+import plugins
+import util
+from simplemonitor import SimpleMonitor
+
+
+class TestUpdateMonitors(unittest.TestCase):
+
+    def setUp(self):
+        # listing the valid types looks for plugins; don't save what's found
+        os.environ['SIMPLEMONITOR_PLUGIN_CACHE'] = ''
+        plugins.clear_cache()
+        self.m = SimpleMonitor()
+        self.configs = {
+            'fail1': {'type': 'fail', 'interval': '100'},
+            'fail2': {'type': 'fail', 'interval': '100', 'group': 'b'},
+            'null': {'type': 'null'},
+            'both': {'type': 'compound', 'monitors': 'fail1,fail2'},
+        }
+        self.m.update_monitors(self.configs)
+
+    def tearDown(self):
+        del os.environ['SIMPLEMONITOR_PLUGIN_CACHE']
+        plugins.clear_cache()
+
+    def test_unchanged_monitors_kept(self):
+        self.m.run_tests()
+        null = self.m.monitors['null']
+        self.m.update_monitors(dict(self.configs))
+        self.assertIs(self.m.monitors['null'], null)
+        self.assertEqual(null.tests_run, 1)
+
+    def test_changed_monitor_keeps_state(self):
+        self.m.run_tests()
+        self.m.run_tests()
+        old = self.m.monitors['fail1']
+        failed_at = old.failed_at
+        configs = dict(self.configs)
+        configs['fail1'] = {'type': 'fail', 'interval': '100', 'tolerance': '5'}
+        self.m.update_monitors(configs)
+        new = self.m.monitors['fail1']
+        self.assertIsNot(new, old)
+        self.assertEqual(new.tolerance, 5)
+        self.assertEqual(new.error_count, 2)
+        self.assertEqual(new.failed_at, failed_at)
+
+    def test_added_and_removed(self):
+        configs = dict(self.configs)
+        del configs['null']
+        configs['null2'] = {'type': 'null'}
+        self.m.update_monitors(configs)
+        self.assertEqual(sorted(self.m.monitors), ['both', 'fail1', 'fail2', 'null2'])
+        self.assertEqual(sorted(self.m.monitor_configs), ['both', 'fail1', 'fail2', 'null2'])
+
+    def test_compound_follows_new_monitors(self):
+        self.m.run_tests()
+        self.assertEqual(self.m.monitors['both'].failcount, 2)
+        configs = dict(self.configs)
+        configs['fail2'] = {'type': 'null'}
+        self.m.update_monitors(configs)
+        both = self.m.monitors['both']
+        self.assertEqual(both.failcount, 1)
+        self.m.run_tests()
+        self.assertEqual(both.failcount, 1)
+        self.assertEqual(both.virtual_fail_count(), 0)
+        # the old compound no longer listens to anything
+        self.assertEqual(self.m.monitors['fail1']._failure_listeners, (both.monitor_failing_changed, ))
+
+    def test_removed_compound_stops_listening(self):
+        configs = dict(self.configs)
+        del configs['both']
+        self.m.update_monitors(configs)
+        self.assertEqual(self.m.monitors['fail1']._failure_listeners, ())
+        self.assertEqual(self.m.monitors['fail2']._failure_listeners, ())
+
+    def test_missing_dependency(self):
+        configs = dict(self.configs)
+        configs['null'] = {'type': 'null', 'depend': 'nothere'}
+        null = self.m.monitors['null']
+        with self.assertRaises(util.SimpleMonitorConfigurationError):
+            self.m.update_monitors(configs)
+        self.assertIs(self.m.monitors['null'], null)
+
+    def test_unknown_type(self):
+        configs = dict(self.configs)
+        configs['null'] = {'type': 'nosuchtype'}
+        self.m.update_monitors(configs)
+        self.assertNotIn('null', self.m.monitors)
+
+    def test_disk_partitions(self):
+        partitions = Monitors.host.disk_sampler.partitions
+        configs = dict(self.configs)
+        configs['disk'] = {'type': 'diskspace', 'partition': '/reload-test-one', 'limit': '1'}
+        self.m.update_monitors(configs)
+        self.assertEqual(partitions.get('/reload-test-one'), 1)
+        configs['disk'] = {'type': 'diskspace', 'partition': '/reload-test-two', 'limit': '1'}
+        self.m.update_monitors(configs)
+        self.assertNotIn('/reload-test-one', partitions)
+        self.assertEqual(partitions.get('/reload-test-two'), 1)
+        # nothing is left behind by a configuration which can't be used
+        bad = dict(configs, disk2={'type': 'diskspace', 'partition': '/reload-test-three', 'limit': '1', 'depend': 'nothere'})
+        with self.assertRaises(util.SimpleMonitorConfigurationError):
+            self.m.update_monitors(bad)
+        self.assertNotIn('/reload-test-three', partitions)
+        del configs['disk']
+        self.m.update_monitors(configs)
+        self.assertNotIn('/reload-test-two', partitions)
+
+    def test_update_config_all_or_nothing(self):
+        partitions = Monitors.host.disk_sampler.partitions
+        configs = dict(self.configs, disk={'type': 'diskspace', 'partition': '/reload-test-four', 'limit': '1'})
+        del configs['null']
+        # the logger can't be made, so the monitors mustn't change either
+        with self.assertRaises(RuntimeError):
+            self.m.update_config(configs, {'file': {'type': 'logfile'}}, {})
+        self.assertEqual(sorted(self.m.monitors), ['both', 'fail1', 'fail2', 'null'])
+        self.assertNotIn('/reload-test-four', partitions)
+        self.assertEqual(self.m.loggers, {})
+        self.m.update_config(configs, {}, {'a': {'type': 'execute', 'fail_command': 'true'}})
+        self.assertEqual(sorted(self.m.monitors), ['both', 'disk', 'fail1', 'fail2'])
+        self.assertEqual(sorted(self.m.alerters), ['a'])
+        del configs['disk']
+        self.m.update_config(configs, {}, {})
+        self.assertNotIn('/reload-test-four', partitions)
+
+    def test_watched_monitor_removed(self):
+        self.m.run_tests()
+        old_monitors = dict(self.m.monitors)
+        for (name, config) in [('both', {'type': 'compound', 'monitors': 'fail1,fail2'}),
+                               ('agg', {'type': 'aggregate', 'expression': 'failed(fail1, fail2) > 1'})]:
+            configs = dict(self.configs)
+            configs[name] = config
+            del configs['fail2']
+            with self.assertRaises(util.SimpleMonitorConfigurationError):
+                self.m.update_config(configs, {}, {'a': {'type': 'execute', 'fail_command': 'true'}})
+            self.assertEqual(self.m.monitors, old_monitors)
+            self.assertEqual(self.m.alerters, {})
+        # the compound monitor still works, and its monitors still tell it when they change
+        both = self.m.monitors['both']
+        self.assertEqual(both.fail_count(), 2)
+        self.m.run_tests()
+        self.assertFalse(both.test_success())
+
+    def test_watching_each_other(self):
+        configs = dict(self.configs)
+        configs['agg1'] = {'type': 'aggregate', 'expression': 'failed(agg2, fail1) > 0'}
+        configs['agg2'] = {'type': 'aggregate', 'expression': 'failed(both) > 0 or failed(agg1) > 0'}
+        with self.assertRaises(util.SimpleMonitorConfigurationError) as cm:
+            self.m.update_monitors(configs)
+        self.assertIn('agg1 -> agg2 -> agg1', str(cm.exception))
+        self.assertNotIn('agg1', self.m.monitors)
+        # watching each other by group or glob isn't a cycle, as they don't select each other
+        configs['agg1'] = {'type': 'aggregate', 'expression': "failed(match='*') > 0"}
+        configs['agg2'] = {'type': 'aggregate', 'expression': "failed(match='*') > 0"}
+        self.m.update_monitors(configs)
+        self.assertEqual(self.m.monitors['agg1'].get_run_after(), ('fail1', 'fail2', 'null'))
+        self.m.run_tests()
+        self.assertTrue(self.m.monitors['agg2'].tests_run)
+
+    def test_state_store(self):
+        m = SimpleMonitor(state_store=True)
+        m.update_monitors(self.configs)
+        m.run_tests()
+        configs = dict(self.configs)
+        configs['fail1'] = {'type': 'fail', 'interval': '100', 'urgent': '0'}
+        del configs['null']
+        m.update_monitors(configs)
+        self.assertEqual(len(m.state_store), 3)
+        self.assertEqual(m.monitors['fail1'].error_count, 1)
+        self.assertEqual(m.count_failing()['failing'], 3)
+
+
+class TestUpdateAlerters(unittest.TestCase):
+
+    def test_ooh_failures_kept(self):
+        m = SimpleMonitor()
+        m.update_alerters({'a': {'type': 'execute', 'fail_command': 'true'}})
+        old = m.alerters['a']
+        old.ooh_failures.add('fail1')
+        m.update_alerters({'a': {'type': 'execute', 'fail_command': 'false'}})
+        new = m.alerters['a']
+        self.assertIsNot(new, old)
+        self.assertEqual(new.name, 'a')
+        self.assertEqual(new.ooh_failures, set(['fail1']))
+        self.assertEqual(m.alerter_groups, {'default': [new]})
+        m.update_alerters({})
+        self.assertEqual(m.alerters, {})
+        self.assertEqual(m.alerter_groups, {})
+
+
+class TestReloadConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.directory, 'monitor.ini')
+        self.monitors_file = os.path.join(self.directory, 'monitors.ini')
+        self.write(self.config_file, "[monitor]\ninterval=60\nmonitors={0}\n".format(self.monitors_file))
+        self.write(self.monitors_file, "[null]\ntype=null\n\n[fail]\ntype=fail\ninterval=100\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, content):
+        with open(filename, 'w') as f:
+            f.write(content)
+        # make sure the modification time changes, however coarse it is
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime + 10, stat.st_mtime + 10))
+
+    def test_reload(self):
+        m = SimpleMonitor()
+        config = monitor.reload_config(m, self.config_file)
+        self.assertIsNotNone(config)
+        files = monitor.config_files(self.config_file, config)
+        self.assertEqual(files, [self.config_file, self.monitors_file])
+        mtimes = monitor.config_mtimes(files)
+        m.run_tests()
+        null = m.monitors['null']
+
+        self.write(self.monitors_file, "[null]\ntype=null\n\n[fail]\ntype=fail\ninterval=100\ntolerance=3\n")
+        self.assertNotEqual(monitor.config_mtimes(files), mtimes)
+        self.assertIsNotNone(monitor.reload_config(m, self.config_file))
+        self.assertIs(m.monitors['null'], null)
+        self.assertEqual(m.monitors['fail'].tolerance, 3)
+        self.assertEqual(m.monitors['fail'].error_count, 1)
+
+    def test_monitors_dir(self):
+        monitors_dir = os.path.join(self.directory, 'monitors.d')
+        os.mkdir(monitors_dir)
+        self.write(self.config_file, "[monitor]\ninterval=60\nmonitors={0}\nmonitors_dir={1}\n".format(self.monitors_file, monitors_dir))
+        self.write(self.monitors_file, "[defaults]\ntolerance=2\n\n[null]\ntype=null\n")
+        self.write(os.path.join(monitors_dir, 'web.ini'), "[defaults]\ngroup=web\n\n[web]\ntype=null\n")
+        self.write(os.path.join(monitors_dir, 'db.ini'), "[db]\ntype=null\n\n[null]\ntype=fail\n")
+        m = SimpleMonitor()
+        config = monitor.reload_config(m, self.config_file)
+        self.assertEqual(sorted(m.monitor_configs), ['db', 'null', 'web'])
+        # the files are read in order: the monitors file, then the directory's files by name
+        self.assertEqual(list(monitor.monitor_configs(self.monitors_file, None, [monitors_dir])), ['null', 'db', 'web'])
+        self.assertEqual(m.monitors['null'].type, 'fail')
+        self.assertEqual(m.monitors['web'].group, 'web')
+        self.assertEqual(m.monitors['web'].tolerance, 2)
+        self.assertEqual(m.monitors['db'].group, 'default')
+        self.assertIn(monitors_dir, monitor.config_files(self.config_file, config))
+
+    def test_bad_reload_keeps_config(self):
+        m = SimpleMonitor()
+        monitor.reload_config(m, self.config_file)
+        self.write(self.monitors_file, "[null]\ntype=null\ndepend=nothere\n")
+        self.assertIsNone(monitor.reload_config(m, self.config_file))
+        self.assertEqual(sorted(m.monitors), ['fail', 'null'])
+        os.unlink(self.monitors_file)
+        self.assertIsNone(monitor.reload_config(m, self.config_file))
+        self.assertEqual(sorted(m.monitors), ['fail', 'null'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+import Monitors.service
+import util
+from Monitors.service import MonitorSystemdUnit
+
+
+class FakeSystemd(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.units = {
+            'ssh.service': ('loaded', 'active', 'running'),
+            'cron.service': ('loaded', 'failed', 'failed'),
+            'getty@tty1.service': ('loaded', 'active', 'running'),
+            'getty@tty2.service': ('loaded', 'active', 'running'),
+        }
+
+    def ListUnits(self):
+        self.calls += 1
+        return [
+            (name, '', load, active, sub, '', '/unit/' + name, 0, '', '/')
+            for (name, (load, active, sub)) in self.units.items()
+        ]
+
+
+class FakeBus(object):
+
+    def __init__(self, systemd):
+        self.systemd = systemd
+
+    def get(self, name):
+        return self.systemd
+
+
+class FakePydbus(object):
+
+    def __init__(self):
+        self.systemd = FakeSystemd()
+        self.buses = 0
+
+    def SystemBus(self):
+        self.buses += 1
+        return FakeBus(self.systemd)
+
+
+class TestSystemdUnit(unittest.TestCase):
+
+    def setUp(self):
+        self.pydbus = FakePydbus()
+        self.real_pydbus = Monitors.service.pydbus
+        Monitors.service.pydbus = self.pydbus
+        MonitorSystemdUnit._disconnect()
+        MonitorSystemdUnit._units = None
+        MonitorSystemdUnit._matches = {}
+
+    def tearDown(self):
+        Monitors.service.pydbus = self.real_pydbus
+        MonitorSystemdUnit._disconnect()
+        MonitorSystemdUnit._units = None
+        util.end_loop()
+
+    def test_units(self):
+        ssh = MonitorSystemdUnit('ssh', {'name': 'ssh.service'})
+        cron = MonitorSystemdUnit('cron', {'name': 'cron.service'})
+        getty = MonitorSystemdUnit('getty', {'name': 'getty@*.service'})
+        missing = MonitorSystemdUnit('missing', {'name': 'nginx.service'})
+        util.start_loop()
+        for monitor in [ssh, cron, getty, missing]:
+            monitor.run_test()
+        self.assertTrue(ssh.test_success())
+        self.assertEqual(cron.last_result, "Unit cron.service has active state: failed (wanted ['active', 'reloading'])")
+        self.assertTrue(getty.test_success())
+        self.assertEqual(missing.last_result, "No unit nginx.service")
+        # one connection, and one ListUnits() for the whole loop
+        self.assertEqual(self.pydbus.buses, 1)
+        self.assertEqual(self.pydbus.systemd.calls, 1)
+        self.assertEqual(MonitorSystemdUnit._matches, {'getty@*.service': ['getty@tty1.service', 'getty@tty2.service']})
+
+        # a new unit is picked up in the next loop
+        util.end_loop()
+        self.pydbus.systemd.units['getty@tty3.service'] = ('loaded', 'inactive', 'dead')
+        util._loop_time = util.loop_time() + 10
+        getty.run_test()
+        self.assertEqual(getty.last_result, "Unit getty@tty3.service has active state: inactive (wanted ['active', 'reloading'])")
+        self.assertEqual(self.pydbus.systemd.calls, 2)
+        self.assertEqual(self.pydbus.buses, 1)
+
+    def test_properties_changed(self):
+        cron = MonitorSystemdUnit('cron', {'name': 'cron.service'})
+        util.start_loop()
+        cron.run_test()
+        self.assertFalse(cron.test_success())
+        MonitorSystemdUnit._subscribed = True
+        MonitorSystemdUnit._properties_changed(
+            'org.freedesktop.systemd1', '/unit/cron.service', 'org.freedesktop.DBus.Properties', 'PropertiesChanged',
+            ('org.freedesktop.systemd1.Unit', {'ActiveState': 'active', 'SubState': 'running'}, []))
+        util._loop_time = util.loop_time() + 10
+        cron.run_test()
+        self.assertTrue(cron.test_success())
+        # the new state came from the signal, not from asking systemd again
+        self.assertEqual(self.pydbus.systemd.calls, 1)
+        MonitorSystemdUnit._units_changed()
+        cron.run_test()
+        self.assertEqual(self.pydbus.systemd.calls, 2)
+
+    def test_connection_lost(self):
+        ssh = MonitorSystemdUnit('ssh', {'name': 'ssh.service'})
+
+        def broken():
+            raise RuntimeError('connection closed')
+        self.pydbus.systemd.ListUnits = broken
+        ssh.run_test()
+        self.assertEqual(ssh.last_result, "Unable to list units: connection closed")
+        self.assertIsNone(MonitorSystemdUnit._systemd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+
+import Alerters.alerter
+import Monitors.compound
+import Monitors.monitor
+from simplemonitor import SimpleMonitor
+
+
+class RecordingAlerter(Alerters.alerter.Alerter):
+    type = "recording"
+
+    def __init__(self, config_options=None):
+        Alerters.alerter.Alerter.__init__(self, config_options)
+        self.alerted = []
+
+    def send_alert(self, name, monitor):
+        self.alerted.append(name)
+
+
+class TestSimpleMonitor(unittest.TestCase):
+
+    def _make_monitor(self):
+        m = SimpleMonitor()
+        m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+        m.add_monitor('fail-b', Monitors.monitor.MonitorFail('fail-b', {'group': 'b'}))
+        m.add_monitor('null', Monitors.monitor.MonitorNull('null', {}))
+        return m
+
+    def test_alerter_groups(self):
+        m = SimpleMonitor()
+        a = RecordingAlerter()
+        b = RecordingAlerter({'groups': 'default,b'})
+        m.add_alerter('a', a)
+        m.add_alerter('b', b)
+        self.assertEqual(m.alerter_groups, {'default': [a, b], 'b': [b]})
+
+    def test_alert_pending(self):
+        m = self._make_monitor()
+        m.run_tests()
+        self.assertEqual(sorted(m.alert_pending), ['fail', 'fail-b'])
+
+    def test_alert_pending_recovery(self):
+        m = SimpleMonitor()
+        m.add_monitor('flap', Monitors.monitor.MonitorFail('flap', {'interval': '2'}))
+        m.run_tests()
+        m.run_tests()
+        self.assertEqual(m.alert_pending, ['flap'])
+        m.run_tests()
+        self.assertTrue(m.monitors['flap'].all_better_now())
+        self.assertEqual(m.alert_pending, ['flap'])
+        m.run_tests()
+        self.assertEqual(m.alert_pending, ['flap'])
+        self.assertEqual(m.monitors['flap'].virtual_fail_count(), 1)
+
+    def test_compound(self):
+        m = SimpleMonitor()
+        # the compound monitor comes first, but must run after its monitors
+        compound = Monitors.compound.CompoundMonitor('compound', {'monitors': 'flap,fail', 'min_fail': '2'})
+        m.add_monitor('compound', compound)
+        m.add_monitor('flap', Monitors.monitor.MonitorFail('flap', {'interval': '2'}))
+        m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+        m.add_monitor('null', Monitors.monitor.MonitorNull('null', {}))
+        compound.set_mon_refs(m)
+        compound.post_config_setup()
+        self.assertEqual(compound.fail_count(), 0)
+        m.run_tests()
+        self.assertEqual(compound.fail_count(), 2)
+        self.assertFalse(compound.test_success())
+        self.assertEqual(compound.last_result, "2 of 2 services failed. Fail after: 2")
+        self.assertEqual(m.alert_pending[-1], 'compound')
+        m.run_tests()
+        m.run_tests()
+        # flap has recovered
+        self.assertEqual(compound.fail_count(), 1)
+        self.assertEqual(compound.virtual_fail_count(), 0)
+        self.assertTrue(compound.test_success())
+        m.monitors['fail'].set_tolerance(10)
+        self.assertEqual(compound.fail_count(), 0)
+
+    def test_nested_compound(self):
+        m = SimpleMonitor()
+        inner = Monitors.compound.CompoundMonitor('inner', {'monitors': 'fail'})
+        outer = Monitors.compound.CompoundMonitor('outer', {'monitors': 'inner,null', 'min_fail': '1'})
+        m.add_monitor('outer', outer)
+        m.add_monitor('inner', inner)
+        m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+        m.add_monitor('null', Monitors.monitor.MonitorNull('null', {}))
+        for compound in [inner, outer]:
+            compound.set_mon_refs(m)
+            compound.post_config_setup()
+        m.run_tests()
+        self.assertEqual(outer.fail_count(), 1)
+        self.assertFalse(outer.test_success())
+
+    def test_waiting_for_each_other(self):
+        m = SimpleMonitor()
+        m.add_monitor('a', Monitors.monitor.MonitorNull('a', {'depend': 'b'}))
+        m.add_monitor('b', Monitors.monitor.MonitorNull('b', {'depend': 'a'}))
+        m.add_monitor('c', Monitors.monitor.MonitorNull('c', {}))
+        m.run_tests()
+        self.assertEqual(m.monitors['c'].tests_run, 1)
+        self.assertEqual(m.monitors['a'].tests_run, 0)
+
+    def test_dependencies(self):
+        m = SimpleMonitor()
+        # added in reverse, so each monitor has to wait for the one it depends on
+        m.add_monitor('c', Monitors.monitor.MonitorNull('c', {'depend': 'b'}))
+        m.add_monitor('b', Monitors.monitor.MonitorNull('b', {'depend': 'a'}))
+        m.add_monitor('a', Monitors.monitor.MonitorNull('a', {}))
+        m.add_monitor('after-fail', Monitors.monitor.MonitorNull('after-fail', {'depend': 'fail'}))
+        m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+        for i in range(5):
+            m.add_monitor('other{0}'.format(i), Monitors.monitor.MonitorNull('other{0}'.format(i), {}))
+        told = []
+        for (name, monitor) in m.monitors.items():
+            def dependency_succeeded(dependency, name=name, real=monitor.dependency_succeeded):
+                told.append((name, dependency))
+                real(dependency)
+            monitor.dependency_succeeded = dependency_succeeded
+        m.run_tests()
+        for name in ['a', 'b', 'c']:
+            self.assertEqual(m.monitors[name].tests_run, 1)
+        self.assertEqual(m.monitors['after-fail'].skip_dep, 'fail')
+        # only the monitors which depend on one which succeeded are told about it
+        self.assertEqual(sorted(told), [('b', 'a'), ('c', 'b')])
+
+    def test_do_alerts(self):
+        m = self._make_monitor()
+        a = RecordingAlerter()
+        a.name = 'a'
+        b = RecordingAlerter({'groups': 'b'})
+        b.name = 'b'
+        m.add_alerter('a', a)
+        m.add_alerter('b', b)
+        m.run_tests()
+        m.do_alerts()
+        self.assertEqual(a.alerted, ['fail'])
+        self.assertEqual(b.alerted, ['fail-b'])
+
+    def test_do_alert_single(self):
+        m = self._make_monitor()
+        a = RecordingAlerter({'groups': 'default,b'})
+        a.name = 'a'
+        m.add_alerter('a', a)
+        m.monitors['fail'].set_notify(False)
+        m.run_tests()
+        m.do_alert(a)
+        self.assertEqual(a.alerted, ['fail-b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
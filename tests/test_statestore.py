@@ -0,0 +1,123 @@
+import json
+import os
+import tempfile
+import unittest
+
+import Loggers.file
+import Monitors.monitor
+import statestore
+from simplemonitor import SimpleMonitor
+
+
+class TestStateStore(unittest.TestCase):
+
+    def _make_store(self):
+        store = statestore.StateStore(use_numpy=False)
+        store.add('fail', Monitors.monitor.MonitorFail('fail', {}))
+        store.add('tolerant', Monitors.monitor.MonitorFail('tolerant', {'tolerance': '2'}))
+        store.add('null', Monitors.monitor.MonitorNull('null', {'urgent': '0'}))
+        return store
+
+    def test_stored_state(self):
+        store = statestore.StateStore(use_numpy=False)
+        m = Monitors.monitor.MonitorFail('fail', {'tolerance': '1'})
+        m.run_test()
+        store.add('fail', m)
+        self.assertIsInstance(m.run_state, statestore.StoredMonitorState)
+        self.assertEqual(m.error_count, 1)
+        self.assertEqual(m.tests_run, 1)
+        m.run_test()
+        self.assertEqual(store.get('error_count', 0), 2)
+        self.assertEqual(m.virtual_fail_count(), 1)
+        self.assertEqual(store.get('tolerance', 0), 1)
+        m.set_tolerance(3)
+        self.assertEqual(store.get('tolerance', 0), 3)
+        self.assertEqual(m.run_state.to_dict()['error_count'], 2)
+        self.assertEqual(m.run_state.copy().error_count, 2)
+        with self.assertRaises(KeyError):
+            store.add('fail', m)
+
+    def test_queries(self):
+        store = self._make_store()
+        for name in ['fail', 'tolerant', 'null']:
+            self.assertIn(name, store)
+        self.assertEqual(store.failing(), [])
+        self.assertEqual(store.counts(), {'ok': 3, 'failing': 0, 'urgent': 0})
+        store.set('error_count', 0, 1)
+        store.set('error_count', 1, 1)
+        self.assertEqual(store.failing(), ['fail'])
+        self.assertEqual(store.failing_in_tolerance(), ['tolerant'])
+        store.set('error_count', 1, 4)
+        self.assertEqual(store.virtual_fail_counts(), {'fail': 1, 'tolerant': 2})
+        self.assertEqual(store.counts(), {'ok': 1, 'failing': 2, 'urgent': 2})
+
+    def test_remove(self):
+        for use_numpy in [False, True]:
+            if use_numpy and statestore.numpy is None:
+                continue
+            store = statestore.StateStore(use_numpy=use_numpy)
+            fail = Monitors.monitor.MonitorFail('fail', {})
+            null = Monitors.monitor.MonitorNull('null', {'tolerance': '2'})
+            store.add('fail', fail)
+            store.add('null', null)
+            fail.run_test()
+            null.error_count = 1
+            store.remove('fail')
+            self.assertNotIn('fail', store)
+            self.assertEqual(len(store), 1)
+            # the removed monitor keeps its counters, in a state of its own
+            self.assertNotIsInstance(fail.run_state, statestore.StoredMonitorState)
+            self.assertEqual(fail.error_count, 1)
+            # the last monitor moves into the gap
+            self.assertEqual(store.index, {'null': 0})
+            self.assertEqual(null.error_count, 1)
+            self.assertEqual(store.get('tolerance', 0), 2)
+            null.error_count = 3
+            self.assertEqual(store.failing(), ['null'])
+            store.add('fail', fail)
+            self.assertEqual(store.counts(), {'ok': 0, 'failing': 2, 'urgent': 2})
+
+    @unittest.skipIf(statestore.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        store = statestore.StateStore(use_numpy=True)
+        for i in range(40):
+            m = Monitors.monitor.MonitorFail('fail%d' % i, {'tolerance': str(i % 2)})
+            store.add(m.name, m)
+            m.run_test()
+        self.assertEqual(len(store), 40)
+        self.assertEqual(store.failing(), ['fail%d' % i for i in range(0, 40, 2)])
+        self.assertEqual(store.counts()['failing'], 20)
+
+    def test_simplemonitor(self):
+        for state_store in [False, True]:
+            m = SimpleMonitor(state_store=state_store)
+            m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+            m.add_monitor('null', Monitors.monitor.MonitorNull('null', {}))
+            m.run_tests()
+            self.assertEqual(m.failing_monitors(), ['fail'])
+            self.assertEqual(m.count_failing(), {'ok': 1, 'failing': 1, 'urgent': 1})
+            self.assertEqual(sorted(m.alert_pending), ['fail'])
+            self.assertEqual((m.failed, m.still_failing), (['fail'], []))
+            m.run_tests()
+            self.assertEqual((m.failed, m.still_failing), ([], ['fail']))
+
+    def test_logged_counts(self):
+        (handle, filename) = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            m = SimpleMonitor(state_store=True)
+            m.add_monitor('fail', Monitors.monitor.MonitorFail('fail', {}))
+            m.add_monitor('null', Monitors.monitor.MonitorNull('null', {}))
+            m.add_logger('json', Loggers.file.JsonLogger({'filename': filename}))
+            m.run_tests()
+            m.do_logs()
+            with open(filename) as f:
+                payload = json.load(f)
+            self.assertEqual(payload['counts'], {'ok': 1, 'failing': 1, 'urgent': 1})
+            self.assertEqual(sorted(payload['monitors']), ['fail', 'null'])
+        finally:
+            os.unlink(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
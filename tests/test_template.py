@@ -0,0 +1,64 @@
+import unittest
+import datetime
+
+import Alerters.template
+import Alerters.execute
+import Monitors.monitor
+import util
+
+
+class TestTemplate(unittest.TestCase):
+
+    def _failed_monitor(self):
+        m = Monitors.monitor.MonitorFail('test', {})
+        m.run_test()
+        m.failed_at = datetime.datetime(2018, 1, 1, 12, 0, 0)
+        return m
+
+    def test_render(self):
+        m = self._failed_monitor()
+        context = Alerters.template.AlertContext('test', m)
+        t = Alerters.template.Template('{name} failed at {failed_at} ({virtual_fail_count:03d}) {info!r}')
+        self.assertEqual(
+            t.render(context),
+            "test failed at 2018-01-01 12:00:00 (001) 'This monitor always fails.'"
+        )
+
+    def test_default_body(self):
+        m = self._failed_monitor()
+        context = Alerters.template.AlertContext('test', m)
+        t = Alerters.template.Template(Alerters.template.DEFAULT_CATCHUP_BODY)
+        self.assertEqual(
+            t.render(context),
+            "Monitor test on host %s failed earlier while this alerter was out of hours.\n"
+            "Failed at: 2018-01-01 12:00:00\nVirtual failure count: 1\n"
+            "Additional info: This monitor always fails.\n"
+            "Description: A monitor which always fails." % context.local_hostname
+        )
+
+    def test_bad_templates(self):
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.template.Template('{nope}')
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.template.Template('{}')
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.template.Template('{name')
+        with self.assertRaises(util.AlerterConfigurationError):
+            Alerters.execute.ExecuteAlerter({'fail_command': 'echo {moo}'})
+
+    def test_context_sharing(self):
+        m = self._failed_monitor()
+        first = Alerters.template.get_context('test', m)
+        self.assertIsNot(first, Alerters.template.get_context('test', m))
+        Alerters.template.start_round()
+        try:
+            first = Alerters.template.get_context('test', m)
+            self.assertIs(first, Alerters.template.get_context('test', m))
+            other = Monitors.monitor.MonitorFail('test', {})
+            self.assertIsNot(first, Alerters.template.get_context('test', other))
+        finally:
+            Alerters.template.end_round()
+
+
+if __name__ == '__main__':
+    unittest.main()
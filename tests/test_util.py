@@ -1,5 +1,6 @@
 import unittest
 import datetime
+import os
 import util
 
 
@@ -134,3 +135,102 @@ class TestUtil(unittest.TestCase):
             util.format_datetime(datetime.datetime(2018, 5, 8, 13, 37, 0)),
             "2018-05-08 13:37:00"
         )
+
+    def test_timestamps(self):
+        dt = datetime.datetime(2018, 5, 8, 13, 37, 0, 250000)
+        timestamp = util.datetime_to_timestamp(dt)
+        self.assertEqual(timestamp, 1525786620.25)
+        self.assertEqual(util.timestamp_to_datetime(timestamp), dt)
+        self.assertIsNone(util.timestamp_to_datetime(None))
+        self.assertIsNone(util.datetime_to_timestamp(None))
+
+    def test_loop_time(self):
+        util.start_loop()
+        try:
+            first = util.loop_time()
+            self.assertEqual(util.loop_time(), first)
+        finally:
+            util.end_loop()
+        self.assertIsNone(util._loop_time)
+        self.assertGreaterEqual(util.loop_time(), first)
+        self.assertIsInstance(util.monotonic_ns(), int)
+
+    def test_subclass_dict_handler(self):
+        class Base(object):
+            type = 'unknown'
+
+        (register, get_class, all_types) = util.subclass_dict_handler(
+            'test', Base, {'lazy': 'tests.no_such_module', 'json': 'json'})
+
+        @register
+        class Eager(Base):
+            type = 'eager'
+
+        self.assertEqual(sorted(all_types()), ['eager', 'json', 'lazy'])
+        self.assertIs(get_class('eager'), Eager)
+        with self.assertRaises(ImportError):
+            get_class('lazy')
+        # the module doesn't register the type
+        with self.assertRaises(KeyError):
+            get_class('json')
+        with self.assertRaises(KeyError):
+            get_class('missing')
+        with self.assertRaises(TypeError):
+            register(object)
+
+    def test_plugin_modules(self):
+        import importlib
+        import Alerters.alerter
+        import Loggers.logger
+        import Monitors.monitor
+        import plugins
+        # listing all the types looks for plugins; don't save what's found
+        os.environ['SIMPLEMONITOR_PLUGIN_CACHE'] = ''
+        plugins.clear_cache()
+        try:
+            for registry in [Monitors.monitor, Loggers.logger, Alerters.alerter]:
+                for (type_, module) in registry.MODULES.items():
+                    cls = registry.get_class(type_)
+                    self.assertEqual(cls.type, type_)
+                    self.assertEqual(cls.__module__, module)
+                # every type must be listed, unless it's in the registry's own module
+                package = registry.__name__.split('.')[0]
+                for filename in os.listdir(package):
+                    if filename.endswith('.py') and filename != '__init__.py':
+                        importlib.import_module(package + '.' + filename[:-3])
+                for type_ in registry.all_types():
+                    cls = registry.get_class(type_)
+                    if cls.__module__ != registry.__name__:
+                        self.assertEqual(registry.MODULES.get(type_), cls.__module__)
+        finally:
+            del os.environ['SIMPLEMONITOR_PLUGIN_CACHE']
+            plugins.clear_cache()
+
+    def test_config_option(self):
+        option = util.ConfigOption('port', required_type='int', minimum=1, maximum=65535, default=80, exception=util.MonitorConfigurationError)
+        self.assertEqual(option.get({}), 80)
+        self.assertEqual(option.get({'port': '443'}), 443)
+        # as read from the config cache on Python 2
+        self.assertEqual(option.get({'port': u'443'}), 443)
+        for bad in ['0', '65536', 'http']:
+            with self.assertRaises(util.MonitorConfigurationError):
+                option.get({'port': bad})
+        option = util.ConfigOption('states', required_type='[str]', allowed_values=['up', 'down'], required=True)
+        self.assertEqual(option.get({'states': 'up, down'}), ['up', 'down'])
+        with self.assertRaises(ValueError):
+            option.get({'states': 'up,sideways'})
+        with self.assertRaises(ValueError):
+            option.get({})
+
+    def test_config_option_kept(self):
+        self.assertEqual(util.get_config_option({}, 'kept', required_type='int', default=1), 1)
+        self.assertEqual(util.get_config_option({'kept': '2'}, 'kept', required_type='int', default=1), 2)
+        self.assertEqual(len(util._config_options['kept']), 1)
+        # the same key with other settings gets an option of its own
+        self.assertEqual(util.get_config_option({}, 'kept', default='one'), 'one')
+        with self.assertRaises(util.MonitorConfigurationError):
+            util.get_config_option({'kept': 'x'}, 'kept', required_type='int', exception=util.MonitorConfigurationError)
+        # a default list isn't shared between callers
+        first = util.get_config_option({}, 'kept', required_type='[str]', default=[])
+        first.append('changed')
+        self.assertEqual(util.get_config_option({}, 'kept', required_type='[str]', default=[]), [])
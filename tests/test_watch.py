@@ -0,0 +1,127 @@
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import Monitors.file
+import Monitors.host
+import Monitors.watch as watch
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'status.txt')
+
+    def tearDown(self):
+        watch.configure('poll')
+        shutil.rmtree(self.directory)
+
+    def _write(self, contents, filename=None):
+        with open(filename or self.filename, 'w') as file_handle:
+            file_handle.write(contents)
+
+    def _check_backend(self):
+        with self.assertRaises(OSError):
+            watch.stat(self.filename)
+        self._write('ok\n')
+        self.assertEqual(watch.stat(self.filename).st_size, 3)
+        self.assertEqual(watch.read(self.filename), b'ok\n')
+        self._write('running\n')
+        self.assertEqual(watch.stat(self.filename).st_size, 8)
+        self.assertEqual(watch.read(self.filename), b'running\n')
+        # replacing the file, like most programs writing status files do
+        self._write('ok\n', self.filename + '.new')
+        os.rename(self.filename + '.new', self.filename)
+        self.assertEqual(watch.read(self.filename), b'ok\n')
+        os.unlink(self.filename)
+        # IOError on Python 2
+        with self.assertRaises((IOError, OSError)) as cm:
+            watch.read(self.filename)
+        self.assertEqual(cm.exception.errno, errno.ENOENT)
+
+    def test_poll(self):
+        watch.configure('poll')
+        self.assertEqual(watch.get_backend(), 'poll')
+        self._check_backend()
+
+    def test_inotify(self):
+        watch.configure('inotify')
+        if watch.get_backend() != 'inotify':
+            self.skipTest('inotify is not available')
+        self._check_backend()
+        # an unchanged file is served from the cache
+        self._write('ok\n')
+        watch.stat(self.filename)
+        self.assertIn(self.filename, watch._watcher.stats)
+        # the directory going away is noticed too
+        shutil.rmtree(self.directory)
+        with self.assertRaises(OSError):
+            watch.stat(self.filename)
+        os.mkdir(self.directory)
+
+    def test_inotify_replaced(self):
+        watch.configure('inotify')
+        if watch.get_backend() != 'inotify':
+            self.skipTest('inotify is not available')
+        watcher = watch._watcher
+        # the directory being moved away, and a new one put in its place
+        self._write('one\n')
+        self.assertEqual(watch.read(self.filename), b'one\n')
+        os.rename(self.directory, self.directory + '.old')
+        try:
+            os.mkdir(self.directory)
+            self._write('two\n')
+            self.assertEqual(watch.read(self.filename), b'two\n')
+            self.assertEqual(list(watcher.dirs.values()), [[self.directory]])
+        finally:
+            shutil.rmtree(self.directory + '.old')
+        # a parent which is a symlink being pointed somewhere else
+        releases = [os.path.join(self.directory, name) for name in ('release1', 'release2')]
+        current = os.path.join(self.directory, 'current')
+        filename = os.path.join(current, 'status.txt')
+        for (release, contents) in zip(releases, ['one\n', 'two\n']):
+            os.mkdir(release)
+            self._write(contents, os.path.join(release, 'status.txt'))
+        os.symlink(releases[0], current)
+        self.assertEqual(watch.read(filename), b'one\n')
+        os.symlink(releases[1], current + '.new')
+        os.rename(current + '.new', current)
+        self.assertEqual(watch.read(filename), b'two\n')
+        # a file which is a symlink, whose target changes
+        os.symlink(os.path.join(releases[0], 'status.txt'), self.filename + '.link')
+        self.assertEqual(watch.read(self.filename + '.link'), b'one\n')
+        self._write('three\n', os.path.join(releases[0], 'status.txt'))
+        self.assertEqual(watch.read(self.filename + '.link'), b'three\n')
+        self.assertEqual(watch.stat(self.filename + '.link').st_size, 6)
+
+    def test_bad_backend(self):
+        with self.assertRaises(ValueError):
+            watch.configure('fam')
+
+    def test_monitors(self):
+        for backend in watch.BACKENDS:
+            watch.configure(backend)
+            backup = Monitors.file.MonitorBackup('backup', {})
+            backup.filename = self.filename
+            filestat = Monitors.host.MonitorFileStat('filestat', {'filename': self.filename, 'minsize': '4'})
+            backup.run_test()
+            self.assertEqual(backup.last_result, 'Status file missing')
+            filestat.run_test()
+            self.assertFalse(filestat.test_success())
+            self._write('ok\n%d\n' % time.time())
+            backup.run_test()
+            self.assertTrue(backup.test_success())
+            filestat.run_test()
+            self.assertTrue(filestat.test_success())
+            self._write('broken\n%d\n' % time.time())
+            backup.run_test()
+            self.assertEqual(backup.last_result, 'Unknown status broken')
+            os.unlink(self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,15 @@
 
 import re
 import sys
+import importlib
 import json
+import time
+import calendar
 import datetime
 import socket
 
+import plugins
+
 
 class MonitorConfigurationError(ValueError):
     """A config error for a Monitor"""
@@ -27,54 +32,115 @@ class SimpleMonitorConfigurationError(ValueError):
     pass
 
 
+if sys.version_info >= (3,):
+    TEXT_TYPES = (str, )
+else:
+    # options read from the disk cache (JSON) are unicode
+    TEXT_TYPES = (str, unicode)  # noqa: F821
+
+
+class ConfigOption(object):
+    """A config option: its key, type, default and constraints.
+
+    The checks and conversions needed are worked out once, when the option is
+    created, so classes which read the same options for every instance can
+    keep their ConfigOptions and just call get() on each instance's config."""
+
+    __slots__ = ('key', 'default', 'required', 'allowed_values', 'exception', '_convert')
+
+    def __init__(self, key, required_type='str', default=None, required=False, minimum=None,
+                 maximum=None, allowed_values=None, allow_empty=True, exception=ValueError):
+        self.key = key
+        self.default = default
+        self.required = required
+        self.allowed_values = allowed_values
+        self.exception = exception
+        self._convert = self._make_converter(required_type, minimum, maximum, allow_empty)
+
+    def _make_converter(self, required_type, minimum, maximum, allow_empty):
+        """Make the function which turns a string from the config into our type."""
+        key = self.key
+        exception = self.exception
+        if required_type == 'str':
+            if allow_empty:
+                return None
+
+            def convert(value):
+                if value == '':
+                    raise exception('config option {0} cannot be empty'.format(key))
+                return value
+        elif required_type in ['int', 'float']:
+            number_type = int if required_type == 'int' else float
+
+            def convert(value):
+                try:
+                    value = number_type(value)
+                except ValueError:
+                    raise exception('config option {0} needs to be an {1}'.format(key, required_type))
+                if minimum is not None and value < minimum:
+                    raise exception('config option {0} needs to be >= {1}'.format(key, minimum))
+                if maximum is not None and value > maximum:
+                    raise exception('config option {0} needs to be <= {1}'.format(key, maximum))
+                return value
+        elif required_type == '[int]':
+            def convert(value):
+                try:
+                    return [int(x) for x in value.split(",")]
+                except ValueError:
+                    raise exception('config option {0} needs to be a list of int[int,...]'.format(key))
+        elif required_type == 'bool':
+            def convert(value):
+                return value.lower() in ['1', 'true', 'yes']
+        elif required_type == '[str]':
+            def convert(value):
+                return [x.strip() for x in value.split(",")]
+        else:
+            return None
+        return convert
+
+    def get(self, config_options):
+        """Get this option's value out of a dict of config options."""
+        if not isinstance(config_options, dict):
+            raise self.exception('config_options should be a dict')
+        value = config_options.get(self.key, self.default)
+        if value is self.default and isinstance(value, list):
+            # don't hand out the same list to every caller
+            value = list(value)
+        if value is None:
+            if self.required:
+                raise self.exception('config option {0} is missing and is required'.format(self.key))
+        elif self._convert is not None and isinstance(value, TEXT_TYPES):
+            value = self._convert(value)
+        allowed_values = self.allowed_values
+        if allowed_values is not None or isinstance(value, list):
+            if isinstance(value, list) and allowed_values:
+                if not all([x in allowed_values for x in value]):
+                    raise self.exception('config option {0} needs to be one of {1}'.format(self.key, allowed_values))
+            elif allowed_values is not None and value not in allowed_values:
+                raise self.exception('config option {0} needs to be one of {1}'.format(self.key, allowed_values))
+        return value
+
+
+# key -> [(settings, ConfigOption)], for get_config_option()
+_config_options = {}
+# how many different sets of settings to keep ConfigOptions for, per key
+_CONFIG_OPTIONS_PER_KEY = 8
+
+
 def get_config_option(config_options, key, **kwargs):
-    """Get a value out of a dict, with possible default, required type and requiredness."""
-    exception = kwargs.get('exception', ValueError)
-
-    if not isinstance(config_options, dict):
-        raise exception('config_options should be a dict')
-
-    default = kwargs.get('default', None)
-    required = kwargs.get('required', False)
-    value = config_options.get(key, default)
-    if required and value is None:
-        raise exception('config option {0} is missing and is required'.format(key))
-    required_type = kwargs.get('required_type', 'str')
-    allowed_values = kwargs.get('allowed_values', None)
-    allow_empty = kwargs.get('allow_empty', True)
-    if isinstance(value, str) and required_type:
-        if required_type == 'str' and value == '' and not allow_empty:
-            raise exception('config option {0} cannot be empty'.format(key))
-        if required_type in ['int', 'float']:
-            try:
-                if required_type == 'int':
-                    value = int(value)
-                else:
-                    value = float(value)
-            except ValueError:
-                raise exception('config option {0} needs to be an {1}'.format(key, required_type))
-            minimum = kwargs.get('minimum')
-            if minimum is not None and value < minimum:
-                raise exception('config option {0} needs to be >= {1}'.format(key, minimum))
-            maximum = kwargs.get('maximum')
-            if maximum is not None and value > maximum:
-                raise exception('config option {0} needs to be <= {1}'.format(key, maximum))
-        if required_type == '[int]':
-            try:
-                value = [int(x) for x in value.split(",")]
-            except ValueError:
-                raise exception('config option {0} needs to be a list of int[int,...]'.format(key))
-        if required_type == 'bool':
-            value = bool(value.lower() in ['1', 'true', 'yes'])
-        if required_type == '[str]':
-            value = [x.strip() for x in value.split(",")]
-    if isinstance(value, list) and allowed_values:
-        if not all([x in allowed_values for x in value]):
-            raise exception('config option {0} needs to be one of {1}'.format(key, allowed_values))
-    else:
-        if allowed_values is not None and value not in allowed_values:
-            raise exception('config option {0} needs to be one of {1}'.format(key, allowed_values))
-    return value
+    """Get a value out of a dict, with possible default, required type and requiredness.
+
+    The ConfigOption for each set of arguments is made once and kept."""
+    options = _config_options.get(key)
+    if options is None:
+        options = _config_options[key] = []
+    for (settings, option) in options:
+        if settings == kwargs:
+            return option.get(config_options)
+    option = ConfigOption(key, **kwargs)
+    if len(options) < _CONFIG_OPTIONS_PER_KEY:
+        options.append((kwargs, option))
+    return option.get(config_options)
 
 
 def format_datetime(the_datetime):
@@ -88,6 +154,63 @@ def format_datetime(the_datetime):
     return the_datetime
 
 
+try:
+    monotonic_ns = time.monotonic_ns
+except AttributeError:  # pragma: no cover
+    # Python < 3.7; Python 2 has no monotonic clock at all, so use the wall clock
+    _clock = getattr(time, 'monotonic', time.time)
+
+    def monotonic_ns():
+        return int(_clock() * 1000000000)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# wall-clock time at the start of the current loop; see start_loop()
+_loop_time = None
+
+
+def start_loop():
+    """Take the wall-clock time once for a loop of the monitors.
+
+    Until end_loop() is called, loop_time() returns this time, so that every
+    monitor records the same timestamp rather than looking at the clock
+    itself."""
+    global _loop_time
+    _loop_time = time.time()
+
+
+def end_loop():
+    global _loop_time
+    _loop_time = None
+
+
+def in_loop():
+    """Check if we are inside a loop of the monitors (see start_loop())."""
+    return _loop_time is not None
+
+
+def loop_time():
+    """Get the time at the start of the current loop, or now if there isn't one."""
+    if _loop_time is None:
+        return time.time()
+    return _loop_time
+
+
+def timestamp_to_datetime(timestamp):
+    """Convert a UNIX timestamp to a naive UTC datetime (as from utcnow())."""
+    if timestamp is None:
+        return None
+    return _EPOCH + datetime.timedelta(seconds=timestamp)
+
+
+def datetime_to_timestamp(the_datetime):
+    """Convert a naive UTC datetime to a UNIX timestamp."""
+    if the_datetime is None:
+        return None
+    return calendar.timegm(the_datetime.utctimetuple()) + the_datetime.microsecond / 1000000.0
+
+
 def short_hostname():
     """Get just our machine name.
 
@@ -154,13 +277,35 @@ else:
         return JSONDecoder().decode(string)
 
 
-def subclass_dict_handler(mod, base_cls):
+def subclass_dict_handler(mod, base_cls, modules=None, entry_point_group=None):
+    """Make a registry of the subclasses of base_cls, keyed by their type.
+
+    modules maps types to the modules which define them; those modules are
+    only imported when their types are first asked for, so the dependencies
+    of types which aren't used are never loaded.
+
+    Types which aren't ours are looked for in the entry points of
+    entry_point_group, if given (see plugins.py)."""
     def _check_is_subclass(cls):
         if not issubclass(cls, base_cls):
             raise TypeError(('%s.register may only be used on subclasses '
                              'of %s.%s') % (mod, mod, base_cls.__name__))
 
     _subclasses = {}
+    _modules = dict(modules or {})
+
+    def _plugins():
+        if entry_point_group is None:
+            return {}
+        return plugins.find_plugins(entry_point_group)
+
+    def _load_plugin(type_, target):
+        (module_name, _, attribute) = target.partition(':')
+        cls = importlib.import_module(module_name)
+        for name in attribute.split('.'):
+            cls = getattr(cls, name)
+        _check_is_subclass(cls)
+        _subclasses[type_] = cls
 
     def register(cls):
         """Decorator for monitor classes."""
@@ -170,9 +315,14 @@ def subclass_dict_handler(mod, base_cls):
         return cls
 
     def get_class(type_):
+        if type_ not in _subclasses:
+            if type_ in _modules:
+                importlib.import_module(_modules[type_])
+            elif type_ in _plugins():
+                _load_plugin(type_, _plugins()[type_])
         return _subclasses[type_]
 
     def all_types():
-        return list(_subclasses)
+        return list(set(_subclasses) | set(_modules) | set(_plugins()))
 
     return (register, get_class, all_types)